@@ -1,19 +1,26 @@
 """NEM Extractor Script"""
 
 import argparse
+import collections
 import glob
 import functools
+import itertools
+import mmap
 import msgpack
+import numpy as np
 import os
 import pandas as pd
 import re
 import struct
 import sys
-from binascii import hexlify, unhexlify
+import time
+from binascii import hexlify
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm
 
-from state import XYMStateMap
-from util import encode_address, public_key_to_address
+from state import CompactXYMStateMap, XYMStateMap
+from util import encode_address, encode_address_rows, public_key_to_address, public_key_to_raw_address
 
 # describe the fixed structure of block entity bytes for unpacking
 
@@ -41,6 +48,9 @@ HEADER_LEN = 372
 
 DB_OFFSET_BYTES = 800
 
+# storage files are grouped into numbered directories of this many files
+FILES_PER_DIRECTORY = 10000
+
 FOOTER_FORMAT = {
     'reserved': 'I'}
 
@@ -150,24 +160,294 @@ TX_NAME_MAP = {
     b'4251': 'Mosaic Address Restriction',
     b'4154': 'Transfer'}
 
+# describe tx payloads by type; variable length payloads only list their fixed size prefix
+
+KEY_LINK_FORMAT = {
+    'linked_public_key' : '32s',
+    'link_action' : 'B'}
+
+AGGREGATE_FORMAT = {
+    'transactions_hash' : '32s',
+    'payload_size' : 'I',
+    'aggregate_complete_transaction_reserved_1' : 'I'}
+
+ACCOUNT_RESTRICTION_FORMAT = {
+    'restriction_type' : 'H',
+    'restriction_additions_count' : 'B',
+    'restriction_deletions_count' : 'B',
+    'account_restriction_transaction_body_reserved_1' : 'I'}
+
+TX_PAYLOAD_FORMATS = {
+    b'414c': KEY_LINK_FORMAT, #AccountKeyLinkTransaction
+    b'424c': KEY_LINK_FORMAT, #NodeKeyLinkTransaction
+    b'4141': AGGREGATE_FORMAT, #AggregateCompleteTransaction
+    b'4241': AGGREGATE_FORMAT, #AggregateBondedTransaction
+    b'4143': { #VotingKeyLinkTransaction
+        'linked_public_key' : '32s',
+        'start_point' : 'I',
+        'end_point' : 'I',
+        'link_action' : 'B'},
+    b'4243': KEY_LINK_FORMAT, #VrfKeyLinkTransaction
+    b'414d': { #MosaicDefinitionTransaction
+        'id' : 'Q',
+        'duration' : 'Q',
+        'nonce' : 'I',
+        'flags' : 'B',
+        'divisibility' : 'B'},
+    b'424d': { #MosaicSupplyChangeTransaction
+        'mosaic_id' : 'Q',
+        'delta' : 'Q',
+        'action' : 'B'},
+    b'414e': { #NamespaceRegistrationTransaction
+        'identifier' : 'Q',
+        'id' : 'Q',
+        'registration_type' : 'B',
+        'name_size' : 'B'},
+    b'424e': { #AddressAliasTransaction
+        'namespace_id' : 'Q',
+        'address' : '24s',
+        'alias_action' : 'B'},
+    b'434e': { #MosaicAliasTransaction
+        'namespace_id' : 'Q',
+        'mosaid_id' : 'Q',
+        'alias_action' : 'B'},
+    b'4144': { #AccountMetadataTransaction
+        'target_address' : '24s',
+        'scoped_metadata_key' : 'Q',
+        'value_size_delta': 'H',
+        'value_size': 'H'},
+    b'4244': { #MosaicMetadataTransaction
+        'target_address' : '24s',
+        'scoped_metadata_key' : 'Q',
+        'target_mosaic_id' : 'Q',
+        'value_size_delta': 'H',
+        'value_size': 'H'},
+    b'4344': { #NamespaceMetadataTransaction
+        'target_address' : '24s',
+        'scoped_metadata_key' : 'Q',
+        'target_namespace_id' : 'Q',
+        'value_size_delta': 'H',
+        'value_size': 'H'},
+    b'4155': { #MultisigAccountModificationTransaction
+        'min_removal_delta' : 'B',
+        'min_approval_delta' : 'b',
+        'address_additions_count' : 'B',
+        'address_deletions_count' : 'B',
+        'multisig_account_modificaion_transacion_body_reserved_1' : 'I'},
+    b'4148': { #HashLockTransaction
+        'reserved_1' : '8s', # NOT in the schema but shows up in the data ?!?
+        'mosaic' : 'Q',
+        'duration' : 'Q',
+        'hash' : '32s'},
+    b'4152': { #SecretLockTransaction
+        'recipient_address' : '24s',
+        'secret' : '32s',
+        'mosaic_id' : 'Q',
+        'amount' : 'Q',
+        'duration' : 'Q',
+        'hash_algorithm' : 'B'},
+    b'4252': { #SecretProofTransaction
+        'recipient_address' : '24s',
+        'secret' : '32s',
+        'proof_size' : 'H',
+        'hash_algorithm' : 'B'},
+    b'4150': ACCOUNT_RESTRICTION_FORMAT, #AccountAddressRestrictionTransaction
+    b'4250': ACCOUNT_RESTRICTION_FORMAT, #AccountMosaicRestrictionTransaction
+    b'4350': ACCOUNT_RESTRICTION_FORMAT, #AccountOperationRestrictionTransaction
+    b'4151': { #MosaicGlobalRestrictionTransaction
+        'mosaic_id' : 'Q',
+        'reference_mosaic_id' : 'Q',
+        'restriction_key' : 'Q',
+        'previous_restriction_value' : 'Q',
+        'new_restriction_value' : 'Q',
+        'previous_restriction_type' : 'B',
+        'new_restriction_type' : 'B'},
+    b'4251': { #MosaicAddressRestrictionTransaction
+        'mosaic_id' : 'Q',
+        'restriction_key' : 'Q',
+        'previous_restriction_value' : 'Q',
+        'new_restriction_value' : 'Q',
+        'target_address' : '24s'},
+    b'4154': { #TransferTransaction
+        'recipient_address' : '24s',
+        'message_size' : 'H',
+        'mosaics_count' : 'B',
+        'transfer_transaction_body_reserved_1' : 'I',
+        'transfer_transaction_body_reserved_2' : 'B'},
+    }
+
+# describe receipt payloads by type
+
+BALANCE_TRANSFER_RECEIPT_FORMAT = {
+    'mosaic_id' : 'Q',
+    'amount' : 'Q',
+    'sender_address' : '24s',
+    'recipient_address' : '24s'}
+
+BALANCE_CHANGE_RECEIPT_FORMAT = {
+    'mosaic_id' : 'Q',
+    'amount' : 'Q',
+    'target_address' : '24s'}
+
+ARTIFACT_EXPIRY_RECEIPT_FORMAT = {
+    'mosaic_id' : 'Q'}
+
+RECEIPT_PAYLOAD_FORMATS = {
+    0x124D: BALANCE_TRANSFER_RECEIPT_FORMAT, # mosaic rental fee receipt
+    0x134E: BALANCE_TRANSFER_RECEIPT_FORMAT, # namespace rental fee receipt
+    0x2143: BALANCE_CHANGE_RECEIPT_FORMAT, # harvest fee receipt
+    0x2248: BALANCE_CHANGE_RECEIPT_FORMAT, # lock hash completed receipt
+    0x2348: BALANCE_CHANGE_RECEIPT_FORMAT, # lock hash expired receipt
+    0x2252: BALANCE_CHANGE_RECEIPT_FORMAT, # lock secret completed receipt
+    0x2352: BALANCE_CHANGE_RECEIPT_FORMAT, # lock secret expired receipt
+    0x3148: BALANCE_CHANGE_RECEIPT_FORMAT, # lock hash created receipt
+    0x3152: BALANCE_CHANGE_RECEIPT_FORMAT, # lock secret created receipt
+    0x414D: ARTIFACT_EXPIRY_RECEIPT_FORMAT, # mosaic expired receipt
+    0x414E: ARTIFACT_EXPIRY_RECEIPT_FORMAT, # namespace expired receipt
+    0x424E: ARTIFACT_EXPIRY_RECEIPT_FORMAT, # namespace deleted receipt
+    0x5143: { # inflation receipt
+        'mosaic_id' : 'Q',
+        'amount' : 'Q'},
+    }
+
+
+class CompiledFormat():
+    """Format specification compiled once into a struct and a record constructor
+
+    Parameters
+    ----------
+    struct_format: dict
+        Ordered mapping of field names to little-endian struct format codes
+
+    Attributes
+    ----------
+    keys: tuple[str]
+        Field names in serialization order
+    struct: struct.Struct
+        Precompiled struct for the whole format
+    size: int
+        Serialized size of the format in bytes
+
+    """
+
+    def __init__(self,struct_format):
+        self.keys = tuple(struct_format.keys())
+        self.struct = struct.Struct('<'+''.join(struct_format.values()))
+        self.size = self.struct.size
+
+        # generate a dict display for the fields, which builds records much
+        # faster than dict(zip(...)); the same trick namedtuple uses
+        namespace = {}
+        fields = ', '.join(f'{k!r}: values[{n}]' for n,k in enumerate(self.keys))
+        exec(f'def build(values):\n    return {{{fields}}}', namespace)
+        self.build = namespace['build']
+
+
+    def unpack(self,buffer):
+        """Unpack a buffer of exactly :attr:`size` bytes into a dict"""
+        return self.build(self.struct.unpack(buffer))
+
+
+    def unpack_from(self,buffer,offset=0):
+        """Unpack a dict from a larger buffer starting at offset, without slicing it"""
+        return self.build(self.struct.unpack_from(buffer,offset))
+
+
+@functools.lru_cache(maxsize=None)
+def _compile_format_items(format_items):
+    return CompiledFormat(dict(format_items))
+
+
+def fmt_unpack(buffer,struct_format,offset=None):
+    """Unpack buffer of bytes into dict based on format specification
+
+    Without an offset the buffer must be exactly the size of the format. With
+    an offset the fields are read in place from a larger buffer (bytes or
+    memoryview) so that no intermediate slice is created. Decoders in this
+    module use the precompiled ``*_SCHEMA`` objects directly; this helper
+    compiles ad-hoc formats on first use.
+    """
+    compiled = _compile_format_items(tuple(struct_format.items()))
+    if offset is None:
+        return compiled.unpack(buffer)
+    return compiled.unpack_from(buffer,offset)
+
+
+HEADER_SCHEMA = CompiledFormat(HEADER_FORMAT)
+FOOTER_SCHEMA = CompiledFormat(FOOTER_FORMAT)
+IMPORTANCE_FOOTER_SCHEMA = CompiledFormat(IMPORTANCE_FOOTER_FORMAT)
+TX_H_SCHEMA = CompiledFormat(TX_H_FORMAT)
+EMBED_TX_H_SCHEMA = CompiledFormat(EMBED_TX_H_FORMAT)
+SUBCACHE_MERKLE_ROOT_SCHEMA = CompiledFormat(SUBCACHE_MERKLE_ROOT_FORMAT)
+TX_HASH_SCHEMA = CompiledFormat(TX_HASH_FORMAT)
+RECEIPT_SOURCE_SCHEMA = CompiledFormat(RECEIPT_SOURCE_FORMAT)
+RECEIPT_SCHEMA = CompiledFormat(RECEIPT_FORMAT)
+ADDRESS_RESOLUTION_SCHEMA = CompiledFormat(ADDRESS_RESOLUTION_FORMAT)
+MOSAIC_RESOLUTION_SCHEMA = CompiledFormat(MOSAIC_RESOLUTION_FORMAT)
+TX_PAYLOAD_SCHEMAS = {k:CompiledFormat(v) for k,v in TX_PAYLOAD_FORMATS.items()}
+RECEIPT_PAYLOAD_SCHEMAS = {k:CompiledFormat(v) for k,v in RECEIPT_PAYLOAD_FORMATS.items()}
+
+HEADER_HEX_FIELDS = [k for k,v in HEADER_FORMAT.items() if v[-1] == 's' and k not in ('type','beneficiary_address')]
+
+# prefixes read when walking entities without decoding them: size, type and
+# max_fee of a tx header, size and type of an embedded tx header
+TX_PREFIX_STRUCT = struct.Struct('<I106x2sQ')
+EMBED_TX_PREFIX_STRUCT = struct.Struct('<I42x2s')
+
+FOOTER_LENS = {
+    b'8043': IMPORTANCE_FOOTER_LEN, #nemesis
+    b'8143': FOOTER_LEN, #normal
+    b'8243': IMPORTANCE_FOOTER_LEN} #importance
+
+FOOTER_SCHEMAS = {
+    b'8043': IMPORTANCE_FOOTER_SCHEMA, #nemesis
+    b'8143': FOOTER_SCHEMA, #normal
+    b'8243': IMPORTANCE_FOOTER_SCHEMA} #importance
+
+BLOCK_KEYS = ('header','footer','block_hash','tx_hashes','subcache_merkle_roots')
+
+AGGREGATE_TX_TYPES = (b'4141', b'4241')
+
+NUMPY_FORMAT_CODES = {'B': 'u1', 'b': 'i1', 'H': '<u2', 'I': '<u4', 'Q': '<u8'}
+
 
-def fmt_unpack(buffer,struct_format):
-    """Unpack buffer of bytes into dict based on format specification"""
-    return dict(
-        zip(
-            struct_format.keys(),
-            struct.unpack('<'+''.join(struct_format.values()),buffer)
-        )
-    )
+def format_dtype(struct_format):
+    """Build a packed NumPy structured dtype mirroring a format specification
 
+    Byte string fields become uint8 subarrays so that trailing zero bytes survive.
+    """
+    fields = []
+    for k,v in struct_format.items():
+        if v[-1] == 's':
+            fields.append((k,'u1',(int(v[:-1]),)))
+        else:
+            fields.append((k,NUMPY_FORMAT_CODES[v]))
+    return np.dtype(fields)
+
+
+HEADER_DTYPE = format_dtype(HEADER_FORMAT)
+
+# offset of the height field in a stored block header
+HEADER_HEIGHT_OFFSET = HEADER_DTYPE.fields['height'][1]
+
+HEX_TABLE = np.array([b'%02x' % n for n in range(256)],dtype='S2')
+
+
+def hexlify_rows(rows):
+    """Hexlify every row of a 2d uint8 array at once, returning an object array of bytes"""
+    hexed = HEX_TABLE[rows].view(f'S{2 * rows.shape[1]}').ravel()
+    return np.array(hexed.tolist(),dtype=object)
 
-def deserialize_header(header_data):
+
+def deserialize_header(header_data,raw_keys=False):
     """Produce a python dict from a raw xym header blob
     
     Parameters
     ----------
-    header_data : bytes
+    header_data : bytes or memoryview
         Byte array containing serialized header
+    raw_keys: bool, default=False
+        Keep keys, hashes and addresses as raw bytes; see :func:`encode_header`
     
     Returns
     -------
@@ -176,27 +456,39 @@ def deserialize_header(header_data):
 
     """
 
-    header = fmt_unpack(header_data,HEADER_FORMAT)
-    for k,v in HEADER_FORMAT.items():
-        if k == 'type':
-            header[k] = hexlify(header[k][::-1])
-        elif k == 'beneficiary_address':
-            header[k] = encode_address(header[k])
-        elif v[-1] == 's':
-            header[k] = hexlify(header[k])
-    header['harvester'] = public_key_to_address(unhexlify(header['signer_public_key']))
+    header = HEADER_SCHEMA.unpack(header_data)
+    header['type'] = hexlify(header['type'][::-1])
+    header['harvester'] = public_key_to_raw_address(header['signer_public_key'])
+    if not raw_keys:
+        encode_header(header)
+    return header
+
+
+def encode_header(header):
+    """Convert the raw keys, hashes and addresses of a header to hex and base32 in place"""
+    for k in HEADER_HEX_FIELDS:
+        header[k] = hexlify(header[k])
+    header['beneficiary_address'] = encode_address(header['beneficiary_address'])
+    header['harvester'] = encode_address(header['harvester'])
     return header
 
 
-def deserialize_footer(footer_data,header):
+def deserialize_footer(footer_data,header,raw_keys=False,tx_types=None):
     """Produce a nested python dict from a raw xym footer blob
     
     Parameters
     ----------
-    footer_data : bytes
-        Byte array containing serialized footer
+    footer_data : bytes or memoryview
+        Byte array containing serialized footer; a memoryview is sliced
+        without copying, only leaf values are turned into bytes
     header: dict
         Deserialized header dict as produced by :func:`deserialize_header`
+    raw_keys: bool, default=False
+        Keep signatures, keys and addresses as raw bytes; see :func:`encode_tx`
+    tx_types: collection of bytes, optional
+        Hex type codes of the txs whose payloads are decoded, see
+        :func:`tx_payload_selected`; other txs keep their header fields with a
+        ``None`` payload. Totals always cover every tx.
     
     Returns
     -------
@@ -208,13 +500,13 @@ def deserialize_footer(footer_data,header):
 
     # parse static footer fields
     if header['type'] == b'8043': #nemesis
-        footer = fmt_unpack(footer_data[:IMPORTANCE_FOOTER_LEN],IMPORTANCE_FOOTER_FORMAT)
+        footer = IMPORTANCE_FOOTER_SCHEMA.unpack_from(footer_data)
         i = IMPORTANCE_FOOTER_LEN
     elif header['type'] == b'8143': #normal
-        footer = fmt_unpack(footer_data[:FOOTER_LEN],FOOTER_FORMAT)
+        footer = FOOTER_SCHEMA.unpack_from(footer_data)
         i = FOOTER_LEN
     elif header['type'] == b'8243': #importance
-        footer = fmt_unpack(footer_data[:IMPORTANCE_FOOTER_LEN],IMPORTANCE_FOOTER_FORMAT)
+        footer = IMPORTANCE_FOOTER_SCHEMA.unpack_from(footer_data)
         i = IMPORTANCE_FOOTER_LEN
     else:
         raise ValueError(f"Unknown Block Type Encountered: {header['type']}")
@@ -225,16 +517,19 @@ def deserialize_footer(footer_data,header):
     statement_count = 0
     total_fee = 0
     while i < len(footer_data):
-        tx_header = fmt_unpack(footer_data[i:i+TX_H_LEN],TX_H_FORMAT)
+        tx_header = TX_H_SCHEMA.unpack_from(footer_data,i)
         tx_header['id'] = statement_count + 1 #tx ids are 1-based
-        tx_header['signature'] = hexlify(tx_header['signature'])
-        tx_header['signer_public_key'] = hexlify(tx_header['signer_public_key'])
+        if not raw_keys:
+            tx_header['signature'] = hexlify(tx_header['signature'])
+            tx_header['signer_public_key'] = hexlify(tx_header['signer_public_key'])
         tx_header['type'] = hexlify(tx_header['type'][::-1])
-        tx_header['payload'] = deserialize_tx_payload(footer_data[i+TX_H_LEN:i+tx_header['size']],tx_header['type'])
+        tx_header['payload'] = None
+        if tx_payload_selected(tx_header['type'],tx_types):
+            tx_header['payload'] = deserialize_tx_payload(footer_data[i+TX_H_LEN:i+tx_header['size']],tx_header['type'],raw_keys,tx_types)
         tx_data.append(tx_header)
         
         total_fee += min(tx_header['max_fee'],tx_header['size'] * header['fee_multiplier'])
-        tx_count += (1+tx_header['payload']['embedded_tx_count']) if 'embedded_tx_count' in tx_header['payload'] else 1 
+        tx_count += (1+tx_header['payload']['embedded_tx_count']) if tx_header['type'] in AGGREGATE_TX_TYPES else 1 
         statement_count += 1
         i += tx_header['size'] + (8 - tx_header['size']) %8
         
@@ -246,16 +541,119 @@ def deserialize_footer(footer_data,header):
     return footer
 
 
-def deserialize_tx_payload(payload_data,payload_type):
+def tx_payload_selected(tx_type,tx_types):
+    """Whether the payload of a tx of the given type is decoded under a tx type filter
+
+    Everything is decoded without a filter (``tx_types=None``). Aggregate
+    payloads are always decoded so that the filter can be applied to their
+    embedded transactions.
+    """
+    return tx_types is None or tx_type in tx_types or tx_type in AGGREGATE_TX_TYPES
+
+
+def count_embedded_txs(payload_data, i=0):
+    """Count the embedded transactions of an aggregate payload starting at offset i by walking their size prefixes"""
+    payload_size = struct.unpack_from('<I',payload_data,i+32)[0]
+    end = i + 8 + payload_size
+    i += 40
+    e_tx_count = 0
+    while i < end:
+        e_tx_size = struct.unpack_from('<I',payload_data,i)[0]
+        e_tx_count += 1
+        i += e_tx_size + (8 - e_tx_size) %8
+    return e_tx_count
+
+
+def walk_footer_totals(footer_data,header):
+    """Compute the footer totals of a block from tx size prefixes alone
+
+    Produces the same ``total_fee``, ``statement_count`` and ``tx_count`` as
+    :func:`deserialize_footer` without decoding any tx payload: fees only need
+    the ``size`` and ``max_fee`` fields of each tx header, and aggregates are
+    counted by walking the size prefixes of their embedded transactions.
+    """
+    try:
+        i = FOOTER_LENS[header['type']]
+    except KeyError:
+        raise ValueError(f"Unknown Block Type Encountered: {header['type']}") from None
+
+    tx_count = 0
+    statement_count = 0
+    total_fee = 0
+    while i < len(footer_data):
+        tx_size, tx_type, max_fee = TX_PREFIX_STRUCT.unpack_from(footer_data,i)
+        total_fee += min(max_fee,tx_size * header['fee_multiplier'])
+        tx_count += 1
+        if hexlify(tx_type[::-1]) in AGGREGATE_TX_TYPES:
+            tx_count += count_embedded_txs(footer_data,i+TX_H_LEN)
+        statement_count += 1
+        i += tx_size + (8 - tx_size) %8
+
+    return {'statement_count':statement_count, 'tx_count':tx_count, 'total_fee':total_fee}
+
+
+# registries mapping tx and receipt type codes to payload decoders
+
+TX_PAYLOAD_DECODERS = {}
+
+RECEIPT_PAYLOAD_DECODERS = {}
+
+# payload fields holding raw 24 byte addresses, base32 encoded on output
+TX_PAYLOAD_ADDRESS_FIELDS = {}
+
+RECEIPT_PAYLOAD_ADDRESS_FIELDS = {}
+
+
+def register_tx_payload_decoder(*payload_types,address_fields=()):
+    """Decorator registering a function as the payload decoder for one or more tx types
+
+    Decoders are called as ``decoder(payload_data, payload_type)`` and return
+    the payload dict with addresses left as raw bytes; the payload fields named
+    in `address_fields` are base32 encoded by :func:`encode_tx_payload`.
+    Aggregate decoders are passed the tx type filter as a third argument.
+    Registering a type that already has a decoder replaces it, which is also
+    how decoders for new transaction types are plugged in.
+    """
+    def register(decoder):
+        for payload_type in payload_types:
+            TX_PAYLOAD_DECODERS[payload_type] = decoder
+            TX_PAYLOAD_ADDRESS_FIELDS[payload_type] = address_fields
+        return decoder
+    return register
+
+
+def register_receipt_payload_decoder(*receipt_types,address_fields=()):
+    """Decorator registering a function as the payload decoder for one or more receipt types
+
+    Decoders are called as ``decoder(receipt_data, receipt_type)`` and return
+    the payload with addresses left as raw bytes; the payload fields named in
+    `address_fields` are base32 encoded by :func:`encode_receipt_payload`.
+    Transaction group decoders are passed the receipt type filter as a third
+    argument.
+    """
+    def register(decoder):
+        for receipt_type in receipt_types:
+            RECEIPT_PAYLOAD_DECODERS[receipt_type] = decoder
+            RECEIPT_PAYLOAD_ADDRESS_FIELDS[receipt_type] = address_fields
+        return decoder
+    return register
+
+
+def deserialize_tx_payload(payload_data,payload_type,raw_keys=False,tx_types=None):
     """Produce a nested python dict from a raw xym statemet payload
  
     Parameters
     ----------
-    payload_data : bytes
+    payload_data : bytes or memoryview
         Byte array containing serialized tx payload
     payload_type: bytes
         Byte array containing the hex representation of the type field from 
         the transaction header associated with payload
+    raw_keys: bool, default=False
+        Keep keys and addresses as raw bytes; see :func:`encode_tx_payload`
+    tx_types: collection of bytes, optional
+        Filter applied to the embedded transactions of aggregates, see
+        :func:`deserialize_footer`
     
     Returns
     -------
@@ -266,346 +664,198 @@ def deserialize_tx_payload(payload_data,payload_type):
     
     """
 
-    #Account Link
-    if payload_type == b'414c': #AccountKeyLinkTransaction
-        schema = {
-            'linked_public_key' : '32s',
-            'link_action' : 'B'
-        }
-        payload = fmt_unpack(payload_data,schema)
-        
-    elif payload_type == b'424c': #NodeKeyLinkTransaction
-        schema = {
-            'linked_public_key' : '32s',
-            'link_action' : 'B'
-        }
-        payload = fmt_unpack(payload_data,schema)
-    
-    # Aggregate            
-    elif payload_type == b'4141': #AggregateCompleteTransaction
-        schema = {
-            'transactions_hash' : '32s',
-            'payload_size' : 'I',
-            'aggregate_complete_transaction_reserved_1' : 'I'
-        }
-        i = 40
-        payload = fmt_unpack(payload_data[:i],schema)
-        e_tx_count = 0
-        e_tx_data = []
-        while i < 8 + payload['payload_size']:
-            e_tx_header = fmt_unpack(payload_data[i:i+EMBED_TX_H_LEN],EMBED_TX_H_FORMAT)
-            e_tx_header['id'] = e_tx_count + 1 #tx ids are 1-based
-            e_tx_header['signer_public_key'] = hexlify(e_tx_header['signer_public_key'])
-            e_tx_header['type'] = hexlify(e_tx_header['type'][::-1])
-            e_tx_header['payload'] = deserialize_tx_payload(payload_data[i+EMBED_TX_H_LEN:i+e_tx_header['size']],e_tx_header['type'])
-            e_tx_data.append(e_tx_header)
-            e_tx_count += 1 
-            i += e_tx_header['size'] + (8 - e_tx_header['size']) %8
-
-        payload['embedded_tx_count'] = e_tx_count
-        payload['embedded_transactions'] = e_tx_data
-        payload['cosignatures'] = payload_data[i:]          
-    
-    elif payload_type == b'4241': #AggregateBondedTransaction
-        schema = {
-            'transactions_hash' : '32s',
-            'payload_size' : 'I',
-            'aggregate_complete_transaction_reserved_1' : 'I'
-        }
-        i = 40
-        payload = fmt_unpack(payload_data[:i],schema)
-        e_tx_count = 0
-        e_tx_data = []
-        while i < 8 + payload['payload_size']:
-            e_tx_header = fmt_unpack(payload_data[i:i+EMBED_TX_H_LEN],EMBED_TX_H_FORMAT)
-            e_tx_header['id'] = e_tx_count + 1 #tx ids are 1-based
-            e_tx_header['signer_public_key'] = hexlify(e_tx_header['signer_public_key'])
-            e_tx_header['type'] = hexlify(e_tx_header['type'][::-1])
-            e_tx_header['payload'] = deserialize_tx_payload(payload_data[i+EMBED_TX_H_LEN:i+e_tx_header['size']],e_tx_header['type'])
-            e_tx_data.append(e_tx_header)
-            e_tx_count += 1 
-            i += e_tx_header['size'] + (8 - e_tx_header['size']) %8
-
-        payload['embedded_tx_count'] = e_tx_count
-        payload['embedded_transactions'] = e_tx_data
-        payload['cosignatures'] = payload_data[i:]          
-    
-    #Core            
-    elif payload_type == b'4143': #VotingKeyLinkTransaction
-        schema = {
-            'linked_public_key' : '32s',
-            'start_point' : 'I',
-            'end_point' : 'I',
-            'link_action' : 'B'
-        }
-        payload = fmt_unpack(payload_data,schema)
-    
-    elif payload_type == b'4243': #VrfKeyLinkTransaction
-        schema = {
-            'linked_public_key' : '32s',
-            'link_action' : 'B'
-        }
-        payload = fmt_unpack(payload_data,schema)
-    
-    #Mosaic            
-    elif payload_type == b'414d': #MosaicDefinitionTransaction
-        schema = {
-            'id' : 'Q',
-            'duration' : 'Q',
-            'nonce' : 'I',
-            'flags' : 'B',
-            'divisibility' : 'B'
-        }
-        payload = fmt_unpack(payload_data,schema)
-    
-    elif payload_type == b'424d': #MosaicSupplyChangeTransaction
-        schema = {
-            'mosaic_id' : 'Q',
-            'delta' : 'Q',
-            'action' : 'B',
-        }
-        payload = fmt_unpack(payload_data,schema)
-    
-    #Namespace            
-    elif payload_type == b'414e': #NamespaceRegistrationTransaction
-        schema = {
-            'identifier' : 'Q',
-            'id' : 'Q',
-            'registration_type' : 'B',
-            'name_size' : 'B',
-        }
-        payload = fmt_unpack(payload_data[:18],schema)
-        payload['name'] = payload_data[18:]
-        if payload['registration_type'] == 0:
-            payload['duration'] = payload['identifier']
-        elif payload['registration_type'] == 1:
-            payload['parent_id'] = payload['identifier']
-        else:
-            raise ValueError(f'Unknown registration type for Namespace RegistrationTransaction: {payload["registration_type"]}')
-        del payload['identifier']
-    
-    elif payload_type == b'424e': #AddressAliasTransaction
-        schema = {
-            'namespace_id' : 'Q',
-            'address' : '24s',
-            'alias_action' : 'B'
-        }
-        payload = fmt_unpack(payload_data,schema)
-    
-    elif payload_type == b'434e': #MosaicAliasTransaction
-        schema = {
-            'namespace_id' : 'Q',
-            'mosaid_id' : 'Q',
-            'alias_action' : 'B'
-        }
-        payload = fmt_unpack(payload_data,schema)
-    
-    #Metadata            
-    elif payload_type == b'4144': #AccountMetadataTransaction
-        schema = {
-            'target_address' : '24s',
-            'scoped_metadata_key' : 'Q',
-            'value_size_delta': 'H',
-            'value_size': 'H',
-        }
-        payload = fmt_unpack(payload_data[:36],schema)
-        payload['target_address'] = encode_address(payload['target_address'])
-        payload['value'] = payload_data[36:]
-    
-    elif payload_type == b'4244': #MosaicMetadataTransaction
-        schema = {
-            'target_address' : '24s',
-            'scoped_metadata_key' : 'Q',
-            'target_mosaic_id' : 'Q',
-            'value_size_delta': 'H',
-            'value_size': 'H',
-        }
-        payload = fmt_unpack(payload_data[:44],schema)
-        payload['target_address'] = encode_address(payload['target_address'])
-        payload['value'] = payload_data[44:]
-    
-    elif payload_type == b'4344': #NamespaceMetadataTransaction
-        schema = {
-            'target_address' : '24s',
-            'scoped_metadata_key' : 'Q',
-            'target_namespace_id' : 'Q',
-            'value_size_delta': 'H',
-            'value_size': 'H',
-        }
-        payload = fmt_unpack(payload_data[:44],schema)
-        payload['target_address'] = encode_address(payload['target_address'])
-        payload['value'] = payload_data[44:]
-    
-    #Multisignature            
-    elif payload_type == b'4155': #MultisigAccountModificationTransaction
-        schema = {
-            'min_removal_delta' : 'B',
-            'min_approval_delta' : 'b',
-            'address_additions_count' : 'B',
-            'address_deletions_count' : 'B',
-            'multisig_account_modificaion_transacion_body_reserved_1' : 'I'
-        }
-        payload = fmt_unpack(payload_data[:8],schema)
-        i = 8
-        if payload['address_additions_count'] > 0:
-            payload['address_additions'] = struct.unpack('<' + '24s'*payload['address_additions_count'], payload_data[i:i+payload['address_additions_count']*24])
-            i += payload['address_additions_count']*24
-        else: payload['address_additions'] = []
-
-        if payload['address_deletions_count'] > 0:
-            payload['address_deletions'] = struct.unpack('<' + '24s'*payload['address_deletions_count'], payload_data[i:i+payload['address_deletions_count']*24])
-        else: payload['address_deletions'] = []
-    
-    #Hash Lock            
-    elif payload_type == b'4148': #HashLockTransaction
-        schema = {
-            'reserved_1' : '8s', # NOT in the schema but shows up in the data ?!?
-            'mosaic' : 'Q',
-            'duration' : 'Q',
-            'hash' : '32s'
-        }
-        payload = fmt_unpack(payload_data,schema)
-    
-    #Secret Lock            
-    elif payload_type == b'4152': #SecretLockTransaction
-        schema = {
-            'recipient_address' : '24s',
-            'secret' : '32s',
-            'mosaic_id' : 'Q',
-            'amount' : 'Q',
-            'duration' : 'Q',
-            'hash_algorithm' : 'B'
-        }
-        payload = fmt_unpack(payload_data,schema)
-        payload['recipient_address'] = encode_address(payload['recipient_address'])
-    
-    elif payload_type == b'4252': #SecretProofTransaction
-        schema = {
-            'recipient_address' : '24s',
-            'secret' : '32s',
-            'proof_size' : 'H',
-            'hash_algorithm' : 'B',
-        }
-        payload = fmt_unpack(payload_data[:59],schema)
-        payload['recipient_address'] = encode_address(payload['recipient_address'])
-        payload['proof'] = payload_data[59:]
-    
-    #Account restriction            
-    elif payload_type == b'4150': #AccountAddressRestrictionTransaction
-        schema = {
-            'restriction_type' : 'H',
-            'restriction_additions_count' : 'B',
-            'restriction_deletions_count' : 'B',
-            'account_restriction_transaction_body_reserved_1' : 'I',
-        }
-        payload = fmt_unpack(payload_data[:8],schema)
-        i = 8
-        if payload['restriction_additions_count'] > 0:
-            payload['restriction_additions'] = struct.unpack('<' + '24s'*payload['restriction_additions_count'], payload_data[i:i+payload['restriction_additions_count']*24])
-            i += payload['restriction_additions_count']*24
-        else: payload['restriction_additions'] = []
-        
-        if payload['restriction_deletions_count'] > 0:
-            payload['restriction_deletions'] = struct.unpack('<' + '24s'*payload['restriction_deletions_count'], payload_data[i:i+payload['restriction_deletions_count']*24])
-        else: payload['restriction_deletions'] = []
-    
-    elif payload_type == b'4250': #AccountMosaicRestrictionTransaction
-        schema = {
-            'restriction_type' : 'H',
-            'restriction_additions_count' : 'B',
-            'restriction_deletions_count' : 'B',
-            'account_restriction_transaction_body_reserved_1' : 'I',
-        }
-        payload = fmt_unpack(payload_data[:8],schema)
-        i = 8
-        if payload['restriction_additions_count'] > 0:
-            payload['restriction_additions'] = struct.unpack('<' + 'Q'*payload['restriction_additions_count'], payload_data[i:i+payload['restriction_additions_count']*8])
-            i += payload['restriction_additions_count']*8
-        else: payload['restriction_additions'] = []
-        
-        if payload['restriction_deletions_count'] > 0:
-            payload['restriction_deletions'] = struct.unpack('<' + 'Q'*payload['restriction_deletions_count'], payload_data[i:i+payload['restriction_deletions_count']*8])
-        else: payload['restriction_deletions'] = []
-    
-    elif payload_type == b'4350': #AccountOperationRestrictionTransaction
-        schema = {
-            'restriction_type' : 'H',
-            'restriction_additions_count' : 'B',
-            'restriction_deletions_count' : 'B',
-            'account_restriction_transaction_body_reserved_1' : 'I',
-        }
-        payload = fmt_unpack(payload_data[:8],schema)
-        i = 8
-        if payload['restriction_additions_count'] > 0:
-            payload['restriction_additions'] = struct.unpack('<' + '2s'*payload['restriction_additions_count'], payload_data[i:i+payload['restriction_additions_count']*2])
-            i += payload['restriction_additions_count']*2
-        else: payload['restriction_additions'] = []
-        
-        if payload['restriction_deletions_count'] > 0:
-            payload['restriction_deletions'] = struct.unpack('<' + '2s'*payload['restriction_deletions_count'], payload_data[i:i+payload['restriction_deletions_count']*24])
-        else: payload['restriction_deletions'] = []
-    
-    #Mosaic restriction            
-    elif payload_type == b'4151': #MosaicGlobalRestrictionTransaction
-        schema = {
-            'mosaic_id' : 'Q',
-            'reference_mosaic_id' : 'Q',
-            'restriction_key' : 'Q',
-            'previous_restriction_value' : 'Q',
-            'new_restriction_value' : 'Q',
-            'previous_restriction_type' : 'B',
-            'new_restriction_type' : 'B'
-        }
-        payload = fmt_unpack(payload_data,schema)
-    
-    elif payload_type == b'4251': #MosaicAddressRestrictionTransaction
-        schema = {
-            'mosaic_id' : 'Q',
-            'restriction_key' : 'Q',
-            'previous_restriction_value' : 'Q',
-            'new_restriction_value' : 'Q',
-            'target_address' : '24s'
-        }
-        payload = fmt_unpack(payload_data,schema)
-        payload['target_address'] = encode_address(payload['target_address'])
-    
-    #Transfer            
-    elif payload_type == b'4154': #TransferTransaction
-        schema = {
-            'recipient_address' : '24s',
-            'message_size' : 'H',
-            'mosaics_count' : 'B',
-            'transfer_transaction_body_reserved_1' : 'I',
-            'transfer_transaction_body_reserved_2' : 'B',
-        }
-        payload = fmt_unpack(payload_data[:32],schema)
-        i = 32
-        payload['mosaics'] = []
-        for _ in range(payload['mosaics_count']):
-            mosaic = {}
-            mosaic['mosaic_id'] = struct.unpack('<Q',payload_data[i:i+8])[0]
-            mosaic['amount'] = struct.unpack('<Q',payload_data[i+8:i+16])[0]
-            payload['mosaics'].append(mosaic)
-            i += 16
-        payload['message'] = payload_data[-payload['message_size']:]
-        payload['recipient_address'] = encode_address(payload['recipient_address'])
-    
+    try:
+        decoder = TX_PAYLOAD_DECODERS[payload_type]
+    except KeyError:
+        raise ValueError(f"Unknown Tx payload type encountered: {payload_type}") from None
+    if payload_type in AGGREGATE_TX_TYPES:
+        payload = decoder(payload_data,payload_type,tx_types)
+    else:
+        payload = decoder(payload_data,payload_type)
+    if not raw_keys:
+        encode_tx_payload(payload,payload_type)
+    return payload
+
+
+def encode_tx(tx):
+    """Convert the raw signature, signer key and payload addresses of a tx to hex and base32 in place"""
+    if 'signature' in tx: # embedded txs are unsigned
+        tx['signature'] = hexlify(tx['signature'])
+    tx['signer_public_key'] = hexlify(tx['signer_public_key'])
+    if tx['payload'] is not None: # filtered out by tx type
+        encode_tx_payload(tx['payload'],tx['type'])
+    return tx
+
+
+def encode_tx_payload(payload,payload_type):
+    """Base32 encode the raw addresses of a tx payload in place, descending into embedded txs"""
+    for k in TX_PAYLOAD_ADDRESS_FIELDS[payload_type]:
+        payload[k] = encode_address(payload[k])
+    if payload_type in AGGREGATE_TX_TYPES:
+        for e_tx in payload['embedded_transactions']:
+            encode_tx(e_tx)
+    return payload
+
+
+@register_tx_payload_decoder(
+    b'414c', #AccountKeyLinkTransaction
+    b'424c', #NodeKeyLinkTransaction
+    b'4143', #VotingKeyLinkTransaction
+    b'4243', #VrfKeyLinkTransaction
+    b'414d', #MosaicDefinitionTransaction
+    b'424d', #MosaicSupplyChangeTransaction
+    b'424e', #AddressAliasTransaction
+    b'434e', #MosaicAliasTransaction
+    b'4148', #HashLockTransaction
+    b'4151') #MosaicGlobalRestrictionTransaction
+def deserialize_fixed_payload(payload_data,payload_type):
+    """Decode a payload that is exactly its schema"""
+    return TX_PAYLOAD_SCHEMAS[payload_type].unpack(payload_data)
+
+
+@register_tx_payload_decoder(
+    b'4141', #AggregateCompleteTransaction
+    b'4241') #AggregateBondedTransaction
+def deserialize_aggregate_payload(payload_data,payload_type,tx_types=None):
+    """Decode an aggregate payload along with all of its embedded transactions, keeping their keys raw"""
+    payload = TX_PAYLOAD_SCHEMAS[payload_type].unpack_from(payload_data)
+    i = 40
+    e_tx_count = 0
+    e_tx_data = []
+    while i < 8 + payload['payload_size']:
+        e_tx_header = EMBED_TX_H_SCHEMA.unpack_from(payload_data,i)
+        e_tx_header['id'] = e_tx_count + 1 #tx ids are 1-based
+        e_tx_header['type'] = hexlify(e_tx_header['type'][::-1])
+        e_tx_header['payload'] = None
+        if tx_payload_selected(e_tx_header['type'],tx_types):
+            e_tx_header['payload'] = deserialize_tx_payload(payload_data[i+EMBED_TX_H_LEN:i+e_tx_header['size']],e_tx_header['type'],True,tx_types)
+        e_tx_data.append(e_tx_header)
+        e_tx_count += 1 
+        i += e_tx_header['size'] + (8 - e_tx_header['size']) %8
+
+    payload['embedded_tx_count'] = e_tx_count
+    payload['embedded_transactions'] = e_tx_data
+    payload['cosignatures'] = bytes(payload_data[i:])
+    return payload
+
+
+@register_tx_payload_decoder(b'414e') #NamespaceRegistrationTransaction
+def deserialize_namespace_registration_payload(payload_data,payload_type):
+    """Decode a namespace registration payload, naming its identifier by registration type"""
+    payload = TX_PAYLOAD_SCHEMAS[payload_type].unpack_from(payload_data)
+    payload['name'] = bytes(payload_data[18:])
+    if payload['registration_type'] == 0:
+        payload['duration'] = payload['identifier']
+    elif payload['registration_type'] == 1:
+        payload['parent_id'] = payload['identifier']
     else:
-        raise ValueError(f"Unknown Tx payload type encountered: {payload_type}")
+        raise ValueError(f'Unknown registration type for Namespace RegistrationTransaction: {payload["registration_type"]}')
+    del payload['identifier']
+    return payload
+
+
+@register_tx_payload_decoder(
+    b'4144', #AccountMetadataTransaction
+    b'4244', #MosaicMetadataTransaction
+    b'4344', #NamespaceMetadataTransaction
+    address_fields=('target_address',))
+def deserialize_metadata_payload(payload_data,payload_type):
+    """Decode a metadata payload followed by its variable length value"""
+    schema = TX_PAYLOAD_SCHEMAS[payload_type]
+    payload = schema.unpack_from(payload_data)
+    payload['value'] = bytes(payload_data[schema.size:])
+    return payload
+
+
+@register_tx_payload_decoder(b'4155') #MultisigAccountModificationTransaction
+def deserialize_multisig_payload(payload_data,payload_type):
+    """Decode a multisig modification payload with its address additions and deletions"""
+    payload = TX_PAYLOAD_SCHEMAS[payload_type].unpack_from(payload_data)
+    i = 8
+    if payload['address_additions_count'] > 0:
+        payload['address_additions'] = struct.unpack_from('<' + '24s'*payload['address_additions_count'], payload_data, i)
+        i += payload['address_additions_count']*24
+    else: payload['address_additions'] = []
+
+    if payload['address_deletions_count'] > 0:
+        payload['address_deletions'] = struct.unpack_from('<' + '24s'*payload['address_deletions_count'], payload_data, i)
+    else: payload['address_deletions'] = []
+    return payload
+
+
+@register_tx_payload_decoder(b'4152',address_fields=('recipient_address',)) #SecretLockTransaction
+def deserialize_secret_lock_payload(payload_data,payload_type):
+    """Decode a secret lock payload"""
+    return TX_PAYLOAD_SCHEMAS[payload_type].unpack(payload_data)
+
+
+@register_tx_payload_decoder(b'4252',address_fields=('recipient_address',)) #SecretProofTransaction
+def deserialize_secret_proof_payload(payload_data,payload_type):
+    """Decode a secret proof payload followed by its proof"""
+    payload = TX_PAYLOAD_SCHEMAS[payload_type].unpack_from(payload_data)
+    payload['proof'] = bytes(payload_data[59:])
+    return payload
+
+
+ACCOUNT_RESTRICTION_VALUE_FORMATS = {
+    b'4150': '24s', #AccountAddressRestrictionTransaction
+    b'4250': 'Q', #AccountMosaicRestrictionTransaction
+    b'4350': '2s'} #AccountOperationRestrictionTransaction
+
+
+@register_tx_payload_decoder(*ACCOUNT_RESTRICTION_VALUE_FORMATS)
+def deserialize_account_restriction_payload(payload_data,payload_type):
+    """Decode an account restriction payload with its typed additions and deletions"""
+    value_format = ACCOUNT_RESTRICTION_VALUE_FORMATS[payload_type]
+    payload = TX_PAYLOAD_SCHEMAS[payload_type].unpack_from(payload_data)
+    i = 8
+    if payload['restriction_additions_count'] > 0:
+        payload['restriction_additions'] = struct.unpack_from('<' + value_format*payload['restriction_additions_count'], payload_data, i)
+        i += payload['restriction_additions_count']*struct.calcsize(value_format)
+    else: payload['restriction_additions'] = []
+    
+    if payload['restriction_deletions_count'] > 0:
+        payload['restriction_deletions'] = struct.unpack_from('<' + value_format*payload['restriction_deletions_count'], payload_data, i)
+    else: payload['restriction_deletions'] = []
+    return payload
+
 
+@register_tx_payload_decoder(b'4251',address_fields=('target_address',)) #MosaicAddressRestrictionTransaction
+def deserialize_mosaic_address_restriction_payload(payload_data,payload_type):
+    """Decode a mosaic address restriction payload"""
+    return TX_PAYLOAD_SCHEMAS[payload_type].unpack(payload_data)
+
+
+@register_tx_payload_decoder(b'4154',address_fields=('recipient_address',)) #TransferTransaction
+def deserialize_transfer_payload(payload_data,payload_type):
+    """Decode a transfer payload with its mosaics and message"""
+    payload = TX_PAYLOAD_SCHEMAS[payload_type].unpack_from(payload_data)
+    i = 32
+    payload['mosaics'] = []
+    for _ in range(payload['mosaics_count']):
+        mosaic = {}
+        mosaic['mosaic_id'], mosaic['amount'] = struct.unpack_from('<QQ',payload_data,i)
+        payload['mosaics'].append(mosaic)
+        i += 16
+    payload['message'] = bytes(payload_data[-payload['message_size']:])
     return payload
 
 
-def deserialize_receipt_payload(receipt_data,receipt_type):
+def deserialize_receipt_payload(receipt_data,receipt_type,raw_keys=False,receipt_types=None):
     """Produce a nested python dict from a raw receipt payload
  
     Parameters
     ----------
-    receipt_data : bytes
+    receipt_data : bytes or memoryview
         Byte array containing serialized receipt payload
     receipt_type: bytes
         Byte array containing the hex representation of the type field from 
         the receipt header
+    raw_keys: bool, default=False
+        Keep addresses as raw bytes; see :func:`encode_receipt_payload`
+    receipt_types: collection of int, optional
+        Filter applied to the receipts nested in transaction group receipts,
+        see :func:`deserialize_transaction_statements`
     
     Returns
     -------
@@ -614,156 +864,129 @@ def deserialize_receipt_payload(receipt_data,receipt_type):
     
     """
 
-    # Reserved
-    if receipt_type == 0x0000: # reserved receipt
-        payload = None
-
-    # Balance Transfer
-    elif receipt_type == 0x124D: # mosaic rental fee receipt
-        schema = {
-            'mosaic_id' : 'Q',
-            'amount' : 'Q',
-            'sender_address' : '24s',
-            'recipient_address' : '24s'
-        }
-        payload = fmt_unpack(receipt_data,schema)
-        payload['sender_address'] = encode_address(payload['sender_address'])
-        payload['recipient_address'] = encode_address(payload['recipient_address'])
-
-    elif receipt_type == 0x134E: # namespace rental fee receipt
-        schema = {
-            'mosaic_id' : 'Q',
-            'amount' : 'Q',
-            'sender_address' : '24s',
-            'recipient_address' : '24s'
-        }
-        payload = fmt_unpack(receipt_data,schema)
-        payload['sender_address'] = encode_address(payload['sender_address'])
-        payload['recipient_address'] = encode_address(payload['recipient_address'])
-
-    # Balance Change (Credit)
-    elif receipt_type == 0x2143: # harvest fee receipt
-        schema = {
-            'mosaic_id' : 'Q',
-            'amount' : 'Q',
-            'target_address' : '24s',
-        }
-        payload = fmt_unpack(receipt_data,schema)
-        payload['target_address'] = encode_address(payload['target_address'])
-
-    elif receipt_type == 0x2248: # lock hash completed receipt
-        schema = {
-            'mosaic_id' : 'Q',
-            'amount' : 'Q',
-            'target_address' : '24s',
-        }
-        payload = fmt_unpack(receipt_data,schema)
-        payload['target_address'] = encode_address(payload['target_address'])
-
-    elif receipt_type == 0x2348: # lock hash expired receipt
-        schema = {
-            'mosaic_id' : 'Q',
-            'amount' : 'Q',
-            'target_address' : '24s',
-        }
-        payload = fmt_unpack(receipt_data,schema)
-        payload['target_address'] = encode_address(payload['target_address'])
-
-    elif receipt_type == 0x2252: # lock secret completed receipt
-        schema = {
-            'mosaic_id' : 'Q',
-            'amount' : 'Q',
-            'target_address' : '24s',
-        }
-        payload = fmt_unpack(receipt_data,schema)
-        payload['target_address'] = encode_address(payload['target_address'])
-
-    elif receipt_type == 0x2352: # lock secret expired receipt
-        schema = {
-            'mosaic_id' : 'Q',
-            'amount' : 'Q',
-            'target_address' : '24s',
-        }
-        payload = fmt_unpack(receipt_data,schema)
-        payload['target_address'] = encode_address(payload['target_address'])
-
-    # Balance Change (Debit)
-    elif receipt_type == 0x3148: # lock hash created receipt
-        schema = {
-            'mosaic_id' : 'Q',
-            'amount' : 'Q',
-            'target_address' : '24s',
-        }
-        payload = fmt_unpack(receipt_data,schema)
-        payload['target_address'] = encode_address(payload['target_address'])
-
-    elif receipt_type == 0x3152: # lock secret created receipt
-        schema = {
-            'mosaic_id' : 'Q',
-            'amount' : 'Q',
-            'target_address' : '24s',
-        }
-        payload = fmt_unpack(receipt_data,schema)
-        payload['target_address'] = encode_address(payload['target_address'])
-
-    # Artifact Expiry
-    elif receipt_type == 0x414D: # mosaic expired receipt
-        schema = {
-            'mosaic_id' : 'Q'
-        }
-        payload = fmt_unpack(receipt_data,schema)
+    try:
+        decoder = RECEIPT_PAYLOAD_DECODERS[receipt_type]
+    except KeyError:
+        raise ValueError(f"Unknown receipt payload type encountered: {hex(receipt_type)}") from None
+    if receipt_type == 0xE143:
+        payload = decoder(receipt_data,receipt_type,receipt_types)
+    else:
+        payload = decoder(receipt_data,receipt_type)
+    if not raw_keys:
+        encode_receipt_payload(payload,receipt_type)
+    return payload
 
-    elif receipt_type == 0x414E: # namespace expired receipt
-        schema = {
-            'mosaic_id' : 'Q'
-        }
-        payload = fmt_unpack(receipt_data,schema)
 
-    elif receipt_type == 0x424E: # namespace deleted receipt
-        schema = {
-            'mosaic_id' : 'Q'
-        }
-        payload = fmt_unpack(receipt_data,schema)
+def receipt_payload_selected(receipt_type,receipt_types):
+    """Whether the payload of a receipt of the given type is decoded under a receipt type filter
 
-    # Inflation
-    elif receipt_type == 0x5143: # inflation receipt
-        schema = {
-            'mosaic_id' : 'Q',
-            'amount' : 'Q',
-        }
-        payload = fmt_unpack(receipt_data,schema)
+    Everything is decoded without a filter (``receipt_types=None``).
+    Transaction group receipts are always decoded so that the filter can be
+    applied to their nested receipts.
+    """
+    return receipt_types is None or receipt_type in receipt_types or receipt_type == 0xE143
+
+
+def encode_receipt_payload(payload,receipt_type):
+    """Base32 encode the raw addresses of a receipt payload in place, descending into grouped receipts"""
+    if isinstance(payload,bytes): # left undecoded by a receipt type filter
+        return payload
+    for k in RECEIPT_PAYLOAD_ADDRESS_FIELDS[receipt_type]:
+        payload[k] = encode_address(payload[k])
+    if receipt_type == 0xE143:
+        for receipt in payload['receipts']:
+            encode_receipt_payload(receipt['payload'],receipt['type'])
+    return payload
 
-    # Transaction Statement
-    elif receipt_type == 0xE143: # transaction group receipt
-        receipt_source = fmt_unpack(receipt_data[:RECEIPT_SOURCE_LEN], RECEIPT_SOURCE_FORMAT)
-        i = RECEIPT_SOURCE_LEN
 
-        receipt_count = struct.unpack("<I", receipt_data[i:i+4])[0]
-        i += 4
+def encode_statements(stmts):
+    """Base32 encode the raw addresses in the receipts of a block's statements in place"""
+    for stmt in stmts['transaction_statements']:
+        for receipt in stmt['receipts']:
+            encode_receipt_payload(receipt['payload'],receipt['type'])
+    return stmts
+
+
+@register_receipt_payload_decoder(0x0000) # reserved receipt
+def deserialize_reserved_receipt_payload(receipt_data,receipt_type):
+    """Reserved receipts carry no payload"""
+    return None
+
+
+@register_receipt_payload_decoder(
+    0x124D, # mosaic rental fee receipt
+    0x134E, # namespace rental fee receipt
+    address_fields=('sender_address','recipient_address'))
+def deserialize_balance_transfer_receipt_payload(receipt_data,receipt_type):
+    """Decode a balance transfer receipt payload"""
+    return RECEIPT_PAYLOAD_SCHEMAS[receipt_type].unpack(receipt_data)
+
+
+@register_receipt_payload_decoder(
+    0x2143, # harvest fee receipt
+    0x2248, # lock hash completed receipt
+    0x2348, # lock hash expired receipt
+    0x2252, # lock secret completed receipt
+    0x2352, # lock secret expired receipt
+    0x3148, # lock hash created receipt
+    0x3152, # lock secret created receipt
+    address_fields=('target_address',))
+def deserialize_balance_change_receipt_payload(receipt_data,receipt_type):
+    """Decode a balance change receipt payload"""
+    return RECEIPT_PAYLOAD_SCHEMAS[receipt_type].unpack(receipt_data)
+
+
+@register_receipt_payload_decoder(
+    0x414D, # mosaic expired receipt
+    0x414E, # namespace expired receipt
+    0x424E, # namespace deleted receipt
+    0x5143) # inflation receipt
+def deserialize_fixed_receipt_payload(receipt_data,receipt_type):
+    """Decode a receipt payload that is exactly its schema"""
+    return RECEIPT_PAYLOAD_SCHEMAS[receipt_type].unpack(receipt_data)
+
+
+@register_receipt_payload_decoder(0xE143) # transaction group receipt
+def deserialize_transaction_group_receipt_payload(receipt_data,receipt_type,receipt_types=None):
+    """Decode a transaction group receipt along with its nested receipts, keeping their addresses raw"""
+    receipt_source = RECEIPT_SOURCE_SCHEMA.unpack_from(receipt_data)
+    i = RECEIPT_SOURCE_LEN
+
+    receipt_count = struct.unpack_from("<I", receipt_data, i)[0]
+    i += 4
 
-        payload = {'receipt_source': receipt_source, 'receipts': [] }
-        for k in range(receipt_count):
-            receipt = fmt_unpack(receipt_data[i:i + RECEIPT_LEN], RECEIPT_FORMAT)
-            receipt['payload'] = deserialize_receipt_payload(receipt_data[i + RECEIPT_LEN:i + receipt['size']],receipt['type'])
-            i += receipt['size']
+    payload = {'receipt_source': receipt_source, 'receipts': [] }
+    for k in range(receipt_count):
+        receipt = RECEIPT_SCHEMA.unpack_from(receipt_data, i)
+        receipt['payload'] = deserialize_selected_receipt_payload(receipt_data[i + RECEIPT_LEN:i + receipt['size']],receipt['type'],True,receipt_types)
+        i += receipt['size']
 
-            payload['receipts'].append(receipt)
+        payload['receipts'].append(receipt)
+    return payload
 
-    else:
-        raise ValueError(f"Unknown receipt payload type encountered: {hex(receipt_type)}")
 
-    return payload
+def deserialize_selected_receipt_payload(receipt_data,receipt_type,raw_keys=False,receipt_types=None):
+    """Decode a receipt payload if its type passes the receipt type filter, otherwise copy out its raw bytes"""
+    if receipt_payload_selected(receipt_type,receipt_types):
+        return deserialize_receipt_payload(receipt_data,receipt_type,raw_keys,receipt_types)
+    return bytes(receipt_data)
 
 
-def deserialize_transaction_statements(stmt_data, i):
+def deserialize_transaction_statements(stmt_data, i, raw_keys=False, receipt_types=None):
     """Produce a list of statements from a buffer of transaction statement data
  
     Parameters
     ----------
-    stmt_data : bytes
+    stmt_data : bytes or memoryview
         Byte array containing serialized transaction statements
     i: int
         Starting index into byte array
+    raw_keys: bool, default=False
+        Keep receipt addresses as raw bytes; see :func:`encode_statements`
+    receipt_types: collection of int, optional
+        Receipt type codes whose payloads are decoded, see
+        :func:`receipt_payload_selected`; other receipts keep their raw
+        payload bytes
 
     Returns
     -------
@@ -774,21 +997,21 @@ def deserialize_transaction_statements(stmt_data, i):
     """
 
 
-    count = struct.unpack("<I", stmt_data[i:i+4])
+    count = struct.unpack_from("<I", stmt_data, i)
     i += 4
 
     statements = []
     for j in range(count[0]):
-        receipt_source = fmt_unpack(stmt_data[i:i + RECEIPT_SOURCE_LEN], RECEIPT_SOURCE_FORMAT)
+        receipt_source = RECEIPT_SOURCE_SCHEMA.unpack_from(stmt_data, i)
         i += RECEIPT_SOURCE_LEN
 
-        receipt_count = struct.unpack("<I", stmt_data[i:i+4])[0]
+        receipt_count = struct.unpack_from("<I", stmt_data, i)[0]
         i += 4
 
         statement = { 'receipt_source': receipt_source, 'receipts': [] }
         for k in range(receipt_count):
-            receipt = fmt_unpack(stmt_data[i:i + RECEIPT_LEN], RECEIPT_FORMAT)
-            receipt['payload'] = deserialize_receipt_payload(stmt_data[i + RECEIPT_LEN:i + receipt['size']],receipt['type'])
+            receipt = RECEIPT_SCHEMA.unpack_from(stmt_data, i)
+            receipt['payload'] = deserialize_selected_receipt_payload(stmt_data[i + RECEIPT_LEN:i + receipt['size']],receipt['type'],raw_keys,receipt_types)
             i += receipt['size']
 
             statement['receipts'].append(receipt)
@@ -803,7 +1026,7 @@ def deserialize_address_resolution_statements(stmt_data, i):
  
     Parameters
     ----------
-    stmt_data : bytes
+    stmt_data : bytes or memoryview
         Byte array containing serialized address resolution statements
     i: int
         Starting index into byte array
@@ -816,20 +1039,20 @@ def deserialize_address_resolution_statements(stmt_data, i):
         List of dicts containing deserialized address resolution statements
     """
     
-    count = struct.unpack("<I", stmt_data[i:i+4])
+    count = struct.unpack_from("<I", stmt_data, i)
     i += 4
 
     statements = []
     for j in range(count[0]):
-        key = struct.unpack('24s', stmt_data[i:i+24])[0]
+        key = struct.unpack_from('24s', stmt_data, i)[0]
         i += 24
 
-        resolution_count = struct.unpack("<I", stmt_data[i:i+4])[0]
+        resolution_count = struct.unpack_from("<I", stmt_data, i)[0]
         i += 4
 
         statement = { 'key': key, 'resolutions': [] }
         for k in range(resolution_count):
-            address_resolution = fmt_unpack(stmt_data[i:i + ADDRESS_RESOLUTION_LEN], ADDRESS_RESOLUTION_FORMAT)
+            address_resolution = ADDRESS_RESOLUTION_SCHEMA.unpack_from(stmt_data, i)
             i += ADDRESS_RESOLUTION_LEN
             statement['resolutions'].append(address_resolution)
 
@@ -843,7 +1066,7 @@ def deserialize_mosaic_resolution_statements(stmt_data, i):
  
     Parameters
     ----------
-    stmt_data : bytes
+    stmt_data : bytes or memoryview
         Byte array containing serialized mosaic resolution statements
     i: int
         Starting index into byte array
@@ -856,20 +1079,20 @@ def deserialize_mosaic_resolution_statements(stmt_data, i):
         List of dicts containing deserialized mosaic resolution statements
     """
     
-    count = struct.unpack("<I", stmt_data[i:i+4])
+    count = struct.unpack_from("<I", stmt_data, i)
     i += 4
 
     statements = []
     for j in range(count[0]):
-        key = struct.unpack('<Q', stmt_data[i:i+8])[0]
+        key = struct.unpack_from('<Q', stmt_data, i)[0]
         i += 8
 
-        resolution_count = struct.unpack("<I", stmt_data[i:i+4])[0]
+        resolution_count = struct.unpack_from("<I", stmt_data, i)[0]
         i += 4
 
         statement = { 'key': key, 'resolutions': [] }
         for k in range(resolution_count):
-            mosaic_resolution = fmt_unpack(stmt_data[i:i + MOSAIC_RESOLUTION_LEN], MOSAIC_RESOLUTION_FORMAT)
+            mosaic_resolution = MOSAIC_RESOLUTION_SCHEMA.unpack_from(stmt_data, i)
             i += MOSAIC_RESOLUTION_LEN
             statement['resolutions'].append(mosaic_resolution)
 
@@ -878,6 +1101,34 @@ def deserialize_mosaic_resolution_statements(stmt_data, i):
     return i, statements
 
 
+def skip_resolution_statements(stmt_data, i, key_len, resolution_len):
+    """Return the index past a section of address or mosaic resolution statements, reading only its counts
+
+    Parameters
+    ----------
+    stmt_data : bytes or memoryview
+        Byte array containing serialized resolution statements
+    i: int
+        Starting index into byte array
+    key_len: int
+        Size of the unresolved key of each statement, 24 for addresses and 8 for mosaics
+    resolution_len: int
+        Size of each resolution entry
+
+    Returns
+    -------
+    i: int
+        Final index value after the resolution statements
+    """
+    count = struct.unpack_from("<I", stmt_data, i)[0]
+    i += 4
+    for j in range(count):
+        i += key_len
+        resolution_count = struct.unpack_from("<I", stmt_data, i)[0]
+        i += 4 + resolution_count * resolution_len
+    return i
+
+
 def get_statement_paths(statement_extension='.stmt', block_dir='./data'):    
     """Collect a list of valid statement paths for analysis"""
     statement_paths = glob.glob(os.path.join(block_dir,'**','*'+statement_extension),recursive=True)
@@ -886,7 +1137,259 @@ def get_statement_paths(statement_extension='.stmt', block_dir='./data'):
     return statement_paths
 
 
-def deserialize_statements(statement_paths, db_offset_bytes=DB_OFFSET_BYTES):
+def map_store_file(path):
+    """Memory-map a block or statement file read-only and return a memoryview over it
+
+    Pages are read in by the OS on demand and shared with any other process
+    mapping the same file, so peak memory no longer grows with file size. The
+    mapping is released once the last view derived from it is dropped.
+    """
+    with open(path,mode='rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return memoryview(b'')
+        mapped = mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+    if hasattr(mapped,'madvise'):
+        mapped.madvise(mmap.MADV_SEQUENTIAL)
+    return memoryview(mapped)
+
+
+def map_store_span(path, start=None, stop=None, db_offset_bytes=DB_OFFSET_BYTES):
+    """Map the part of a store file lying between two (path, offset) cursors
+
+    Without cursors this is the whole file past its `db_offset_bytes` header.
+    Paths are compared as strings, which follows store order since file and
+    directory names are zero padded. Returns None for files entirely before
+    `start` or after `stop`.
+    """
+    if (start is not None and path < start[0]) or (stop is not None and path > stop[0]):
+        return None
+    data = map_store_file(path)
+    begin = start[1] if start is not None and path == start[0] else db_offset_bytes
+    end = stop[1] if stop is not None and path == stop[0] else len(data)
+    return data[begin:end]
+
+
+def store_end_cursor(paths, entry_end, start=None, db_offset_bytes=DB_OFFSET_BYTES):
+    """Return a (path, offset) cursor just past the last complete entry of a store
+
+    Only the size prefixes in the last file are walked, beginning at `start`
+    if it lies in that file. An entry which is still being written, i.e.
+    whose sizes point past the end of the file, is left out.
+    """
+    if not len(paths):
+        return start
+    path = paths[-1]
+    data = map_store_file(path)
+    i = start[1] if start is not None and path == start[0] else db_offset_bytes
+    while i < len(data):
+        try:
+            end = entry_end(data, i)
+        except struct.error: # size prefix itself is incomplete
+            break
+        if end > len(data):
+            break
+        i = end
+    return (path, i)
+
+
+def read_checkpoint(checkpoint_path, block_dir):
+    """Read an extraction checkpoint written by :func:`write_checkpoint`, or None if there is none yet"""
+    if not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path, 'rb') as f:
+        checkpoint = msgpack.unpackb(f.read(), raw=False)
+    for k in ('block_cursor', 'statement_cursor'):
+        if checkpoint[k] is not None:
+            checkpoint[k] = (os.path.join(block_dir, checkpoint[k][0]), checkpoint[k][1])
+    return checkpoint
+
+
+def write_checkpoint(checkpoint_path, checkpoint, block_dir):
+    """Atomically write an extraction checkpoint
+
+    The checkpoint holds the last processed block and statement heights and
+    (path, offset) cursors past them; paths are stored relative to
+    `block_dir`.
+    """
+    checkpoint = dict(checkpoint)
+    for k in ('block_cursor', 'statement_cursor'):
+        if checkpoint[k] is not None:
+            checkpoint[k] = (os.path.relpath(checkpoint[k][0], block_dir), checkpoint[k][1])
+    with open(checkpoint_path + '.tmp', 'wb') as f:
+        f.write(msgpack.packb(checkpoint, use_bin_type=True))
+    os.replace(checkpoint_path + '.tmp', checkpoint_path)
+
+
+def group_paths_by_size(paths, workers, tasks_per_worker=4):
+    """Split an ordered list of paths into consecutive groups of similar total file size
+
+    Files are never split; a file larger than the target size forms a group of
+    its own. Aiming for several groups per worker keeps the pool busy when a
+    few files are much denser than the rest.
+    """
+    sizes = [os.path.getsize(path) for path in paths]
+    target = sum(sizes) / max(1, workers * tasks_per_worker)
+    groups = []
+    group, group_size = [], 0
+    for path, size in zip(paths, sizes):
+        if group and group_size + size > target:
+            groups.append(group)
+            group, group_size = [], 0
+        group.append(path)
+        group_size += size
+    if group:
+        groups.append(group)
+    return groups
+
+
+def ordered_pool_map(func, groups, workers, **kwargs):
+    """Generator running func(group, **kwargs) in a process pool, yielding results in input order
+
+    At most two tasks per worker are in flight at once so that decoded results
+    cannot pile up in memory faster than the consumer drains them.
+    """
+    groups = iter(groups)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = collections.deque(
+            executor.submit(func, group, **kwargs) for group in itertools.islice(groups, 2 * workers))
+        while pending:
+            result = pending.popleft().result()
+            for group in itertools.islice(groups, 1):
+                pending.append(executor.submit(func, group, **kwargs))
+            yield result
+
+
+def statement_file_start_height(path, db_offset_bytes=DB_OFFSET_BYTES):
+    """Infer the height of the first statement in a statement file from its position in the store
+
+    Storage files hold one batch of heights each, the batch size being the
+    number of 8 byte offsets in the file header, and are grouped into
+    directories of FILES_PER_DIRECTORY files. Height 0 does not exist, so the
+    first file starts at height 1.
+    """
+    blocks_per_file = db_offset_bytes // 8
+    directory = os.path.basename(os.path.dirname(path))
+    file_id = int(os.path.basename(path)[:5])
+    if directory.isdigit():
+        file_id += int(directory) * FILES_PER_DIRECTORY
+    return max(1, file_id * blocks_per_file)
+
+
+def deserialize_statement_data(stmt_data, start_height, db_offset_bytes=DB_OFFSET_BYTES, raw_keys=False, skip_resolutions=False, receipt_types=None):
+    """Generator accepting the contents of a statement file and yielding deserialized statements
+
+    Parameters
+    ----------
+    stmt_data: bytes or memoryview
+        Byte array containing the full contents of a statement file
+    start_height: int
+        Block height of the first statements in the file
+    db_offset_bytes: int, optional
+        Number of pad bytes to be ignored at the head of the statement file
+    raw_keys: bool, optional
+        Keep receipt addresses as raw bytes; see :func:`encode_statements`
+    skip_resolutions: bool, optional
+        Walk past address and mosaic resolution statements without decoding
+        them; both are then yielded as ``None``
+    receipt_types: collection of int, optional
+        Only decode receipt payloads of these types, see
+        :func:`deserialize_transaction_statements`
+
+    Yields
+    ------
+    stmt_height: int
+        Block height of yielded statements
+    statements: dict
+        Data for transaction, address resolution, and mosaic resolution statements
+
+    """
+    stmt_data = memoryview(stmt_data)
+    stmt_height = start_height
+    i = db_offset_bytes
+
+    while i < len(stmt_data):
+        # TODO: statement deserialization can probably be inlined efficiently or at least aggregated into one function
+        i, transaction_statements = deserialize_transaction_statements(stmt_data, i, raw_keys, receipt_types)
+        if skip_resolutions:
+            i = skip_resolution_statements(stmt_data, i, 24, ADDRESS_RESOLUTION_LEN)
+            i = skip_resolution_statements(stmt_data, i, 8, MOSAIC_RESOLUTION_LEN)
+            address_resolution_statements = mosaic_resolution_statements = None
+        else:
+            i, address_resolution_statements = deserialize_address_resolution_statements(stmt_data, i)
+            i, mosaic_resolution_statements = deserialize_mosaic_resolution_statements(stmt_data, i)
+
+        yield stmt_height, {
+            'transaction_statements': transaction_statements,
+            'address_resolution_statements': address_resolution_statements,
+            'mosaic_resolution_statements': mosaic_resolution_statements
+            }
+        stmt_height += 1
+
+
+def statement_entry_end(stmt_data, i):
+    """Return the index just past the statements of one block starting at index i
+
+    Only receipt sizes and statement counts are read.
+    """
+    count = struct.unpack_from("<I", stmt_data, i)[0]
+    i += 4
+    for j in range(count):
+        i += RECEIPT_SOURCE_LEN
+        receipt_count = struct.unpack_from("<I", stmt_data, i)[0]
+        i += 4
+        for k in range(receipt_count):
+            i += struct.unpack_from("<I", stmt_data, i)[0]
+    i = skip_resolution_statements(stmt_data, i, 24, ADDRESS_RESOLUTION_LEN)
+    i = skip_resolution_statements(stmt_data, i, 8, MOSAIC_RESOLUTION_LEN)
+    return i
+
+
+def deserialize_statement_files(paths, db_offset_bytes=DB_OFFSET_BYTES, stop=None, **kwargs):
+    """Fully deserialize a list of statement files, returning one list of (height, statements) per file
+
+    Each file's starting height comes from :func:`statement_file_start_height`,
+    so files can be decoded independently of each other in worker processes.
+    Files are decoded up to the `stop` cursor (see :func:`map_store_span`)
+    and keyword arguments are forwarded to :func:`deserialize_statement_data`.
+    """
+    file_statements = []
+    for path in paths:
+        stmt_data = map_store_span(path, None, stop, db_offset_bytes)
+        if stmt_data is None:
+            file_statements.append([])
+            continue
+        start_height = statement_file_start_height(path, db_offset_bytes)
+        file_statements.append(list(deserialize_statement_data(stmt_data, start_height, 0, **kwargs)))
+    return file_statements
+
+
+def deserialize_statement_files_into_state(paths, state_cls, db_offset_bytes=DB_OFFSET_BYTES, stop=None, **kwargs):
+    """Deserialize statement files as :func:`deserialize_statement_files` does, also building the partial state map of their receipts
+
+    Returns the statements of each file and the partial map, see :meth:`XYMStateMap.merge`.
+    """
+    file_statements = deserialize_statement_files(paths, db_offset_bytes, stop, **kwargs)
+    state_map = state_cls(raw_keys=kwargs.get('raw_keys', False))
+    for statements in file_statements:
+        insert_statements(state_map, statements)
+    return file_statements, state_map
+
+
+def insert_statements(state_map, statements):
+    """Insert the receipts of (height, statements) pairs into a state map"""
+    for height, stmts in statements:
+        for stmt in stmts['transaction_statements']:
+            for rx in stmt['receipts']:
+                state_map.insert_rx(rx, height)
+
+
+def merge_partial_state(state_map, file_data, partial_state_map):
+    """Merge the partial state map returned by a pool task into a state map, passing on the task's decoded files"""
+    state_map.merge(partial_state_map)
+    return file_data
+
+
+def deserialize_statements(statement_paths, db_offset_bytes=DB_OFFSET_BYTES, workers=1, raw_keys=False, skip_resolutions=False, receipt_types=None, start=None, stop=None, start_height=1, state_map=None):
     """Generator accepting statement paths and yielding deserialization results
 
     Parameters
@@ -896,6 +1399,28 @@ def deserialize_statements(statement_paths, db_offset_bytes=DB_OFFSET_BYTES):
     db_offset_bytes: int, optional
         Number of pad bytes to be ignored at the head of each serialized 
         statement file
+    workers: int, optional
+        Number of worker processes; with more than one, whole files are decoded
+        in a process pool and merged back in height order
+    raw_keys: bool, optional
+        Keep receipt addresses as raw bytes; see :func:`encode_statements`
+    skip_resolutions: bool, optional
+        Skip address and mosaic resolution statements, yielding ``None`` for both
+    receipt_types: collection of int, optional
+        Only decode receipt payloads of these types, e.g. the keys of
+        ``XYMStateMap.RX_HANDLERS``; others keep their raw payload bytes
+    start, stop: tuple, optional
+        (path, offset) cursors delimiting the statements to decode, see
+        :func:`map_store_span`; heights are only known from the position of
+        whole files, so with `start` set files are decoded in this process
+    start_height: int, optional
+        Block height of the first statements decoded; files decoded from
+        their head must start at the height given by
+        :func:`statement_file_start_height`, or ValueError is raised
+    state_map: XYMStateMap, optional
+        State map to insert the receipts into before they are yielded; with
+        more than one worker, each pool task also builds the partial state map
+        of its files and these are merged into `state_map` in height order
 
     Yields
     ------
@@ -907,81 +1432,529 @@ def deserialize_statements(statement_paths, db_offset_bytes=DB_OFFSET_BYTES):
         File from which statements were deserialized
 
     """
-    stmt_height = 0
     statement_paths_ = tqdm(statement_paths)
+    kwargs = {
+        'raw_keys': raw_keys,
+        'skip_resolutions': skip_resolutions,
+        'receipt_types': receipt_types}
+
+    if workers > 1 and start is None:
+        groups = group_paths_by_size(statement_paths, workers)
+        if state_map is None:
+            results = ordered_pool_map(deserialize_statement_files, groups, workers, db_offset_bytes=db_offset_bytes, stop=stop, **kwargs)
+        else:
+            results = (merge_partial_state(state_map, *result) for result in ordered_pool_map(
+                deserialize_statement_files_into_state, groups, workers, state_cls=type(state_map), db_offset_bytes=db_offset_bytes, stop=stop, **kwargs))
+        for path, statements in zip(statement_paths_, itertools.chain.from_iterable(results)):
+            statement_paths_.set_description(f"processing statement file: {path}")
+            for stmt_height, stmts in statements:
+                yield stmt_height, stmts, path
+        return
+
+    stmt_height = start_height - 1
     for path in statement_paths_:
-        statements = {
-            'transaction_statements':{},
-            'address_resolution_statements': {},
-            'mosaic_resolution_statements': {}
-            }
-
         statement_paths_.set_description(f"processing statement file: {path}")
 
-        with open(path,mode='rb') as f:
-            stmt_data = f.read()
-        
-        i = db_offset_bytes
+        stmt_data = map_store_span(path, start, stop, db_offset_bytes)
+        if stmt_data is None:
+            continue
 
-        while i < len(stmt_data):
-            # TODO: statement deserialization can probably be inlined efficiently or at least aggregated into one function
-            i, transaction_statements = deserialize_transaction_statements(stmt_data, i)
-            i, address_resolution_statements = deserialize_address_resolution_statements(stmt_data, i)
-            i, mosaic_resolution_statements = deserialize_mosaic_resolution_statements(stmt_data, i)
+        if len(stmt_data) and (start is None or path != start[0]):
+            # files decoded from their head get the same height as in the
+            # parallel path; counting on from the previous file must agree
+            file_height = statement_file_start_height(path, db_offset_bytes)
+            if file_height != stmt_height + 1:
+                raise ValueError(f"statement file {path} starts at height {file_height} by its position in the store, but at height {stmt_height + 1} by counting")
 
-            stmt_height += 1
-            statements['transaction_statements'] = transaction_statements
-            statements['address_resolution_statements'] = address_resolution_statements
-            statements['mosaic_resolution_statements'] = mosaic_resolution_statements
+        for stmt_height, statements in deserialize_statement_data(stmt_data, stmt_height + 1, 0, **kwargs):
+            if state_map is not None:
+                insert_statements(state_map, [(stmt_height, statements)])
             yield stmt_height, statements, path
 
 
-def deserialize_blocks(block_paths, save_subcache_merkle_roots=True, db_offset_bytes=DB_OFFSET_BYTES, save_tx_hashes=True):
+def deserialize_block_data(blk_data, save_subcache_merkle_roots=True, db_offset_bytes=DB_OFFSET_BYTES, save_tx_hashes=True, raw_keys=False, lazy=False, tx_types=None):
+    """Generator accepting the contents of a block file and yielding deserialized blocks
+
+    Parameters
+    ----------
+    blk_data: bytes or memoryview
+        Byte array containing the full contents of a block file
+    save_subcache_merkle_roots: bool, optional
+        Whether to deserialize and keep subcache merkle roots
+    db_offset_bytes: int, optional
+        Number of pad bytes to be ignored at the head of the block file
+    save_tx_hashes: bool, optional
+        Whether to deserialize and keep transaction hashes
+    raw_keys: bool, optional
+        Keep keys, hashes and addresses as raw bytes; see :func:`encode_block`
+    lazy: bool, optional
+        Yield :class:`LazyBlock` views that decode their parts on access
+        instead of fully decoded dicts
+    tx_types: collection of bytes, optional
+        Only decode the payloads of these tx types; see :func:`deserialize_footer`
+
+    Yields
+    ------
+    block: dict or LazyBlock
+        Dict containing deserialized header, footer, hashes and merkle roots
+
+    """
+    # slices of a memoryview share the file buffer, so nothing below copies it
+    blk_data = memoryview(blk_data)
+    i = db_offset_bytes
+
+    while i < len(blk_data):
+
+        if lazy:
+            yield LazyBlock(blk_data, i, save_subcache_merkle_roots, save_tx_hashes, raw_keys, tx_types)
+            i = block_entry_end(blk_data, i)
+            continue
+
+        # get fixed length data
+        header = deserialize_header(blk_data[i:i+HEADER_LEN],raw_keys)
+        footer = deserialize_footer(blk_data[i+HEADER_LEN:i+header['size']],header,raw_keys,tx_types)
+        i += header['size']
+        block_hash, generation_hash = struct.unpack_from('<32s32s',blk_data,i)
+        i += 64
+
+        # get transaction hashes
+        num_tx_hashes = struct.unpack_from('<I',blk_data,i)[0]
+        i += 4
+        tx_hashes = None
+        if save_tx_hashes:
+            tx_hashes = []
+            for _ in range(num_tx_hashes):
+                tx_hashes.append(TX_HASH_SCHEMA.unpack_from(blk_data,i))
+                i += TX_HASH_LEN
+        else:    
+            i += num_tx_hashes * TX_HASH_LEN
+
+        # get sub cache merkle roots
+        root_hash_len = struct.unpack_from('<I',blk_data,i)[0] * 32
+        i += 4
+        merkle_roots = None
+        if save_subcache_merkle_roots:
+            merkle_roots = SUBCACHE_MERKLE_ROOT_SCHEMA.unpack(blk_data[i:i+root_hash_len]) 
+        i += root_hash_len
+
+        yield {
+            'header':header,
+            'footer':footer,
+            'block_hash':block_hash,
+            'tx_hashes':tx_hashes,
+            'subcache_merkle_roots':merkle_roots
+        }
+
+
+def encode_block(block):
+    """Convert a block decoded with ``raw_keys=True`` to the default hex and base32 representation in place
+
+    Block and tx hashes are raw bytes in both representations, so only the
+    header and the transactions are touched.
+    """
+    encode_header(block['header'])
+    for tx in block['footer']['transactions']:
+        encode_tx(tx)
+    return block
+
+
+class LazyMapping(Mapping):
+    """Read-only mapping over a buffer that decodes its values on first access
+
+    Subclasses set ``_keys`` to the ordered tuple of keys they expose and
+    implement ``_decode(key)``, returning a dict of one or more decoded entries
+    which are cached together. Iteration order matches the dicts built by the
+    eager decoders, so ``dict(view)`` and msgpack output (see
+    :func:`pack_default`) are the same as for a fully decoded block.
+    """
+
+    def __getitem__(self,key):
+        try:
+            return self._decoded[key]
+        except KeyError:
+            if key not in self._keys:
+                raise
+        self._decoded.update(self._decode(key))
+        return self._decoded[key]
+
+    def __setitem__(self,key,value):
+        self[key] # decode the group first so it cannot overwrite value later
+        self._decoded[key] = value
+
+    def __contains__(self,key):
+        return key in self._keys
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self)!r})"
+
+
+class LazyBlock(LazyMapping):
+    """Lazy view of one stored block entry, see :func:`deserialize_block_data`
+
+    The header is decoded when first accessed, the footer is a
+    :class:`LazyFooter` and hashes and merkle roots are read on demand.
+    """
+
+    _keys = BLOCK_KEYS
+
+    def __init__(self,blk_data,i,save_subcache_merkle_roots=True,save_tx_hashes=True,raw_keys=False,tx_types=None):
+        self._decoded = {}
+        self.blk_data = blk_data
+        self.offset = i
+        self.save_subcache_merkle_roots = save_subcache_merkle_roots
+        self.save_tx_hashes = save_tx_hashes
+        self.raw_keys = raw_keys
+        self.tx_types = tx_types
+
+    def _decode(self,key):
+        i = self.offset
+        if key == 'header':
+            return {key: deserialize_header(self.blk_data[i:i+HEADER_LEN],self.raw_keys)}
+        header = self['header']
+        if key == 'footer':
+            return {key: LazyFooter(self.blk_data[i+HEADER_LEN:i+header['size']],header,self.raw_keys,self.tx_types)}
+
+        i += header['size']
+        block_hash = struct.unpack_from('<32s',self.blk_data,i)[0]
+        i += 64
+        num_tx_hashes = struct.unpack_from('<I',self.blk_data,i)[0]
+        tx_hashes = None
+        if self.save_tx_hashes:
+            tx_hashes = [TX_HASH_SCHEMA.unpack_from(self.blk_data,i+4+k*TX_HASH_LEN) for k in range(num_tx_hashes)]
+        i += 4 + num_tx_hashes * TX_HASH_LEN
+        root_hash_len = struct.unpack_from('<I',self.blk_data,i)[0] * 32
+        merkle_roots = None
+        if self.save_subcache_merkle_roots:
+            merkle_roots = SUBCACHE_MERKLE_ROOT_SCHEMA.unpack(self.blk_data[i+4:i+4+root_hash_len])
+        return {'block_hash':block_hash, 'tx_hashes':tx_hashes, 'subcache_merkle_roots':merkle_roots}
+
+
+class LazyFooter(LazyMapping):
+    """Lazy view of a block footer
+
+    Totals come from :func:`walk_footer_totals` and ``transactions`` is a list
+    of :class:`LazyTransaction` found by walking tx size prefixes, so no
+    payload is decoded until it is accessed.
+    """
+
+    def __init__(self,footer_data,header,raw_keys=False,tx_types=None):
+        try:
+            self.schema = FOOTER_SCHEMAS[header['type']]
+        except KeyError:
+            raise ValueError(f"Unknown Block Type Encountered: {header['type']}") from None
+        self._decoded = {}
+        self._keys = self.schema.keys + ('total_fee','statement_count','tx_count','transactions')
+        self.footer_data = footer_data
+        self.header = header
+        self.raw_keys = raw_keys
+        self.tx_types = tx_types
+
+    def _decode(self,key):
+        if key == 'transactions':
+            return {key: split_lazy_txs(self.footer_data,self.schema.size,len(self.footer_data),self.raw_keys,self.tx_types)[0]}
+        if key in self.schema.keys:
+            return self.schema.unpack_from(self.footer_data)
+        return walk_footer_totals(self.footer_data,self.header)
+
+
+class LazyTransaction(LazyMapping):
+    """Lazy view of a transaction or embedded transaction
+
+    Header fields are decoded together on first access and the payload only
+    when ``payload`` is accessed; aggregate payloads are
+    :class:`LazyAggregatePayload` views.
+    """
+
+    def __init__(self,tx_data,tx_id,embedded=False,raw_keys=False,tx_types=None):
+        self.schema = EMBED_TX_H_SCHEMA if embedded else TX_H_SCHEMA
+        self._decoded = {}
+        self._keys = self.schema.keys + ('id','payload')
+        self.tx_data = tx_data
+        self.tx_id = tx_id
+        self.raw_keys = raw_keys
+        self.tx_types = tx_types
+
+    def _decode(self,key):
+        if key == 'payload':
+            payload_data = self.tx_data[self.schema.size:]
+            if self['type'] in AGGREGATE_TX_TYPES:
+                payload = LazyAggregatePayload(payload_data,self['type'],self.raw_keys,self.tx_types)
+            elif tx_payload_selected(self['type'],self.tx_types):
+                payload = deserialize_tx_payload(payload_data,self['type'],self.raw_keys)
+            else:
+                payload = None
+            return {key: payload}
+        tx_header = self.schema.unpack_from(self.tx_data)
+        if not self.raw_keys:
+            if 'signature' in tx_header:
+                tx_header['signature'] = hexlify(tx_header['signature'])
+            tx_header['signer_public_key'] = hexlify(tx_header['signer_public_key'])
+        tx_header['type'] = hexlify(tx_header['type'][::-1])
+        tx_header['id'] = self.tx_id
+        return tx_header
+
+
+class LazyAggregatePayload(LazyMapping):
+    """Lazy view of an aggregate payload whose embedded transactions are :class:`LazyTransaction` views"""
+
+    def __init__(self,payload_data,payload_type,raw_keys=False,tx_types=None):
+        self.schema = TX_PAYLOAD_SCHEMAS[payload_type]
+        self._decoded = {}
+        self._keys = self.schema.keys + ('embedded_tx_count','embedded_transactions','cosignatures')
+        self.payload_data = payload_data
+        self.raw_keys = raw_keys
+        self.tx_types = tx_types
+
+    def _decode(self,key):
+        payload = self.schema.unpack_from(self.payload_data)
+        e_txs, i = split_lazy_txs(self.payload_data,40,8+payload['payload_size'],self.raw_keys,self.tx_types,embedded=True)
+        payload['embedded_tx_count'] = len(e_txs)
+        payload['embedded_transactions'] = e_txs
+        payload['cosignatures'] = bytes(self.payload_data[i:])
+        return payload
+
+
+def split_lazy_txs(data,i,end,raw_keys=False,tx_types=None,embedded=False):
+    """Split the size-prefixed txs between offsets i and end into :class:`LazyTransaction` views
+
+    Returns the list of views, numbered from 1, and the padded offset past the last tx.
+    """
+    txs = []
+    while i < end:
+        tx_size = struct.unpack_from('<I',data,i)[0]
+        txs.append(LazyTransaction(data[i:i+tx_size],len(txs)+1,embedded,raw_keys,tx_types))
+        i += tx_size + (8 - tx_size) %8
+    return txs, i
+
+
+def pack_default(obj):
+    """msgpack ``default`` hook packing lazy views as the dicts they stand for"""
+    if isinstance(obj,Mapping):
+        return dict(obj)
+    raise TypeError(f"Cannot serialize {type(obj)}")
+
+
+def block_entry_end(blk_data, i):
+    """Return the offset just past the stored block entry starting at offset i
+
+    Only the size prefixes of the block, its tx hashes and its subcache merkle
+    roots are read.
+    """
+    i += struct.unpack_from('<I',blk_data,i)[0] + 64
+    i += 4 + struct.unpack_from('<I',blk_data,i)[0] * TX_HASH_LEN
+    i += 4 + struct.unpack_from('<I',blk_data,i)[0] * 32
+    return i
+
+
+def block_entry_height(blk_data, i):
+    """Return the height stored in the header of the block entry starting at offset i"""
+    return struct.unpack_from('<Q',blk_data,i+HEADER_HEIGHT_OFFSET)[0]
+
+
+def deserialize_header_columns_data(blk_data, db_offset_bytes=DB_OFFSET_BYTES):
+    """Decode every block header of a block file at once into header table columns
+
+    Header offsets are gathered with :func:`block_entry_end`, then all headers
+    are gathered into one array viewed through HEADER_DTYPE so each field is
+    converted column-wise instead of record by record.
+
+    Parameters
+    ----------
+    blk_data: bytes or memoryview
+        Byte array containing the full contents of a block file
+    db_offset_bytes: int, optional
+        Number of pad bytes to be ignored at the head of the block file
+
+    Returns
+    -------
+    columns: dict
+        Dict mapping the keys of :func:`get_block_stats` records to arrays
+
+    """
+    blk_data = memoryview(blk_data)
+    offsets = []
+    i = db_offset_bytes
+    while i < len(blk_data):
+        offsets.append(i)
+        i = block_entry_end(blk_data, i)
+    offsets = np.array(offsets,dtype=np.int64)
+
+    raw = np.frombuffer(blk_data,dtype=np.uint8)
+    headers = raw[offsets[:,None] + np.arange(HEADER_LEN)].view(HEADER_DTYPE).ravel()
+
+    columns = {}
+    for k,v in HEADER_FORMAT.items():
+        if k == 'type':
+            columns[k] = hexlify_rows(headers[k][:,::-1])
+        elif k == 'beneficiary_address':
+            columns[k] = np.array(encode_address_rows(headers[k]),dtype=object)
+        elif v[-1] == 's':
+            columns[k] = hexlify_rows(headers[k])
+        else:
+            columns[k] = headers[k].astype(np.int64)
+    columns['harvester'] = np.array([public_key_to_address(key.tobytes()) for key in headers['signer_public_key']],dtype=object)
+
+    totals = [
+        walk_footer_totals(blk_data[offset+HEADER_LEN:offset+size],{'type':block_type,'fee_multiplier':fee_multiplier})
+        for offset,size,block_type,fee_multiplier in zip(
+            offsets.tolist(),columns['size'].tolist(),columns['type'],columns['fee_multiplier'].tolist())]
+    for k in ('statement_count','tx_count','total_fee'):
+        columns[k] = np.array([t[k] for t in totals],dtype=np.int64)
+
+    return columns
+
+
+def deserialize_header_columns_files(paths, db_offset_bytes=DB_OFFSET_BYTES):
+    """Decode header table columns for a list of block files, returning one dict of columns per file"""
+    return [deserialize_header_columns_data(map_store_file(path), db_offset_bytes) for path in paths]
+
+
+def deserialize_block_files(paths, db_offset_bytes=DB_OFFSET_BYTES, start=None, stop=None, **kwargs):
+    """Fully deserialize a list of block files, returning one list of blocks per file
+
+    Top-level so that it can be shipped to worker processes; only the part of
+    each file between the `start` and `stop` cursors is decoded (see
+    :func:`map_store_span`) and keyword arguments are forwarded to
+    :func:`deserialize_block_data`.
+    """
+    file_blocks = []
+    for path in paths:
+        blk_data = map_store_span(path, start, stop, db_offset_bytes)
+        if blk_data is None:
+            file_blocks.append([])
+            continue
+        file_blocks.append(list(deserialize_block_data(blk_data, db_offset_bytes=0, **kwargs)))
+    return file_blocks
+
+
+def deserialize_block_files_into_state(paths, state_cls, db_offset_bytes=DB_OFFSET_BYTES, start=None, stop=None, **kwargs):
+    """Deserialize block files as :func:`deserialize_block_files` does, also building the partial state map of their blocks
+
+    Returns the blocks of each file and the partial map, see :meth:`XYMStateMap.merge`.
+    """
+    file_blocks = deserialize_block_files(paths, db_offset_bytes, start, stop, **kwargs)
+    state_map = state_cls(raw_keys=kwargs.get('raw_keys', False))
+    for blocks in file_blocks:
+        for block in blocks:
+            state_map.insert_block(block)
+    return file_blocks, state_map
+
+
+def deserialize_blocks(block_paths, save_subcache_merkle_roots=True, db_offset_bytes=DB_OFFSET_BYTES, save_tx_hashes=True, workers=1, raw_keys=False, lazy=False, tx_types=None, start=None, stop=None, state_map=None):
+    """Generator accepting block paths and yielding deserialized blocks in height order
+
+    Parameters
+    ----------
+    block_paths: tqdm
+        Progress-wrapped list of block files as produced by :func:`get_block_paths`
+    save_subcache_merkle_roots: bool, optional
+        Whether to deserialize and keep subcache merkle roots
+    db_offset_bytes: int, optional
+        Number of pad bytes to be ignored at the head of each block file
+    save_tx_hashes: bool, optional
+        Whether to deserialize and keep transaction hashes
+    workers: int, optional
+        Number of worker processes; with more than one, whole files are decoded
+        in a process pool and blocks are yielded in the same order as serially
+    raw_keys: bool, optional
+        Keep keys, hashes and addresses as raw bytes until :func:`encode_block`
+        is applied, e.g. right before writing output
+    lazy: bool, optional
+        Yield :class:`LazyBlock` views over the mapped files; since these are
+        decoded on access in this process, `workers` is ignored
+    tx_types: collection of bytes, optional
+        Only decode the payloads of these tx types, e.g. ``{b'4154'}``; other
+        txs are yielded with a ``None`` payload, see :func:`deserialize_footer`
+    start, stop: tuple, optional
+        (path, offset) cursors delimiting the blocks to decode, see
+        :func:`map_store_span`
+    state_map: XYMStateMap, optional
+        State map to insert the blocks into before they are yielded; with
+        more than one worker, each pool task also builds the partial state map
+        of its files and these are merged into `state_map` in height order
+
+    Yields
+    ------
+    block: dict or LazyBlock
+        Dict containing deserialized header, footer, hashes and merkle roots
+
+    """
+    kwargs = {
+        'save_subcache_merkle_roots': save_subcache_merkle_roots,
+        'save_tx_hashes': save_tx_hashes,
+        'raw_keys': raw_keys,
+        'lazy': lazy,
+        'tx_types': tx_types}
+
+    if workers > 1 and not lazy:
+        paths = list(getattr(block_paths, 'iterable', block_paths))
+        groups = group_paths_by_size(paths, workers)
+        if state_map is None:
+            results = ordered_pool_map(deserialize_block_files, groups, workers, db_offset_bytes=db_offset_bytes, start=start, stop=stop, **kwargs)
+        else:
+            results = (merge_partial_state(state_map, *result) for result in ordered_pool_map(
+                deserialize_block_files_into_state, groups, workers, state_cls=type(state_map), db_offset_bytes=db_offset_bytes, start=start, stop=stop, **kwargs))
+        for path, blocks in zip(block_paths, itertools.chain.from_iterable(results)):
+            block_paths.set_description(f"processing block file: {path}")
+            yield from blocks
+        return
+
     for path in block_paths:
         
         block_paths.set_description(f"processing block file: {path}")
 
-        with open(path,mode='rb') as f:
-            blk_data = f.read()
+        blk_data = map_store_span(path, start, stop, db_offset_bytes)
+        if blk_data is None:
+            continue
         
-        i = db_offset_bytes
-
-        while i < len(blk_data):
-
-            # get fixed length data
-            header = deserialize_header(blk_data[i:i+HEADER_LEN])
-            footer = deserialize_footer(blk_data[i+HEADER_LEN:i+header['size']],header)
-            i += header['size']
-            block_hash, generation_hash = struct.unpack('<32s32s',blk_data[i:i+64])
-            i += 64
-
-            # get transaction hashes
-            num_tx_hashes = struct.unpack('I',blk_data[i:i+4])[0]
-            i += 4
-            tx_hashes = None
-            if save_tx_hashes:
-                tx_hashes = []
-                for _ in range(num_tx_hashes):
-                    tx_hashes.append(fmt_unpack(blk_data[i:i+TX_HASH_LEN],TX_HASH_FORMAT))
-                    i += TX_HASH_LEN
-            else:    
-                i += num_tx_hashes * TX_HASH_LEN
-
-            # get sub cache merkle roots
-            root_hash_len = struct.unpack('I',blk_data[i:i+4])[0] * 32
-            i += 4
-            merkle_roots = None
-            if save_subcache_merkle_roots:
-                merkle_roots = fmt_unpack(blk_data[i:i+root_hash_len],SUBCACHE_MERKLE_ROOT_FORMAT) 
-            i += root_hash_len
-
-            yield {
-                'header':header,
-                'footer':footer,
-                'block_hash':block_hash,
-                'tx_hashes':tx_hashes,
-                'subcache_merkle_roots':merkle_roots
-            }
+        for block in deserialize_block_data(blk_data, db_offset_bytes=0, **kwargs):
+            if state_map is not None:
+                state_map.insert_block(block)
+            yield block
+
+
+def deserialize_header_columns(block_paths, db_offset_bytes=DB_OFFSET_BYTES, workers=1):
+    """Decode the header table of a block store into columns without decoding any payloads
+
+    Parameters
+    ----------
+    block_paths: tqdm
+        Progress-wrapped list of block files as produced by :func:`get_block_paths`
+    db_offset_bytes: int, optional
+        Number of pad bytes to be ignored at the head of each block file
+    workers: int, optional
+        Number of worker processes used to decode block files
+
+    Returns
+    -------
+    columns: dict
+        Dict mapping the keys of :func:`get_block_stats` records to arrays
+        holding one entry per block in height order
+
+    """
+    file_columns = []
+    if workers > 1:
+        paths = list(getattr(block_paths, 'iterable', block_paths))
+        groups = group_paths_by_size(paths, workers)
+        results = itertools.chain.from_iterable(
+            ordered_pool_map(deserialize_header_columns_files, groups, workers, db_offset_bytes=db_offset_bytes))
+        for path, columns in zip(block_paths, results):
+            block_paths.set_description(f"processing block file: {path}")
+            file_columns.append(columns)
+    else:
+        for path in block_paths:
+            block_paths.set_description(f"processing block file: {path}")
+            file_columns.append(deserialize_header_columns_data(map_store_file(path), db_offset_bytes))
+
+    if not file_columns:
+        return {}
+    return {k:np.concatenate([columns[k] for columns in file_columns]) for k in file_columns[0]}
 
 
 def get_block_stats(block):
@@ -1000,52 +1973,644 @@ def get_block_paths(block_dir, block_extension):
     return block_paths
 
 
+def save_header_df(block_stats, header_save_path, append=False):
+    """Build the header DataFrame from flattened block stats and pickle it
+
+    block_stats is either a list of :func:`get_block_stats` records or a dict
+    of columns as produced by :func:`deserialize_header_columns`. With
+    `append`, the rows are added to the table already saved at
+    header_save_path, if any.
+    """
+    # TODO: convert all fields to efficient string representations so header df can be stored as csv instead of pickle
+    if isinstance(block_stats, dict):
+        header_df = pd.DataFrame(block_stats)
+    else:
+        header_df = pd.DataFrame.from_records(block_stats)
+    previous_df = None
+    if append:
+        if os.path.exists(header_save_path):
+            previous_df = pd.read_pickle(header_save_path)
+        if not len(header_df): # nothing new to add
+            return previous_df
+        if previous_df is not None:
+            # rows saved past the last checkpoint by an interrupted run are replaced
+            previous_df = previous_df[previous_df['height'] < header_df['height'].min()]
+    header_df['dateTime'] = pd.to_datetime(header_df['timestamp'],origin=pd.to_datetime('2021-03-16 00:06:25'),unit='ms')
+    header_df = header_df.set_index('dateTime')
+    if previous_df is not None:
+        header_df = pd.concat([previous_df, header_df])
+    header_df = header_df.sort_index(axis=0)
+    header_df.to_pickle(header_save_path)
+    return header_df
+
+
+# number of store files a HeightIndex keeps mapped at once
+INDEX_MAPPED_FILES = 4
+
+INDEX_DTYPE = np.dtype([('height','<u8'),('file','<u4'),('offset','<u8'),('size','<u4')])
+
+class HeightIndex():
+    """Mapping from block height to the location of its entry in a block or statement store
+
+    Parameters
+    ----------
+    paths: list[str]
+        Store files referenced by the index
+    entries: np.ndarray
+        Array of :data:`INDEX_DTYPE` records (height, file number in `paths`,
+        byte offset, byte size), sorted by height
+
+    Notes
+    -----
+    Files are memory mapped on first access and the INDEX_MAPPED_FILES most
+    recently read are kept open, so repeated reads only slice the mapped file
+    while reads across a wide height range do not hold every file open; see
+    :func:`read_block`.
+    """
+
+    def __init__(self,paths,entries):
+        self.paths = list(paths)
+        self.entries = entries
+        self._maps = collections.OrderedDict()
+
+
+    @classmethod
+    def build(cls,paths,entry_end,height_at=None,db_offset_bytes=DB_OFFSET_BYTES):
+        """Build an index by walking the size prefixes of every entry in a list of store files
+
+        Parameters
+        ----------
+        paths: list[str]
+            Store files in height order
+        entry_end: callable
+            ``entry_end(data, i)`` returning the offset past the entry at `i`,
+            e.g. :func:`block_entry_end` or :func:`statement_entry_end`
+        height_at: callable, optional
+            ``height_at(data, i)`` returning the height of the entry at `i`;
+            by default heights are counted from the file's start height
+        db_offset_bytes: int, optional
+            Number of pad bytes at the head of each store file
+        """
+        paths = list(paths)
+        records = []
+        for file_number, path in enumerate(paths):
+            data = map_store_file(path)
+            height = statement_file_start_height(path, db_offset_bytes)
+            i = db_offset_bytes
+            while i < len(data):
+                end = entry_end(data, i)
+                if height_at is not None:
+                    height = height_at(data, i)
+                records.append((height, file_number, i, end - i))
+                height += 1
+                i = end
+        entries = np.array(records, dtype=INDEX_DTYPE)
+        return cls(paths, entries[np.argsort(entries['height'], kind='stable')])
+
+
+    @classmethod
+    def read_npz(cls,index_path):
+        """Load an index written by :meth:`to_npz`; relative store paths are resolved against the index location"""
+        with np.load(index_path) as f:
+            paths = [os.path.normpath(os.path.join(os.path.dirname(index_path), p)) for p in f['paths'].tolist()]
+            return cls(paths, f['entries'])
+
+
+    def to_npz(self,index_path):
+        """Write the index to a compact npz file, storing paths relative to its location"""
+        paths = [os.path.relpath(p, os.path.dirname(index_path) or '.') for p in self.paths]
+        with open(index_path, 'wb') as f:
+            np.savez(f, paths=np.array(paths), entries=self.entries)
+
+
+    def __len__(self):
+        return len(self.entries)
+
+
+    def __contains__(self,height):
+        k = np.searchsorted(self.entries['height'], height)
+        return k < len(self.entries) and self.entries['height'][k] == height
+
+
+    def locate(self,height):
+        """Return the (path, offset, size) of the entry stored for a height"""
+        k = np.searchsorted(self.entries['height'], height)
+        if k == len(self.entries) or self.entries['height'][k] != height:
+            raise KeyError(height)
+        _, file_number, offset, size = self.entries[k].tolist()
+        return self.paths[file_number], offset, size
+
+
+    def entry_data(self,height):
+        """Return a memoryview of the stored entry for a height"""
+        path, offset, size = self.locate(height)
+        if path in self._maps:
+            self._maps.move_to_end(path)
+        else:
+            if len(self._maps) >= INDEX_MAPPED_FILES:
+                # the mapping, and its file descriptor, is released once
+                # entries previously returned from it are dropped
+                self._maps.popitem(last=False)
+            self._maps[path] = map_store_file(path)
+        return self._maps[path][offset:offset+size]
+
+
+def build_block_index(block_paths, db_offset_bytes=DB_OFFSET_BYTES):
+    """Build a :class:`HeightIndex` over block files, taking heights from the stored headers"""
+    return HeightIndex.build(block_paths, block_entry_end, block_entry_height, db_offset_bytes)
+
+
+def build_statement_index(statement_paths, db_offset_bytes=DB_OFFSET_BYTES):
+    """Build a :class:`HeightIndex` over statement files, counting heights from each file's position"""
+    return HeightIndex.build(statement_paths, statement_entry_end, db_offset_bytes=db_offset_bytes)
+
+
+def read_block(height, block_index, **kwargs):
+    """Decode the block at a height straight from its indexed location
+
+    Keyword arguments are forwarded to :func:`deserialize_block_data`, e.g.
+    ``lazy=True`` to only decode what is accessed.
+    """
+    return next(deserialize_block_data(block_index.entry_data(height), db_offset_bytes=0, **kwargs))
+
+
+def read_blocks(start, end, block_index, **kwargs):
+    """Generator yielding the indexed blocks with heights in [start, end), see :func:`read_block`"""
+    heights = block_index.entries['height']
+    for height in heights[np.searchsorted(heights, start):np.searchsorted(heights, end)].tolist():
+        yield read_block(height, block_index, **kwargs)
+
+
+def read_statements(height, statement_index, **kwargs):
+    """Decode the statements of the block at a height straight from their indexed location
+
+    Keyword arguments are forwarded to :func:`deserialize_statement_data`.
+    """
+    return next(deserialize_statement_data(statement_index.entry_data(height), height, 0, **kwargs))[1]
+
+
+def pair_store_groups(block_paths, statement_paths, workers):
+    """Split block files into consecutive groups of similar size and pair each file with its statement file
+
+    Returns groups of (block path, statement path) pairs covering consecutive
+    heights; either path is None where one store has no file for the other's
+    heights, e.g. while the statement store lags behind.
+    """
+    def file_key(path):
+        return os.path.basename(os.path.dirname(path)), os.path.basename(path)[:5]
+
+    statements = {file_key(path): path for path in statement_paths}
+    groups = [[(path, statements.pop(file_key(path), None)) for path in group] for group in group_paths_by_size(block_paths, workers)]
+    if len(statements):
+        groups.append([(None, path) for path in sorted(statements.values())])
+    return groups
+
+
+def build_partial_state(paths, state_cls=XYMStateMap, raw_keys=False, tx_types=None, receipt_types=None, db_offset_bytes=DB_OFFSET_BYTES):
+    """Build the partial state map of some consecutive block and statement files
+
+    Top-level so that it can be shipped to worker processes; `paths` holds
+    (block path, statement path) pairs as produced by :func:`pair_store_groups`.
+    See :meth:`XYMStateMap.merge` for how partial maps combine.
+    """
+    state_map = state_cls(raw_keys=raw_keys)
+    for block_path, statement_path in paths:
+        if block_path is not None:
+            blocks, = deserialize_block_files(
+                [block_path], db_offset_bytes, save_subcache_merkle_roots=False, save_tx_hashes=False, raw_keys=raw_keys, tx_types=tx_types)
+            for block in blocks:
+                state_map.insert_block(block)
+        if statement_path is not None:
+            statements, = deserialize_statement_files(
+                [statement_path], db_offset_bytes, raw_keys=raw_keys, skip_resolutions=True, receipt_types=receipt_types)
+            insert_statements(state_map, statements)
+    return state_map
+
+
+def build_state(block_paths, statement_paths, workers=1, state_cls=XYMStateMap, raw_keys=False, tx_types=None, receipt_types=None, db_offset_bytes=DB_OFFSET_BYTES):
+    """Build the state map of a block store, decoding and inserting in parallel
+
+    Files are split into consecutive groups as for decoding; each worker
+    builds the partial state map of a group with :func:`build_partial_state`
+    and the partial maps are merged in height order as they arrive, see
+    :meth:`XYMStateMap.merge`. Only the payloads the state map handles are
+    decoded.
+
+    Parameters
+    ----------
+    block_paths: list
+        Block files, as produced by :func:`get_block_paths`
+    statement_paths: list
+        Statement files, as produced by :func:`get_statement_paths`
+    workers: int, optional
+        Number of worker processes
+    state_cls: type, optional
+        State map class to build
+    raw_keys: bool, optional
+        Decode with raw keys, see :class:`XYMStateMap`
+    tx_types: set, optional
+    receipt_types: set, optional
+        Further restrict the decoded types, see :func:`deserialize_blocks` and
+        :func:`deserialize_statements`
+
+    """
+    block_paths = list(getattr(block_paths, 'iterable', block_paths))
+    tx_types = frozenset(state_cls.TX_HANDLERS) & (tx_types if tx_types is not None else frozenset(state_cls.TX_HANDLERS))
+    receipt_types = frozenset(state_cls.RX_HANDLERS) & (receipt_types if receipt_types is not None else frozenset(state_cls.RX_HANDLERS))
+    kwargs = {
+        'state_cls': state_cls,
+        'raw_keys': raw_keys,
+        'tx_types': tx_types,
+        'receipt_types': receipt_types,
+        'db_offset_bytes': db_offset_bytes}
+
+    groups = pair_store_groups(block_paths, statement_paths, workers)
+    if workers <= 1:
+        return build_partial_state([pair for group in groups for pair in group], **kwargs)
+
+    state_map = state_cls(raw_keys=raw_keys)
+    for partial_state_map in ordered_pool_map(build_partial_state, groups, workers, **kwargs):
+        state_map.merge(partial_state_map)
+    return state_map
+
+
+def snapshot_path(snapshot_dir, height):
+    """Path of the state snapshot taken at a height"""
+    return os.path.join(snapshot_dir, f'state_{height:012}.msgpack')
+
+
+def find_snapshot(snapshot_dir, height):
+    """Find the latest state snapshot at or below a height
+
+    Returns
+    -------
+    snapshot_height: int
+        Height of the snapshot, 0 if there is none
+    path: str
+        Path of the snapshot, None if there is none
+    """
+    snapshot_height, path = 0, None
+    for candidate in glob.glob(os.path.join(snapshot_dir, 'state_*.msgpack')):
+        match = re.fullmatch(r'state_(\d+)\.msgpack', os.path.basename(candidate))
+        if match and snapshot_height < int(match[1]) <= height:
+            snapshot_height, path = int(match[1]), candidate
+    return snapshot_height, path
+
+
+def write_snapshots(state_map, snapshot_dir, snapshot_every, start_height, end_height):
+    """Write state snapshots at the multiples of `snapshot_every` in (start_height, end_height]
+
+    Snapshots are indexed state files, see :meth:`XYMStateMap.write_snapshot`,
+    so each can be loaded on its own. Returns the heights written.
+    """
+    heights = list(range((start_height // snapshot_every + 1) * snapshot_every, end_height + 1, snapshot_every))
+    if len(heights):
+        os.makedirs(snapshot_dir, exist_ok=True)
+    for height in heights:
+        state_map.write_snapshot(snapshot_path(snapshot_dir, height), height)
+    return heights
+
+
+def load_state_at(height, snapshot_dir, block_index, statement_index, state_cls=XYMStateMap, raw_keys=False, tx_types=None, receipt_types=None):
+    """Rebuild the state map as of a height from the nearest snapshot at or below it
+
+    Only the blocks and receipts between the snapshot and `height` are decoded,
+    straight from their indexed locations; without a snapshot the whole chain
+    up to `height` is replayed.
+
+    Parameters
+    ----------
+    height: int
+        Height of the state to rebuild
+    snapshot_dir: str
+        Directory holding snapshots written by :func:`write_snapshots`
+    block_index: HeightIndex
+        Index of the block store, see :func:`build_block_index`
+    statement_index: HeightIndex
+        Index of the statement store, see :func:`build_statement_index`
+    state_cls: type, optional
+        State map class to build
+    raw_keys: bool, optional
+        Decode with raw keys, see :class:`XYMStateMap`
+    tx_types: set, optional
+    receipt_types: set, optional
+        Types whose payloads are decoded, see :func:`deserialize_blocks` and
+        :func:`deserialize_statements`; must cover the types the state map handles
+
+    """
+    snapshot_height, path = find_snapshot(snapshot_dir, height)
+    if path is None:
+        state_map = state_cls(raw_keys=raw_keys)
+    else:
+        state_map = state_cls.read_msgpack(path, raw_keys=raw_keys)
+
+    for block in read_blocks(snapshot_height + 1, height + 1, block_index, raw_keys=raw_keys, tx_types=tx_types):
+        state_map.insert_block(block)
+
+    heights = statement_index.entries['height']
+    for h in heights[np.searchsorted(heights, snapshot_height + 1):np.searchsorted(heights, height + 1)].tolist():
+        stmts = read_statements(h, statement_index, raw_keys=raw_keys, skip_resolutions=True, receipt_types=receipt_types)
+        for stmt in stmts['transaction_statements']:
+            for rx in stmt['receipts']:
+                state_map.insert_rx(rx, h)
+    return state_map
+
+
+def extract_blocks(args, block_paths, state_map, f_blocks, start=None, stop=None):
+    """Decode the blocks between two store cursors into the state map, unless None, and the block stream
+
+    With `args.parallel_state` the decoding workers insert the blocks into
+    partial state maps merged into `state_map`, see :func:`deserialize_blocks`.
+    Returns the :func:`get_block_stats` records of the decoded blocks.
+    """
+    blocks = deserialize_blocks(
+        block_paths,
+        args.save_subcache_merkle_roots,
+        workers=args.workers,
+        raw_keys=args.raw_keys,
+        tx_types=args.tx_types,
+        start=start,
+        stop=stop,
+        state_map=state_map if args.parallel_state else None)
+    block_stats = []
+    for block in blocks:
+        if state_map is not None and not args.parallel_state:
+            state_map.insert_block(block)
+        if args.raw_keys:
+            encode_block(block)
+        f_blocks.write(msgpack.packb(block, use_bin_type=True, default=pack_default))
+        block_stats.append(get_block_stats(block))
+    return block_stats
+
+
+def extract_statements(args, statement_paths, state_map, f_statements, start=None, stop=None, start_height=1):
+    """Decode the statements between two store cursors into the state map, unless None, and the statement stream
+
+    With `args.parallel_state` the receipts reach `state_map` through the
+    decoding workers, as for :func:`extract_blocks`. Returns the height of the
+    last statements decoded, or ``start_height - 1`` if there were none.
+    """
+    statements = deserialize_statements(
+        statement_paths,
+        workers=args.workers,
+        raw_keys=args.raw_keys,
+        skip_resolutions=args.skip_resolution_statements,
+        receipt_types=args.receipt_types,
+        start=start,
+        stop=stop,
+        start_height=start_height,
+        state_map=state_map if args.parallel_state else None)
+
+    height = start_height - 1
+    for height, stmts, s_path in statements:
+        if state_map is not None and not args.parallel_state:
+            insert_statements(state_map, [(height, stmts)])
+        if args.raw_keys:
+            encode_statements(stmts)
+
+        f_statements.write(msgpack.packb((height, stmts,), use_bin_type=True)) 
+    return height
+
+
+def extract_increment(args, state_map, checkpoint, f_blocks, f_statements):
+    """Extract everything appended to the block and statement stores since a checkpoint
+
+    Stores are re-listed so new files are picked up, and each is decoded up to
+    its last complete entry, see :func:`store_end_cursor`.
+
+    Returns
+    -------
+    block_stats: list
+        :func:`get_block_stats` records of the new blocks
+    checkpoint: dict
+        Checkpoint past the extracted data, without output stream offsets
+    """
+    block_paths = get_block_paths(args.block_dir, args.block_extension)
+    statement_paths = get_statement_paths(block_dir=args.block_dir, statement_extension=args.statement_extension)
+    block_start, statement_start = checkpoint['block_cursor'], checkpoint['statement_cursor']
+    block_stop = store_end_cursor(block_paths.iterable, block_entry_end, block_start, args.db_offset_bytes)
+    statement_stop = store_end_cursor(statement_paths, statement_entry_end, statement_start, args.db_offset_bytes)
+
+    block_stats = extract_blocks(args, block_paths, state_map, f_blocks, block_start, block_stop)
+    statement_height = extract_statements(
+        args, statement_paths, state_map, f_statements, statement_start, statement_stop, checkpoint['statement_height'] + 1)
+
+    return block_stats, {
+        'block_height': block_stats[-1]['height'] if len(block_stats) else checkpoint['block_height'],
+        'block_cursor': block_stop,
+        'statement_height': statement_height,
+        'statement_cursor': statement_stop,
+        'snapshot_height': checkpoint.get('snapshot_height', 0),
+        'state_serial': checkpoint.get('state_serial', 0)}
+
+
+def open_output_stream(path, offset=None):
+    """Open a msgpack output stream, for appending at `offset` if given
+
+    Anything past `offset`, i.e. written after the last checkpoint by an
+    interrupted run, is truncated away first. A stream missing or shorter
+    than `offset` cannot be resumed and raises ValueError.
+    """
+    if offset is None:
+        return open(path, 'wb')
+    if not os.path.exists(path) or os.path.getsize(path) < offset:
+        raise ValueError(f"cannot resume {path} at checkpoint offset {offset}, it is missing or shorter; remove the checkpoint to extract from scratch")
+    f = open(path, 'ab')
+    f.truncate(offset)
+    return f
+
+
+def save_increment(args, state_map, block_stats, checkpoint, f_blocks, f_statements):
+    """Save the header table, the state map, any due snapshots and finally the checkpoint of an incremental run
+
+    The state map is first written beside its path, to the path named by the
+    checkpoint's `state_serial`, and only moved onto it once the checkpoint is
+    written; see :func:`resume_state`. Returns the checkpoint written.
+    """
+    f_blocks.flush()
+    f_statements.flush()
+    save_header_df(block_stats, args.header_save_path, append=True)
+    checkpoint = dict(checkpoint,
+        block_save_offset=f_blocks.tell(),
+        statement_save_offset=f_statements.tell(),
+        state_serial=checkpoint.get('state_serial', 0) + 1)
+    pending_path = pending_state_path(args.state_save_path, checkpoint)
+    state_map.to_msgpack(pending_path, indexed=args.indexed_state, chunk_size=args.state_chunk_size)
+    if args.snapshot_every:
+        # the state is only complete up to the lower of the two heights
+        snapshot_height = min(checkpoint['block_height'], checkpoint['statement_height'])
+        write_snapshots(state_map, args.snapshot_dir, args.snapshot_every, checkpoint['snapshot_height'], snapshot_height)
+        checkpoint['snapshot_height'] = max(snapshot_height, checkpoint['snapshot_height'])
+    write_checkpoint(args.checkpoint_path, checkpoint, args.block_dir)
+    os.replace(pending_path, args.state_save_path)
+    return checkpoint
+
+
+def pending_state_path(state_save_path, checkpoint):
+    """Path the state map saved with a checkpoint is written to before being moved onto `state_save_path`"""
+    return f"{state_save_path}.{checkpoint['state_serial']}"
+
+
+def resume_state(state_save_path, checkpoint):
+    """Move the state map saved with a checkpoint onto its path if a run stopped before doing so
+
+    A state map written by a run which stopped before its checkpoint was
+    written carries the serial of a checkpoint that does not exist yet and is
+    left alone, so the state at `state_save_path` always matches the
+    checkpoint.
+    """
+    if 'state_serial' in checkpoint:
+        pending_path = pending_state_path(state_save_path, checkpoint)
+        if os.path.exists(pending_path):
+            os.replace(pending_path, state_save_path)
+
+
+def follow(args, state_map, checkpoint, f_blocks, f_statements):
+    """Poll the stores for appended data until interrupted, see :func:`extract_increment`
+
+    New blocks and statements reach the state map and the msgpack streams at
+    every poll; the header table, state map and checkpoint are saved at most
+    every `args.save_interval` seconds and once more when polling stops, by
+    `args.max_polls` or an interrupt while waiting; an interrupt during a
+    poll leaves everything at the last checkpoint written. Polls usually
+    find only a few new blocks, so they are decoded in this process whatever
+    `args.workers` is, rather than through a fresh process pool each time.
+    """
+    poll_args = argparse.Namespace(**{**vars(args), 'workers': 1})
+    block_stats = []
+    last_save = time.monotonic()
+    polls = 0
+    while args.max_polls is None or polls < args.max_polls:
+        try:
+            time.sleep(args.poll_interval)
+        except KeyboardInterrupt:
+            break
+        polls += 1
+        try:
+            new_block_stats, checkpoint = extract_increment(poll_args, state_map, checkpoint, f_blocks, f_statements)
+            f_blocks.flush()
+            f_statements.flush()
+            if len(new_block_stats):
+                block_stats.extend(new_block_stats)
+                print(f"extracted blocks up to height {checkpoint['block_height']}")
+            if len(block_stats) and time.monotonic() - last_save >= args.save_interval:
+                checkpoint = save_increment(args, state_map, block_stats, checkpoint, f_blocks, f_statements)
+                block_stats = []
+                last_save = time.monotonic()
+        except KeyboardInterrupt:
+            # the state map and the streams may hold part of this poll, so
+            # nothing is saved and the streams are cut back to the last
+            # checkpoint written, which the next run resumes from
+            checkpoint = read_checkpoint(args.checkpoint_path, args.block_dir)
+            f_blocks.truncate(checkpoint['block_save_offset'])
+            f_statements.truncate(checkpoint['statement_save_offset'])
+            print(f"interrupted during a poll, resume from the checkpoint at height {checkpoint['block_height']} in {args.checkpoint_path}")
+            return
+    save_increment(args, state_map, block_stats, checkpoint, f_blocks, f_statements)
+    print(f"checkpoint at height {checkpoint['block_height']} written to {args.checkpoint_path}")
+
+
 def main(args):
     if args.quiet:
         globals()['tqdm'] = functools.partial(tqdm, disable=True)
 
     block_paths = get_block_paths(args.block_dir, args.block_extension)
-    blocks = deserialize_blocks(block_paths, args.save_subcache_merkle_roots)
-    block_stats = []
-    state_map = XYMStateMap()
+    statement_paths = get_statement_paths(block_dir=args.block_dir, statement_extension=args.statement_extension)
+
+    if args.save_index:
+        build_block_index(block_paths.iterable, args.db_offset_bytes).to_npz(args.block_index_path)
+        build_statement_index(statement_paths, args.db_offset_bytes).to_npz(args.statement_index_path)
+        print(f"height indexes written to {args.block_index_path} and {args.statement_index_path}")
+
+    if args.headers_only:
+        save_header_df(deserialize_header_columns(block_paths, workers=args.workers), args.header_save_path)
+        print(f"header data written to {args.header_save_path}")
+        print("exiting . . .")
+        return
+
+    state_cls = CompactXYMStateMap if args.compact_state else XYMStateMap
+
+    if args.incremental or args.follow:
+        # decode only what lies between the checkpointed cursors and the last
+        # complete entries of each store, appending to prior output
+        checkpoint = read_checkpoint(args.checkpoint_path, args.block_dir)
+        if checkpoint is None:
+            checkpoint = {'block_height': 0, 'block_cursor': None, 'statement_height': 0, 'statement_cursor': None}
+            state_map = state_cls(raw_keys=args.raw_keys)
+        else:
+            resume_state(args.state_save_path, checkpoint)
+            state_map = state_cls.read_msgpack(args.state_save_path, raw_keys=args.raw_keys)
+
+        with open_output_stream(args.block_save_path, checkpoint.get('block_save_offset')) as f_blocks, \
+                open_output_stream(args.statement_save_path, checkpoint.get('statement_save_offset')) as f_statements:
+            block_stats, checkpoint = extract_increment(args, state_map, checkpoint, f_blocks, f_statements)
+            checkpoint = save_increment(args, state_map, block_stats, checkpoint, f_blocks, f_statements)
+            print(f"checkpoint at height {checkpoint['block_height']} written to {args.checkpoint_path}")
+            if args.follow:
+                follow(args, state_map, checkpoint, f_blocks, f_statements)
+
+        print("exiting . . .")
+        return
+
+    state_map = state_cls(raw_keys=args.raw_keys)
 
     with open(args.block_save_path, 'wb') as f_blocks:
-        for block in blocks:
-            state_map.insert_block(block)
-            f_blocks.write(msgpack.packb(block, use_bin_type=True))
-            block_stats.append(get_block_stats(block))
+        block_stats = extract_blocks(args, block_paths, state_map, f_blocks)
     
     print("block data extraction complete!\n")
     print(f"block data written to {args.block_save_path}")
 
-    statements = deserialize_statements(get_statement_paths(block_dir=args.block_dir, statement_extension=args.statement_extension))
-
     with open(args.statement_save_path, 'wb') as f_statements:
-        for height, stmts, s_path in statements:
-            for stmt in stmts['transaction_statements']:
-                for rx in stmt['receipts']:
-                    state_map.insert_rx(rx,height)
-
-            f_statements.write(msgpack.packb((height, stmts,), use_bin_type=True)) 
+        statement_height = extract_statements(args, statement_paths, state_map, f_statements)
 
     print("statement data extraction complete!\n")
     print(f"statement data written to {args.statement_save_path}")
     
-    # TODO: convert all fields to efficient string representations so header df can be stored as csv instead of pickle
-    header_df = pd.DataFrame.from_records(block_stats)
-    header_df['dateTime'] = pd.to_datetime(header_df['timestamp'],origin=pd.to_datetime('2021-03-16 00:06:25'),unit='ms')
-    header_df = header_df.set_index('dateTime').sort_index(axis=0)
-    header_df.to_pickle(args.header_save_path)
+    save_header_df(block_stats, args.header_save_path)
 
     print(f"header data written to {args.header_save_path}")
 
-    state_map.to_msgpack(args.state_save_path)
+    state_map.to_msgpack(args.state_save_path, indexed=args.indexed_state, chunk_size=args.state_chunk_size)
 
     print(f"state data written to {args.state_save_path}")
 
+    if args.snapshot_every:
+        block_height = block_stats[-1]['height'] if len(block_stats) else 0
+        heights = write_snapshots(state_map, args.snapshot_dir, args.snapshot_every, 0, min(block_height, statement_height))
+        print(f"{len(heights)} state snapshots written to {args.snapshot_dir}")
+
     print("exiting . . .")
 
 
+def parse_positive_int(value):
+    """Parse a count which must be at least 1, e.g. a chunk size"""
+    try:
+        count = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: {value}") from None
+    if count < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1: {value}")
+    return count
+
+
+def parse_tx_type(value):
+    """Parse a tx type given as hex, e.g. ``4154`` or ``0x4154``, into the form used by the decoders"""
+    tx_type = value.lower()
+    if tx_type.startswith('0x'):
+        tx_type = tx_type[2:]
+    if not re.fullmatch('[0-9a-f]{4}',tx_type):
+        raise argparse.ArgumentTypeError(f"invalid tx type: {value}")
+    return tx_type.encode()
+
+
+def parse_receipt_type(value):
+    """Parse a receipt type given as hex, e.g. ``2143`` or ``0x2143``, into the integer used by the decoders"""
+    try:
+        return int(value,16)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid receipt type: {value}") from None
+
+
 def parse_args(argv):
     parser = argparse.ArgumentParser()
     parser.add_argument("--block_dir", type=str, default='./data', help="Location of block store")
@@ -1053,14 +2618,39 @@ def parse_args(argv):
     parser.add_argument("--statement_save_path", type=str, default='./stmt_data.msgpack', help="path to write the extracted statement data to")
     parser.add_argument("--state_save_path", type=str, default='./state_map.msgpack', help="path to write the extracted statement data to")
     parser.add_argument("--header_save_path", type=str, default='./block_header_df.pkl', help="path to write the extracted data to")
+    parser.add_argument("--block_index_path", type=str, default='./block_index.npz', help="path to write the block height index to")
+    parser.add_argument("--statement_index_path", type=str, default='./stmt_index.npz', help="path to write the statement height index to")
     parser.add_argument("--block_extension", type=str, default='.dat', help="extension of block files; must be unique")
     parser.add_argument("--statement_extension", type=str, default='.stmt', help="extension of block files; must be unique")
     parser.add_argument("--db_offset_bytes", type=int, default=DB_OFFSET_BYTES, help="padding bytes at start of storage files")
     parser.add_argument("--save_tx_hashes", action='store_true', help="flag to keep full tx hashes")
     parser.add_argument("--save_subcache_merkle_roots", action='store_true', help="flag to keep subcache merkle roots")
     parser.add_argument("--quiet", action='store_true', help="do not show progress bars")
+    parser.add_argument("--workers", type=int, default=1, help="number of processes used to decode block and statement files")
+    parser.add_argument("--incremental", action='store_true', help="resume from the checkpoint, if any, appending new blocks and statements to existing output")
+    parser.add_argument("--checkpoint_path", type=str, default='./extract_checkpoint.msgpack', help="path of the checkpoint used by incremental runs")
+    parser.add_argument("--follow", action='store_true', help="after an incremental run, keep polling the block store and extract newly appended data")
+    parser.add_argument("--poll_interval", type=float, default=1.0, help="seconds between polls of the block store in follow mode")
+    parser.add_argument("--save_interval", type=float, default=60.0, help="minimum seconds between saves of the header table, state map and checkpoint in follow mode")
+    parser.add_argument("--max_polls", type=int, default=None, help="stop following after this many polls")
+    parser.add_argument("--save_index", action='store_true', help="also write height indexes for random access to blocks and statements")
+    parser.add_argument("--headers_only", action='store_true', help="only write the header table, skipping payload decoding, statements and state")
+    parser.add_argument("--raw_keys", action='store_true', help="keep keys and addresses as raw bytes during extraction, encoding them only when writing output")
+    parser.add_argument("--compact_state", action='store_true', help="hold the state map in packed arrays rather than per-account dicts, trading lookup speed for memory")
+    parser.add_argument("--indexed_state", action='store_true', help="write the state map as an indexed file whose accounts are loaded on demand by XYMStateMap.read_msgpack")
+    parser.add_argument("--state_chunk_size", type=parse_positive_int, default=None, help="write the state map as an array of maps holding at most this many accounts each, each loadable on its own with XYMStateMap.read_msgpack(path, chunk=i)")
+    parser.add_argument("--snapshot_every", type=int, default=None, help="also write a snapshot of the state map every this many blocks, see load_state_at")
+    parser.add_argument("--snapshot_dir", type=str, default='./snapshots', help="directory to write state snapshots to")
+    parser.add_argument("--parallel_state", action='store_true', help="insert blocks and receipts into partial state maps in the --workers decoding processes, merged in height order, rather than into the state map in the main process")
+    parser.add_argument("--tx_types", type=parse_tx_type, nargs='+', default=None, help="hex tx types whose payloads are decoded, e.g. 4154 414c; others are written with an empty payload")
+    parser.add_argument("--receipt_types", type=parse_receipt_type, nargs='+', default=None, help="hex receipt types whose payloads are decoded, e.g. 2143 124d; others are written as raw payload bytes")
+    parser.add_argument("--skip_resolution_statements", action='store_true', help="do not decode address and mosaic resolution statements")
     
     args = parser.parse_args(argv)
+    if args.tx_types is not None:
+        args.tx_types = frozenset(args.tx_types)
+    if args.receipt_types is not None:
+        args.receipt_types = frozenset(args.receipt_types)
 
     return args
 
@@ -1,11 +1,78 @@
 
+import heapq
 import msgpack
+import os
+import struct
 import numpy as np
 import networkx as nx
+from array import array
 from binascii import unhexlify
 from collections import defaultdict
+from collections.abc import Mapping, MutableMapping
+from contextlib import contextmanager
+from itertools import islice
+from operator import itemgetter
+
+from util import decode_address, encode_address, intern_address, public_key_to_address, public_key_to_raw_address
+
+STATE_FILE_MAGIC = b'XYMSTATE'
+STATE_FILE_VERSION = 1
+STATE_FILE_TRAILER = struct.Struct('<Q8s') # index offset, magic
+STATE_WRITE_BUFFER_BYTES = 1 << 20
+
+# first bytes of a msgpack array, which a chunked state blob starts with
+CHUNKED_STATE_PREFIXES = {bytes([b]) for b in range(0x90,0xa0)} | {b'\xdc',b'\xdd'}
+
+ACCOUNT_FIELDS = ('xym_balance','delegation_requests','vrf_key_link','node_key_link','account_key_link','harvested','delegated')
+
+
+def new_account():
+    """Produce the empty per-account record of a :class:`XYMStateMap`
+
+    A module level factory rather than a lambda so that state maps can be pickled
+    """
+    return {
+        'xym_balance': defaultdict(int),
+        'delegation_requests': defaultdict(list),
+        'vrf_key_link': defaultdict(list),
+        'node_key_link': defaultdict(list),
+        'account_key_link': defaultdict(list),
+        'harvested':defaultdict(list),
+        'delegated':defaultdict(list)
+    }
+
+
+def load_account(account):
+    """Wrap a serialized account dict in the defaultdicts held by a :class:`XYMStateMap`"""
+    return {
+        'xym_balance': defaultdict(int,account['xym_balance']),
+        'delegation_requests': defaultdict(list,account['delegation_requests']),
+        'vrf_key_link': defaultdict(list,account['vrf_key_link']),
+        'node_key_link': defaultdict(list,account['node_key_link']),
+        'account_key_link': defaultdict(list,account['account_key_link']),
+        'harvested':defaultdict(list,{h:intern_address(a) for h,a in account['harvested'].items()}),
+        'delegated':defaultdict(list,{h:intern_address(a) for h,a in account['delegated'].items()})
+    }
+
+
+def account_at_height(account,height):
+    """Drop the changes made above a height from a serialized account dict
+
+    Key links closed above the height are reopened. Returns None if nothing
+    is left.
+    """
+    kept = {}
+    for field, values in account.items():
+        if field in ('xym_balance','harvested','delegated'):
+            kept[field] = {h:v for h,v in values.items() if h <= height}
+            continue
+        if field == 'delegation_requests':
+            kept_values = {a:[h for h in heights if h <= height] for a,heights in values.items()}
+        else: # key links
+            kept_values = {a:[[start,end if end <= height else np.inf] for start,end in intervals if (end if start is None else start) <= height] for a,intervals in values.items()}
+        kept[field] = {a:v for a,v in kept_values.items() if len(v)}
+    return kept if any(len(values) for values in kept.values()) else None
 
-from util import public_key_to_address
 
 class XYMStateMap():
     """Efficient, mutable representation of XYM network state
@@ -14,6 +81,13 @@ class XYMStateMap():
     ----------
     state_map: dict, optional
         Pre-existing state map to initialize internal state
+    raw_keys: bool, optional
+        Expect transactions, blocks and receipts decoded with ``raw_keys=True``
+        and key the map by raw 24 byte addresses; addresses are base32 encoded
+        by :meth:`to_dict`, so serialized output is the same either way
+    rollback_depth: int, optional
+        Minimum number of most recent heights whose changes are journaled so
+        that they can be undone by :meth:`rollback_to`
 
     Attributes
     ----------
@@ -21,51 +95,151 @@ class XYMStateMap():
         Dict mapping addresses to recorded quantities
     tracked_mosaics: list[str]
         List of string aliases for mosaic(s) to track the balance of
+    journal: defaultdict
+        Dict mapping each journaled height to the list of undo records of the
+        changes made at that height
+    journal_floor: int
+        Lowest height the map can be rolled back to; every change above it is
+        journaled
+    max_height: int
+        Highest height inserted so far
+    balance_index: BalanceIndex
+        Prefix sums of the balance deltas, rebuilt on first use after a change
+    harvest_index: HarvestIndex
+        Harvested blocks sorted by height, rebuilt on first use after a change
 
     """
 
-    def __init__(self,state_map={}):
+    # deepest rollback a Symbol node performs
+    MAX_ROLLBACK_BLOCKS = 398
+
+    def __init__(self,state_map={},raw_keys=False,rollback_depth=MAX_ROLLBACK_BLOCKS):
         
+        if raw_keys: # serialized maps hold base32 addresses
+            state_map = {decode_address(k):self._convert_account(v,decode_address) for k,v in state_map.items()}
+
         if len(state_map):
-            state_map = {k:{
-                'xym_balance': defaultdict(lambda:0,v['xym_balance']),
-                'delegation_requests': defaultdict(list,v['delegation_requests']),
-                'vrf_key_link': defaultdict(list,v['vrf_key_link']),
-                'node_key_link': defaultdict(list,v['node_key_link']),
-                'account_key_link': defaultdict(list,v['account_key_link']),
-                'harvested':defaultdict(list,v['harvested']),
-                'delegated':defaultdict(list,v['delegated'])
-            } for k,v in state_map.items()}
-
-        self.state_map = defaultdict(lambda:{
-                'xym_balance': defaultdict(lambda:0),
-                'delegation_requests': defaultdict(list),
-                'vrf_key_link': defaultdict(list),
-                'node_key_link': defaultdict(list),
-                'account_key_link': defaultdict(list),
-                'harvested':defaultdict(list),
-                'delegated':defaultdict(list)
-            }, state_map)
+            state_map = {k:load_account(v) for k,v in state_map.items()}
+
+        self.state_map = defaultdict(new_account,state_map)
+
+        # changes from before a loaded map's last harvest are not journaled
+        self.max_height = max((max(v['harvested'],default=0) for v in state_map.values()),default=0)
+        self.journal_floor = self.max_height
+        self.journal = defaultdict(list)
+        self.rollback_depth = rollback_depth
 
+        self._balance_index = None
+        self._harvest_index = None
+
+        self.raw_keys = raw_keys
         self.tracked_mosaics = ['0x6bed913fa20223f8','0xe74b99ba41f4afee'] # only care about XYM for now, hardcoded alias
         self.node_color = 'CornflowerBlue'
         self.delegate_color = 'LightBlue'
 
 
     def __getitem__(self,addr):
+        if self.raw_keys and isinstance(addr,str):
+            addr = decode_address(addr)
         return self.state_map[addr]
 
 
     @classmethod
-    def read_msgpack(cls,msgpack_path):
-        """Read data from a mesgpack binary blob and build a state map"""
+    def read_msgpack(cls,msgpack_path,raw_keys=False,chunk=None):
+        """Read data from a mesgpack binary blob and build a state map
+
+        Indexed state files, see :class:`StateFile`, are loaded lazily: only
+        the index is read up front and accounts are read on first access.
+
+        Parameters
+        ----------
+        msgpack_path: str
+            Path of a blob written by :meth:`to_msgpack`
+        raw_keys: bool, optional
+            Key the map by raw address bytes
+        chunk: int, optional
+            Only load the accounts of this chunk of a blob written with
+            `chunk_size`; earlier chunks are skipped without being built
+        """
         if type(msgpack_path) == str:
+            if StateFile.is_state_file(msgpack_path):
+                if chunk is not None:
+                    raise ValueError(f"{msgpack_path} is an indexed state file, not a chunked one")
+                return cls._from_state_file(StateFile(msgpack_path),raw_keys)
             with open(msgpack_path,'rb') as f:
-                state_map = msgpack.unpack(f,unicode_errors=None,raw=False)
+                if f.peek(1)[:1] in CHUNKED_STATE_PREFIXES: # an array of maps, see to_msgpack
+                    unpacker = msgpack.Unpacker(f,unicode_errors=None,raw=False)
+                    n_chunks = unpacker.read_array_header()
+                    if chunk is None:
+                        state_map = {}
+                        for _ in range(n_chunks):
+                            state_map.update(unpacker.unpack())
+                    elif 0 <= chunk < n_chunks:
+                        for _ in range(chunk):
+                            unpacker.skip()
+                        state_map = unpacker.unpack()
+                    else:
+                        raise IndexError(f"{msgpack_path} has {n_chunks} chunks, no chunk {chunk}")
+                elif chunk is not None:
+                    raise ValueError(f"{msgpack_path} is not a chunked state file")
+                else:
+                    state_map = msgpack.unpack(f,unicode_errors=None,raw=False)
         else:
             raise TypeError(f"Unrecognized type {type(msgpack_path)} for read_msgpack, path str")
 
-        return cls(state_map=state_map)
+        return cls(state_map=state_map,raw_keys=raw_keys)
+
+
+    @classmethod
+    def _from_state_file(cls,state_file,raw_keys):
+        state_map = cls(raw_keys=raw_keys)
+        state_map.state_map = LazyAccounts(state_file,raw_keys)
+        state_map.max_height = state_map.journal_floor = state_file.meta['max_height']
+        return state_map
+
+
+    @property
+    def balance_index(self):
+        if self._balance_index is None:
+            self._balance_index = self._build_balance_index()
+        return self._balance_index
+
+
+    def _build_balance_index(self):
+        addresses, heights, amounts, counts = [], [], [], []
+        for address, account in self.state_map.items():
+            balance = account['xym_balance']
+            account_heights = sorted(balance)
+            addresses.append(address)
+            heights.extend(account_heights)
+            amounts.extend([balance[h] for h in account_heights])
+            counts.append(len(account_heights))
+        starts = np.zeros(len(counts)+1,dtype=np.int64)
+        np.cumsum(counts,out=starts[1:])
+        return BalanceIndex(addresses,starts,np.array(heights,dtype=np.int64),np.array(amounts,dtype=np.int64))
+
+
+    def balance(self,addr,height=np.inf):
+        """Look up the XYM balance of an address at a height
+
+        Parameters
+        ----------
+        addr: str or bytes
+            Address of the account
+        height: int, optional
+            Height at which to take the balance, after all changes at that
+            height; defaults to the latest balance
+
+        """
+        if self.raw_keys and isinstance(addr,str):
+            addr = decode_address(addr)
+        return self.balance_index.balance(addr,height)
+
+
+    def balances_at(self,height=np.inf):
+        """Produce a dict mapping every address to its XYM balance at a height, see :meth:`balance`"""
+        index = self.balance_index
+        return dict(zip(index.addresses,index.balances_at(height).tolist()))
 
 
     def keys(self):
@@ -93,35 +267,44 @@ class XYMStateMap():
         """
 
         # TODO: handle flows for *all* mosaics, not just XYM
-        address = public_key_to_address(unhexlify(tx['signer_public_key']))
-        
-        if tx['type'] == b'4154': # transfer tx
-            if len(tx['payload']['message']) and tx['payload']['message'][0] == 0xfe:
-                self.state_map[address]['delegation_requests'][tx['payload']['recipient_address']].append(height)
-            elif tx['payload']['mosaics_count'] > 0:
-                for mosaic in tx['payload']['mosaics']:
-                    if hex(mosaic['mosaic_id']) in self.tracked_mosaics:
-                        self.state_map[address]['xym_balance'][height] -= mosaic['amount']
-                        self.state_map[tx['payload']['recipient_address']]['xym_balance'][height] += mosaic['amount']
-        
-        elif tx['type'] in [b'4243',b'424c',b'414c']: # key link tx          
-            if tx['type'] == b'4243': 
-                link_key = 'vrf_key_link'
-            elif tx['type'] == b'424c': 
-                link_key = 'node_key_link'
-            elif tx['type'] == b'414c': 
-                link_key = 'account_key_link'
-            if tx['payload']['link_action'] == 1:
-                self.state_map[address][link_key][public_key_to_address(tx['payload']['linked_public_key'])].append([height,np.inf])
-            else:
-                self.state_map[address][link_key][public_key_to_address(tx['payload']['linked_public_key'])][-1][1] = height
-        
-        elif tx['type'] in [b'4141',b'4241']: # aggregate tx
-            for sub_tx in tx['payload']['embedded_transactions']:
-                self.insert_tx(sub_tx,height,None)
+        if self.raw_keys:
+            address = public_key_to_raw_address(tx['signer_public_key'])
+        else:
+            address = public_key_to_address(unhexlify(tx['signer_public_key']))
+
+        handler = self.TX_HANDLERS.get(tx['type'])
+        if handler is not None and tx['payload'] is not None: # payload is None when filtered out by tx type
+            handler(self,tx,address,height)
         
         if fee_multiplier is not None: # handle fees
-            self.state_map[address]['xym_balance'][height] -= min(tx['max_fee'],tx['size']*fee_multiplier)
+            self._add_balance(address,height,-min(tx['max_fee'],tx['size']*fee_multiplier))
+
+
+    def _insert_transfer_tx(self,tx,address,height):
+        if len(tx['payload']['message']) and tx['payload']['message'][0] == 0xfe:
+            self._add_delegation_request(address,tx['payload']['recipient_address'],height)
+        elif tx['payload']['mosaics_count'] > 0:
+            for mosaic in tx['payload']['mosaics']:
+                if hex(mosaic['mosaic_id']) in self.tracked_mosaics:
+                    self._add_balance(address,height,-mosaic['amount'])
+                    self._add_balance(tx['payload']['recipient_address'],height,mosaic['amount'])
+
+
+    def _insert_key_link_tx(self,tx,address,height):
+        link_key = self.KEY_LINK_TYPES[tx['type']]
+        if self.raw_keys:
+            linked_address = public_key_to_raw_address(tx['payload']['linked_public_key'])
+        else:
+            linked_address = public_key_to_address(tx['payload']['linked_public_key'])
+        if tx['payload']['link_action'] == 1:
+            self._open_key_link(address,link_key,linked_address,height)
+        else:
+            self._close_key_link(address,link_key,linked_address,height)
+
+
+    def _insert_aggregate_tx(self,tx,address,height):
+        for sub_tx in tx['payload']['embedded_transactions']:
+            self.insert_tx(sub_tx,height,None)
 
 
     def insert_block(self,block):
@@ -136,10 +319,11 @@ class XYMStateMap():
         header = block['header']
         height = header['height']
 
-        # handle harvester information
-        self.state_map[header['beneficiary_address']]['harvested'][height] = header['harvester']
-        if header['harvester'] != header['beneficiary_address']:
-            self.state_map[header['harvester']]['delegated'][height] = header['beneficiary_address']
+        # handle harvester information; addresses are interned since each one
+        # is repeated for every block it harvests
+        harvester = intern_address(header['harvester'])
+        beneficiary = intern_address(header['beneficiary_address'])
+        self._add_harvest(beneficiary,harvester,height)
 
         # handle transactions
         for tx in block['footer']['transactions']:
@@ -157,37 +341,348 @@ class XYMStateMap():
             Height of receipt
 
         """
-    
-        if rx['type'] in [0x124D, 0x134E]: # rental fee receipts
-            if hex(rx['payload']['mosaic_id']) in ['0x6bed913fa20223f8','0xe74b99ba41f4afee']:
-                self.state_map[rx['payload']['sender_address']]['xym_balance'][height] -= rx['payload']['amount']
-                self.state_map[rx['payload']['recipient_address']]['xym_balance'][height] += rx['payload']['amount']
-                
-        elif rx['type'] in [0x2143,0x2248,0x2348,0x2252,0x2352]: # balance change receipts (credit)
-            self.state_map[rx['payload']['target_address']]['xym_balance'][height] += rx['payload']['amount']
-            
-        elif rx['type'] == [0x3148,0x3152]: # balance change receipts (debit)
-            self.state_map[rx['payload']['target_address']]['xym_balance'][height] -= rx['payload']['amount']
-        
-        if rx['type'] == 0xE143: # aggregate receipts
-            for sub_rx in rx['receipts']:
-                self.insert_rx(sub_rx,height)
+
+        handler = self.RX_HANDLERS.get(rx['type'])
+        if handler is not None and not isinstance(rx['payload'],bytes): # raw bytes when filtered out by receipt type
+            handler(self,rx,height)
+
+
+    def _insert_balance_transfer_rx(self,rx,height):
+        if hex(rx['payload']['mosaic_id']) in ['0x6bed913fa20223f8','0xe74b99ba41f4afee']:
+            self._add_balance(rx['payload']['sender_address'],height,-rx['payload']['amount'])
+            self._add_balance(rx['payload']['recipient_address'],height,rx['payload']['amount'])
+
+
+    def _insert_credit_rx(self,rx,height):
+        self._add_balance(rx['payload']['target_address'],height,rx['payload']['amount'])
+
+
+    def _insert_debit_rx(self,rx,height):
+        self._add_balance(rx['payload']['target_address'],height,-rx['payload']['amount'])
+
+
+    def _insert_aggregate_rx(self,rx,height):
+        for sub_rx in rx['receipts']:
+            self.insert_rx(sub_rx,height)
+
+
+    # primitive updates the handlers above are written in terms of; backends
+    # with a different layout, e.g. CompactXYMStateMap, override these
+
+    def _add_balance(self,address,height,amount):
+        self.state_map[address]['xym_balance'][height] += amount
+        self._balance_index = None
+        self._record(height,'pop',address,'xym_balance',height)
+
+
+    def _add_delegation_request(self,address,recipient_address,height):
+        self.state_map[address]['delegation_requests'][recipient_address].append(height)
+        self._record(height,'pop_list',address,'delegation_requests',recipient_address)
+
+
+    def _add_harvest(self,beneficiary,harvester,height):
+        self.state_map[beneficiary]['harvested'][height] = harvester
+        self._harvest_index = None
+        self._record(height,'pop',beneficiary,'harvested',height)
+        if harvester != beneficiary:
+            self.state_map[harvester]['delegated'][height] = beneficiary
+            self._record(height,'pop',harvester,'delegated',height)
+
+
+    def _open_key_link(self,address,link_key,linked_address,height):
+        self.state_map[address][link_key][linked_address].append([height,np.inf])
+        self._record(height,'pop_list',address,link_key,linked_address)
+
+
+    def _close_key_link(self,address,link_key,linked_address,height):
+        intervals = self.state_map[address][link_key][linked_address]
+        if not len(intervals): # opened below the heights of a partial map, see merge
+            intervals.append([None,height])
+            self._record(height,'pop_list',address,link_key,linked_address)
+            return
+        self._record(height,'set_end',address,link_key,linked_address,intervals[-1][1])
+        intervals[-1][1] = height
+
+
+    def _insert_account(self,address,account,harvests=True):
+        """Replay the changes held by an account dict, e.g. one of another map's, through the update methods above
+
+        With `harvests` False the account's harvested blocks are left for the
+        caller to insert, see :meth:`merge`.
+        """
+        for height, amount in account['xym_balance'].items():
+            self._add_balance(address,height,amount)
+        for recipient_address, heights in account['delegation_requests'].items():
+            for height in heights:
+                self._add_delegation_request(address,recipient_address,height)
+        if harvests:
+            for height, harvester in account['harvested'].items(): # delegated blocks are implied
+                self._add_harvest(address,intern_address(harvester),height)
+        for link_key in self.KEY_LINK_TYPES.values():
+            for linked_address, intervals in account[link_key].items():
+                for start, end in intervals:
+                    if start is not None:
+                        self._open_key_link(address,link_key,linked_address,start)
+                    if end != np.inf:
+                        self._close_key_link(address,link_key,linked_address,end)
+
+
+    def merge(self,other):
+        """Merge a partial state map covering later heights into this one
+
+        Partial maps are built independently over disjoint, consecutive height
+        ranges, e.g. by the decoding workers of
+        :func:`nem_extract.deserialize_blocks` or by
+        :func:`nem_extract.build_state`, and merged in height order. Balance
+        deltas add up and harvests and delegation requests are combined. A key
+        link closed in `other` but opened below its heights is held there as a
+        ``[None, end]`` interval; merging closes this map's latest interval for
+        that link, or keeps the pending close if there is none. Merging is
+        therefore associative: ``a.merge(b).merge(c)`` equals
+        ``a.merge(b.merge(c))``.
+
+        Balance deltas are additive, so a map holding nothing else, such as
+        the receipts of statement files merged by
+        :func:`nem_extract.deserialize_statements`, may also be merged at
+        heights this map already holds.
+
+        Parameters
+        ----------
+        other: XYMStateMap
+            Map covering heights above those of this map, or only holding
+            balance deltas, with the same `raw_keys`
+
+        Returns
+        -------
+        XYMStateMap
+            This map
+
+        """
+        if other.raw_keys != self.raw_keys:
+            raise ValueError("Cannot merge state maps keyed by raw and by encoded addresses")
+        # harvests are inserted in height order across accounts, so that each
+        # harvester's delegated blocks stay in height order too
+        harvests = []
+        for address, account in other.state_map.items():
+            self._insert_account(address,account,harvests=False)
+            harvests.extend((height,address,harvester) for height, harvester in account['harvested'].items())
+        harvests.sort(key=itemgetter(0))
+        for height, beneficiary, harvester in harvests:
+            self._add_harvest(beneficiary,intern_address(harvester),height)
+        return self
+
+
+    def _record(self,height,action,address,field,key,*args):
+        """Journal how to undo a change made at a height, see :meth:`rollback_to`
+
+        At least the last `rollback_depth` heights are kept; older entries are
+        pruned as the map advances, raising `journal_floor` past them. The
+        floor never drops, since pruned entries are gone for good.
+        """
+        if height > self.max_height:
+            self.max_height = height
+            if len(self.journal) > 2*self.rollback_depth:
+                self.journal_floor = max(self.journal_floor,height-self.rollback_depth)
+                self.journal = defaultdict(list,{h:u for h,u in self.journal.items() if h > self.journal_floor})
+        if height > self.journal_floor:
+            self.journal[height].append((action,address,field,key)+args)
+
+
+    def rollback_to(self,height):
+        """Undo every change recorded above a height, e.g. after a chain rollback
+
+        Balance deltas, harvests, delegations, delegation requests and key link
+        changes above `height` are removed by replaying the journal backwards,
+        so the cost is proportional to the number of changes undone. Accounts
+        left empty are dropped.
+
+        Parameters
+        ----------
+        height: int
+            Last height to keep
+
+        """
+        if height < self.journal_floor:
+            raise ValueError(f"Cannot roll back to height {height}, changes are only journaled above height {self.journal_floor}")
+
+        touched = set()
+        for h in sorted([h for h in self.journal if h > height],reverse=True):
+            for action, address, field, key, *args in reversed(self.journal.pop(h)):
+                values = self.state_map[address][field]
+                if action == 'pop':
+                    values.pop(key,None)
+                elif action == 'pop_list':
+                    values[key].pop()
+                    if not len(values[key]):
+                        del values[key]
+                elif action == 'set_end':
+                    values[key][-1][1] = args[0]
+                touched.add(address)
+
+        for address in touched:
+            if not any(len(values) for values in self.state_map[address].values()):
+                del self.state_map[address]
+        self.max_height = min(self.max_height, height)
+        self._balance_index = None
+        self._harvest_index = None
+
+
+    # dispatch tables mapping tx and receipt types to the handlers above; 
+    # subclasses can extend copies of these to handle further types
+
+    KEY_LINK_TYPES = {
+        b'4243': 'vrf_key_link',
+        b'424c': 'node_key_link',
+        b'414c': 'account_key_link'}
+
+    TX_HANDLERS = {
+        b'4154': _insert_transfer_tx, # transfer tx
+        b'4243': _insert_key_link_tx, # key link txs
+        b'424c': _insert_key_link_tx,
+        b'414c': _insert_key_link_tx,
+        b'4141': _insert_aggregate_tx, # aggregate txs
+        b'4241': _insert_aggregate_tx}
+
+    RX_HANDLERS = {
+        0x124D: _insert_balance_transfer_rx, # rental fee receipts
+        0x134E: _insert_balance_transfer_rx,
+        0x2143: _insert_credit_rx, # balance change receipts (credit)
+        0x2248: _insert_credit_rx,
+        0x2348: _insert_credit_rx,
+        0x2252: _insert_credit_rx,
+        0x2352: _insert_credit_rx,
+        0x3148: _insert_debit_rx, # balance change receipts (debit)
+        0x3152: _insert_debit_rx,
+        0xE143: _insert_aggregate_rx} # aggregate receipts
 
 
     def to_dict(self):
         """Convert internal state map to serializable dictionary"""
-        sm_dict = dict(self.state_map)
-        for k, v in sm_dict.items():
-            sm_dict[k] = dict(v)
-            for kk, vv in v.items():
-                sm_dict[k][kk] = dict(vv)
-        return sm_dict
+        return dict(self.serialized_accounts())
+
+
+    def serialized_accounts(self):
+        """Iterate over (address, account) pairs in the serializable form of :meth:`to_dict`"""
+        for address, account in self.state_map.items():
+            yield self._serialize_account(address,account)
+
+
+    def packed_accounts(self,packer):
+        """Iterate over (address, packed account) pairs, the accounts of :meth:`serialized_accounts` packed by `packer`
+
+        Accounts of a lazily loaded map which were never accessed are passed
+        on as the record bytes of its state file, without being unpacked.
+        """
+        if not isinstance(self.state_map,LazyAccounts):
+            for address, account in self.serialized_accounts():
+                yield address, packer.pack(account)
+            return
+        accounts = self.state_map
+        for address in accounts:
+            account = accounts.loaded.get(address)
+            if account is None:
+                file_address = accounts._file_address(address)
+                yield file_address, accounts.state_file.packed(file_address)
+            else:
+                address, account = self._serialize_account(address,account)
+                yield address, packer.pack(account)
+
+
+    def _serialize_account(self,address,account):
+        account = {field:dict(values) for field,values in account.items()}
+        if self.raw_keys:
+            return encode_address(address), self._convert_account(account,encode_address)
+        return address, account
+
 
+    @staticmethod
+    def _convert_account(account,convert):
+        """Apply an address conversion, e.g. base32 encoding, to the addresses held by one account's dict"""
+        converted = {}
+        for field, values in account.items():
+            if field in ('harvested','delegated'):
+                converted[field] = {h:convert(a) for h,a in values.items()}
+            elif field == 'xym_balance':
+                converted[field] = values
+            else: # delegation requests and key links are keyed by address
+                converted[field] = {convert(a):v for a,v in values.items()}
+        return converted
 
-    def to_msgpack(self,msgpack_path):
-        """Produce serialized blob with msgpack"""
-        with open(msgpack_path, 'wb') as f:
-            f.write(msgpack.packb(self.to_dict()))
+
+    def to_msgpack(self,msgpack_path,indexed=False,chunk_size=None):
+        """Produce serialized blob with msgpack
+
+        Accounts are streamed to the file one at a time, so saving needs
+        little memory beyond the map itself. The file is written beside
+        `msgpack_path` and then moved onto it, so a lazily loaded map can be
+        saved over the file it was read from.
+
+        Parameters
+        ----------
+        msgpack_path: str
+            Path to write to
+        indexed: bool, optional
+            Write an indexed state file instead, see :class:`StateFile`, whose
+            accounts can be loaded on demand
+        chunk_size: int, optional
+            Write an array of maps holding at most `chunk_size` accounts each
+            rather than a single map; every chunk can be loaded on its own
+            with ``read_msgpack(msgpack_path, chunk=i)``
+
+        """
+        if chunk_size is not None and chunk_size < 1:
+            raise ValueError(f"chunk_size must be at least 1, got {chunk_size}")
+        packer = msgpack.Packer()
+        accounts = self.packed_accounts(packer)
+        if indexed:
+            write_state_file(msgpack_path,accounts,self.max_height)
+            return
+
+        n_accounts = len(self.state_map)
+        with replacing_file(msgpack_path) as f:
+            if chunk_size is None:
+                chunk_sizes = [n_accounts]
+            else:
+                chunk_sizes = [min(chunk_size,n_accounts-i) for i in range(0,n_accounts,chunk_size)]
+                f.write(packer.pack_array_header(len(chunk_sizes)))
+            for n in chunk_sizes:
+                f.write(packer.pack_map_header(n))
+                for address, account in islice(accounts,n):
+                    f.write(packer.pack(address))
+                    f.write(account)
+
+
+    def write_snapshot(self,path,height):
+        """Write the state as of a height to an indexed state file, see :class:`StateFile`
+
+        Changes above `height` are filtered out account by account as they are
+        written, so the map itself is left untouched.
+        """
+        packer = msgpack.Packer()
+        accounts = ((address,account_at_height(account,height)) for address, account in self.serialized_accounts())
+        write_state_file(path,((address,packer.pack(account)) for address, account in accounts if account is not None),height)
+
+
+    @property
+    def harvest_index(self):
+        if self._harvest_index is None:
+            self._harvest_index = self._build_harvest_index()
+        return self._harvest_index
+
+
+    def _build_harvest_index(self):
+        addresses, heights, beneficiaries, harvesters = [], [], [], []
+        account_ids = {}
+        for beneficiary, account in self.state_map.items():
+            for height, harvester in account['harvested'].items():
+                for address in (beneficiary,harvester):
+                    if address not in account_ids:
+                        account_ids[address] = len(addresses)
+                        addresses.append(address)
+                heights.append(height)
+                beneficiaries.append(account_ids[beneficiary])
+                harvesters.append(account_ids[harvester])
+        return HarvestIndex(addresses,np.array(heights,dtype=np.int64),np.array(beneficiaries,dtype=np.int64),np.array(harvesters,dtype=np.int64))
 
 
     def get_harvester_graph(self,min_height=0,max_height=np.inf,min_node_size=1,min_delegate_size=1):
@@ -203,40 +698,68 @@ class XYMStateMap():
         min_delegate_size: int, optional
             
         """
-        node_map = defaultdict(lambda:[])
-        
-        for k,v in self.state_map.items():
-            for height, addr in v['harvested'].items():
-                if min_height <= height <= max_height:
-                    node_map[k].append(addr)
-
-        delegate_map = defaultdict(lambda:[])
-    
-        for k,v in self.state_map.items():
-            for height, addr in v['delegated'].items():
-                if min_height <= height <= max_height:
-                    delegate_map[k].append(addr)
-        
-        node_size_map = {k:{'size':len(v),'color':self.node_color} for k,v in node_map.items() if len(v) >= min_node_size}
-        delegate_size_map = {k:{'size':len(v),'color':self.delegate_color} for k,v in delegate_map.items() if len(v) >= min_delegate_size}
+        index = self.harvest_index
+        return self._harvester_graph(index.addresses,*index.counts(min_height,max_height),min_node_size,min_delegate_size)
+
+
+    def _harvester_graph(self,addresses,node_counts,delegate_counts,pair_counts,min_node_size,min_delegate_size):
+        node_size_map = {addresses[k]:{'size':n,'color':self.node_color} for k,n in node_counts.items() if n >= min_node_size}
+        delegate_size_map = {addresses[k]:{'size':n,'color':self.delegate_color} for k,n in delegate_counts.items() if n >= min_delegate_size}
 
         graph = nx.DiGraph()
         graph.add_nodes_from(node_size_map.items())
         graph.add_nodes_from(delegate_size_map.items())
-        
-        for node,delegates in node_map.items():
-            if node in node_size_map:
-                d_map = defaultdict(lambda:0)
-                for d in delegates:
-                    if d in delegate_size_map:
-                        d_map[d] += 1
-                graph.add_edges_from([(node,d,{'weight':d_map[d]}) for d in d_map])
+        graph.add_edges_from([(addresses[node],addresses[d],{'weight':n}) for (node,d),n in pair_counts.items() 
+            if addresses[node] in node_size_map and addresses[d] in delegate_size_map])
         
         nx.set_node_attributes(graph,node_size_map)
         
         return graph
 
 
+    def iter_harvester_windows(self,size,step=1,min_height=None,max_height=None,graphs=False,min_node_size=1,min_delegate_size=1,top=5):
+        """Slide a window of heights across the chain, yielding harvester statistics for each position
+
+        Counts are updated as blocks enter and leave the window, so each step
+        costs time proportional to the blocks that changed, see
+        :class:`HarvesterWindow`.
+
+        Parameters
+        ----------
+        size: int
+            Number of heights covered by the window
+        step: int, optional
+            Heights the window advances by between positions
+        min_height: int, optional
+            Lowest height of the first window; defaults to the first harvested height
+        max_height: int, optional
+            Highest height reached by the last window; defaults to the last harvested height
+        graphs: bool, optional
+            Yield :meth:`get_harvester_graph` style graphs rather than
+            :meth:`HarvesterWindow.summary` dicts
+        min_node_size: int, optional
+        min_delegate_size: int, optional
+            Size filters applied to graphs
+        top: int, optional
+            Number of largest nodes listed in summaries
+
+        """
+        index = self.harvest_index
+        if not len(index):
+            return
+        min_height = int(index.heights[0]) if min_height is None else min_height
+        max_height = int(index.heights[-1]) if max_height is None else max_height
+        window = HarvesterWindow(index,size,min_height)
+        while True:
+            if graphs:
+                yield self._harvester_graph(index.addresses,*window.counts(),min_node_size,min_delegate_size)
+            else:
+                yield window.summary(top)
+            if window.max_height + step > max_height:
+                return
+            window.advance(step)
+
+
     def get_harvester_bubbles(self,min_height=0,max_height=np.inf,min_node_size=1,min_delegate_size=1):
         """Produce a bubble chart representing harvester-node relationships for a range of network heights
            
@@ -250,22 +773,13 @@ class XYMStateMap():
         min_delegate_size: int, optional
             
         """
-        node_map = defaultdict(lambda:[])
+        index = self.harvest_index
+        addresses = index.addresses
+        node_counts, delegate_counts, _ = index.counts(min_height,max_height)
+        parents = index.parents(min_height,max_height)
         
-        for k,v in self.state_map.items():
-            for height, addr in v['harvested'].items():
-                if min_height <= height <= max_height:
-                    node_map[k].append(addr)
-
-        delegate_map = defaultdict(lambda:[])
-    
-        for k,v in self.state_map.items():
-            for height, addr in v['delegated'].items():
-                if min_height <= height <= max_height:
-                    delegate_map[k].append(addr)
-        
-        node_size_map = {k:{'size':len(v),'color':self.node_color, 'type': 'node'} for k,v in node_map.items() if len(v) >= min_node_size}
-        delegate_size_map = {k:{'size':len(v),'color':self.delegate_color, 'parent': max(set(v), key = v.count), 'type': 'delegate'} for k,v in delegate_map.items() if len(v) >= min_delegate_size}
+        node_size_map = {addresses[k]:{'size':n,'color':self.node_color, 'type': 'node'} for k,n in node_counts.items() if n >= min_node_size}
+        delegate_size_map = {addresses[k]:{'size':n,'color':self.delegate_color, 'parent': addresses[parents[k]], 'type': 'delegate'} for k,n in delegate_counts.items() if n >= min_delegate_size}
 
         graph = nx.Graph()
         graph.add_nodes_from(node_size_map.items())
@@ -273,6 +787,787 @@ class XYMStateMap():
         
         return graph
 
+@contextmanager
+def replacing_file(path):
+    """Open a temporary file next to a path for writing and move it onto the path once written
+
+    The file at `path` stays intact until the new one is complete, so it can
+    still be read while writing, e.g. by the :class:`LazyAccounts` of the map
+    being saved, and an interrupted write leaves it untouched.
+    """
+    tmp_path = f'{path}.tmp'
+    try:
+        with open(tmp_path,'wb',buffering=STATE_WRITE_BUFFER_BYTES) as f:
+            yield f
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    os.replace(tmp_path,path)
+
+
+def write_state_file(path,accounts,max_height):
+    """Write serialized accounts to an indexed state file, see :class:`StateFile`
+
+    Parameters
+    ----------
+    path: str
+        Path to write to
+    accounts: iterable
+        (address, packed account) pairs as produced by :meth:`XYMStateMap.packed_accounts`
+    max_height: int
+        Highest height held by the accounts
+
+    """
+    packer = msgpack.Packer()
+    addresses, offsets = [], []
+    with replacing_file(path) as f:
+        f.write(STATE_FILE_MAGIC)
+        for address, account in accounts:
+            addresses.append(address)
+            offsets.append(f.tell())
+            f.write(account)
+        index_offset = f.tell()
+        offsets.append(index_offset)
+        meta = {'version':STATE_FILE_VERSION,'max_height':int(max_height)}
+        f.write(msgpack.packb([meta,addresses,np.array(offsets,dtype='<u8').tobytes()],use_bin_type=True))
+        f.write(STATE_FILE_TRAILER.pack(index_offset,STATE_FILE_MAGIC))
+
+
+class StateFile(Mapping):
+    """Read-only mapping of addresses to the serialized accounts of an indexed state file
+
+    An indexed state file holds the ``XYMSTATE`` magic, one msgpack record per
+    account in the form of :meth:`XYMStateMap.to_dict`, an index record of
+    ``[meta, addresses, offsets]`` with the record offsets packed as little
+    endian u8, and a trailer holding the offset of the index followed by the
+    magic again. Only the index is read up front; accounts are read and
+    unpacked when accessed.
+
+    Parameters
+    ----------
+    path: str
+        Path of the state file
+
+    Attributes
+    ----------
+    meta: dict
+        File version and highest height held by the accounts
+    addresses: list[str]
+        Addresses in file order
+    offsets: numpy.ndarray
+        Offsets of the account records, followed by the offset of the index
+
+    """
+
+    def __init__(self,path):
+        self.path = path
+        # kept open so that accounts are read from the file the index came
+        # from even once a newer state is moved onto the path, see replacing_file
+        self._file = f = open(path,'rb')
+        if f.read(len(STATE_FILE_MAGIC)) != STATE_FILE_MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not an indexed state file")
+        size = f.seek(-STATE_FILE_TRAILER.size,os.SEEK_END)
+        index_offset, magic = STATE_FILE_TRAILER.unpack(f.read(STATE_FILE_TRAILER.size))
+        if magic != STATE_FILE_MAGIC:
+            self.close()
+            raise ValueError(f"{path} has no index trailer, it may be truncated")
+        f.seek(index_offset)
+        self.meta, self.addresses, offsets = msgpack.unpackb(f.read(size-index_offset),raw=False)
+        self._identity = self._file_identity(f)
+        if self.meta['version'] > STATE_FILE_VERSION:
+            self.close()
+            raise ValueError(f"{path} has state file version {self.meta['version']}, only versions up to {STATE_FILE_VERSION} are supported")
+        self.offsets = np.frombuffer(offsets,dtype='<u8')
+        self.positions = {address:i for i,address in enumerate(self.addresses)}
+
+
+    @staticmethod
+    def is_state_file(path):
+        """Check whether a path holds an indexed state file rather than a plain msgpack map"""
+        with open(path,'rb') as f:
+            return f.read(len(STATE_FILE_MAGIC)) == STATE_FILE_MAGIC
+
+
+    @staticmethod
+    def _file_identity(f):
+        stat = os.fstat(f.fileno())
+        return (stat.st_dev,stat.st_ino,stat.st_size)
+
+
+    def __getitem__(self,address):
+        return msgpack.unpackb(self.packed(address),unicode_errors=None,raw=False)
+
+
+    def packed(self,address):
+        """Read the msgpack record of an account without unpacking it"""
+        i = self.positions[address]
+        if self._file is None: # reopened after unpickling
+            self._file = open(self.path,'rb')
+            if self._file_identity(self._file) != self._identity:
+                self.close()
+                raise ValueError(f"{self.path} was replaced since it was indexed")
+        self._file.seek(int(self.offsets[i]))
+        return self._file.read(int(self.offsets[i+1]-self.offsets[i]))
+
+
+    def __iter__(self):
+        return iter(self.addresses)
+
+
+    def __len__(self):
+        return len(self.addresses)
+
+
+    def __contains__(self,address):
+        return address in self.positions
+
+
+    def __getstate__(self): # open files cannot be pickled
+        state = dict(self.__dict__)
+        state['_file'] = None
+        return state
+
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class LazyAccounts(MutableMapping):
+    """Accounts of a :class:`XYMStateMap` loaded on demand from a :class:`StateFile`
+
+    Behaves like the map's defaultdict of accounts: an account is read from
+    the file and wrapped by :func:`load_account` on first access, and unknown
+    addresses get a new, empty account. Iterating over :meth:`items` or
+    :meth:`values` reads accounts without keeping them, so saving the map or
+    building its indexes does not load the whole file into memory.
+
+    Parameters
+    ----------
+    state_file: StateFile
+        File holding the accounts
+    raw_keys: bool, optional
+        Key accounts by raw 24 byte addresses rather than the base32
+        addresses held by the file
+
+    """
+
+    def __init__(self,state_file,raw_keys=False):
+        self.state_file = state_file
+        self.raw_keys = raw_keys
+        self.loaded = {}
+        self.removed = set() # file addresses deleted since loading
+
+
+    def _file_address(self,address):
+        return encode_address(address) if self.raw_keys else address
+
+
+    def __getitem__(self,address):
+        account = self.loaded.get(address)
+        if account is None:
+            file_address = self._file_address(address)
+            if file_address in self.state_file and address not in self.removed:
+                account = self._read(file_address)
+            else:
+                account = new_account()
+                self.removed.discard(address)
+            self.loaded[address] = account
+        return account
+
+
+    def _read(self,file_address):
+        account = self.state_file[file_address]
+        if self.raw_keys:
+            account = XYMStateMap._convert_account(account,decode_address)
+        return load_account(account)
+
+
+    def items(self):
+        for address in self:
+            account = self.loaded.get(address)
+            yield address, self._read(self._file_address(address)) if account is None else account
+
+
+    def values(self):
+        for _, account in self.items():
+            yield account
+
+
+    def __setitem__(self,address,account):
+        self.loaded[address] = account
+        self.removed.discard(address)
+
+
+    def __delitem__(self,address):
+        if address not in self:
+            raise KeyError(address)
+        self.loaded.pop(address,None)
+        if self._file_address(address) in self.state_file:
+            self.removed.add(address)
+
+
+    def __contains__(self,address):
+        return address in self.loaded or (address not in self.removed and self._file_address(address) in self.state_file)
+
+
+    def __iter__(self):
+        for file_address in self.state_file:
+            address = decode_address(file_address) if self.raw_keys else file_address
+            if address not in self.removed:
+                yield address
+        for address in list(self.loaded):
+            if self._file_address(address) not in self.state_file:
+                yield address
+
+
+    def __len__(self):
+        return len(self.state_file) - len(self.removed) + sum(1 for address in self.loaded if self._file_address(address) not in self.state_file)
+
+
+class BalanceIndex():
+    """Prefix sums over each account's XYM balance deltas, ordered by height
+
+    Parameters
+    ----------
+    addresses: list
+        Addresses in index order
+    starts: numpy.ndarray
+        The deltas of the account at position ``i`` are at ``starts[i]:starts[i+1]``
+    heights: numpy.ndarray
+        Heights of the deltas, ascending within each account
+    amounts: numpy.ndarray
+        Balance deltas as int64
+
+    """
+
+    def __init__(self,addresses,starts,heights,amounts):
+        self.addresses = addresses
+        self.positions = {address:i for i,address in enumerate(addresses)}
+        self.starts = starts
+        self.heights = heights
+        # running total over the whole table; an account's balance is the
+        # difference between two entries
+        self.totals = np.cumsum(amounts)
+        self.offsets = np.where(starts[:-1] > 0,self.totals[starts[:-1]-1] if len(amounts) else 0,0)
+        # (position, height) pairs packed into one sorted key for vectorized lookups
+        self.scale = int(heights.max()) + 1 if len(heights) else 1
+        self.keys = np.repeat(np.arange(len(addresses),dtype=np.int64),np.diff(starts))*self.scale + heights
+
+
+    def __len__(self):
+        return len(self.addresses)
+
+
+    def balance(self,address,height=np.inf):
+        """Balance of an address after all changes up to and including a height; 0 for unknown addresses"""
+        i = self.positions.get(address)
+        if i is None:
+            return 0
+        start, stop = self.starts[i], self.starts[i+1]
+        end = start + np.searchsorted(self.heights[start:stop],height,side='right')
+        return int(self.totals[end-1] - self.offsets[i]) if end > start else 0
+
+
+    def balances_at(self,height=np.inf):
+        """Balances of all addresses at a height, as an array in index order"""
+        height = min(height,self.scale-1)
+        if height < 0:
+            return np.zeros(len(self.addresses),dtype=np.int64)
+        ends = np.searchsorted(self.keys,np.arange(len(self.addresses),dtype=np.int64)*self.scale + int(height),side='right')
+        return np.where(ends > self.starts[:-1],self.totals[ends-1] - self.offsets,0)
+
+
+class HarvestIndex():
+    """Table of harvested blocks sorted by height, for windowed harvester statistics
+
+    Parameters
+    ----------
+    addresses: list
+        Addresses by account id
+    heights: numpy.ndarray
+        Heights of the harvested blocks
+    beneficiaries: numpy.ndarray
+        Account ids of the block beneficiaries, i.e. the harvesting nodes
+    harvesters: numpy.ndarray
+        Account ids of the block signers; a block is delegated when the
+        harvester is not the beneficiary
+
+    """
+
+    def __init__(self,addresses,heights,beneficiaries,harvesters):
+        order = np.argsort(heights,kind='stable')
+        self.addresses = addresses
+        self.heights = heights[order]
+        self.beneficiaries = beneficiaries[order]
+        self.harvesters = harvesters[order]
+
+
+    def __len__(self):
+        return len(self.heights)
+
+
+    def window(self,min_height=0,max_height=np.inf):
+        """Produce the beneficiary and harvester ids of the blocks between two heights, inclusive"""
+        start = np.searchsorted(self.heights,min_height,side='left')
+        stop = np.searchsorted(self.heights,max_height,side='right')
+        return self.beneficiaries[start:stop], self.harvesters[start:stop]
+
+
+    def counts(self,min_height=0,max_height=np.inf):
+        """Count the blocks between two heights, inclusive
+
+        Returns
+        -------
+        node_counts: dict
+            Dict mapping beneficiary ids to blocks harvested
+        delegate_counts: dict
+            Dict mapping harvester ids to blocks delegated to another beneficiary
+        pair_counts: dict
+            Dict mapping (beneficiary, harvester) id pairs to blocks harvested
+
+        """
+        beneficiaries, harvesters = self.window(min_height,max_height)
+        delegated = harvesters != beneficiaries
+        return (
+            self._count(beneficiaries),
+            self._count(harvesters[delegated]),
+            {divmod(k,len(self.addresses)):n for k,n in self._count(beneficiaries*len(self.addresses) + harvesters).items()})
+
+
+    def parents(self,min_height=0,max_height=np.inf):
+        """Map each harvester id to the beneficiary it delegated the most blocks to between two heights, inclusive"""
+        beneficiaries, harvesters = self.window(min_height,max_height)
+        delegated = harvesters != beneficiaries
+        pairs, counts = np.unique(harvesters[delegated]*len(self.addresses) + beneficiaries[delegated],return_counts=True)
+        harvesters, beneficiaries = np.divmod(pairs,len(self.addresses))
+        order = np.lexsort((-counts,harvesters))
+        harvesters, first = np.unique(harvesters[order],return_index=True)
+        return dict(zip(harvesters.tolist(),beneficiaries[order][first].tolist()))
+
+
+    @staticmethod
+    def _count(ids):
+        ids, counts = np.unique(ids,return_counts=True)
+        return dict(zip(ids.tolist(),counts.tolist()))
+
+
+class HarvesterWindow():
+    """Harvested block counts over a window of heights that slides along a :class:`HarvestIndex`
+
+    Parameters
+    ----------
+    harvest_index: HarvestIndex
+        Harvested blocks to slide over
+    size: int
+        Number of heights covered by the window
+    min_height: int, optional
+        Lowest height of the initial window
+
+    Attributes
+    ----------
+    node_counts: dict
+        Dict mapping beneficiary ids to blocks harvested in the window
+    delegate_counts: dict
+        Dict mapping harvester ids to blocks delegated to another beneficiary
+    pair_counts: dict
+        Dict mapping (beneficiary, harvester) id pairs to blocks harvested
+    delegation_counts: dict
+        Dict mapping beneficiary ids to blocks harvested on behalf of delegates
+
+    """
+
+    def __init__(self,harvest_index,size,min_height=0):
+        self.index = harvest_index
+        self.size = size
+        self.min_height = min_height
+        self.max_height = min_height + size - 1
+        self.node_counts, self.delegate_counts, self.pair_counts, self.delegation_counts = {}, {}, {}, {}
+        self.delegated_blocks = 0
+        self.delegation_squares = 0 # sum of squared delegation counts, for the concentration
+        self.start = self.stop = np.searchsorted(self.index.heights,self.min_height,side='left')
+        self._update(self.start,np.searchsorted(self.index.heights,self.max_height,side='right'),1)
+
+
+    def advance(self,step=1):
+        """Move the window up by a number of heights, counting the blocks that enter and leave it"""
+        self.min_height += step
+        self.max_height += step
+        # rows skipped by a step larger than the window enter and leave again
+        self._update(self.stop,np.searchsorted(self.index.heights,self.max_height,side='right'),1)
+        self._update(self.start,np.searchsorted(self.index.heights,self.min_height,side='left'),-1)
+
+
+    def _update(self,start,stop,sign):
+        if sign > 0:
+            self.stop = stop
+        else:
+            self.start = stop
+        beneficiaries = self.index.beneficiaries[start:stop].tolist()
+        harvesters = self.index.harvesters[start:stop].tolist()
+        for beneficiary, harvester in zip(beneficiaries,harvesters):
+            self._bump(self.node_counts,beneficiary,sign)
+            self._bump(self.pair_counts,(beneficiary,harvester),sign)
+            if harvester != beneficiary:
+                self._bump(self.delegate_counts,harvester,sign)
+                self.delegated_blocks += sign
+                count = self._bump(self.delegation_counts,beneficiary,sign)
+                self.delegation_squares += count*count - (count-sign)*(count-sign)
+
+
+    @staticmethod
+    def _bump(counts,key,sign):
+        count = counts.get(key,0) + sign
+        if count:
+            counts[key] = count
+        else:
+            del counts[key]
+        return count
+
+
+    def counts(self):
+        """Produce the node, delegate and pair counts in the form of :meth:`HarvestIndex.counts`"""
+        return self.node_counts, self.delegate_counts, self.pair_counts
+
+
+    def summary(self,top=5):
+        """Summarize the window
+
+        Returns
+        -------
+        dict
+            Window bounds; the number of blocks, nodes and delegates; the
+            delegate concentration, i.e. the Herfindahl index of the nodes'
+            shares of delegated blocks; and the `top` nodes by blocks harvested
+            as (address, blocks) pairs
+
+        """
+        delegated_blocks = self.delegated_blocks
+        return {
+            'min_height': self.min_height,
+            'max_height': self.max_height,
+            'blocks': int(self.stop - self.start),
+            'nodes': len(self.node_counts),
+            'delegates': len(self.delegate_counts),
+            'delegated_blocks': delegated_blocks,
+            'delegate_concentration': self.delegation_squares/delegated_blocks**2 if delegated_blocks else 0.0,
+            'top_nodes': [(self.index.addresses[k],n) for k,n in heapq.nlargest(top,self.node_counts.items(),key=itemgetter(1))]}
+
+
+class EventLog():
+    """Append-only table of integer columns held in packed arrays
+
+    Rows are grouped by a column with :meth:`group`, which sorts the whole log
+    once and caches the result until the next append or :meth:`keep`.
+
+    Parameters
+    ----------
+    columns: dict
+        Dict mapping column names to :mod:`array` typecodes
+    sort_key: str
+        Column by which rows are ordered within a group
+
+    """
+
+    def __init__(self,columns,sort_key='height'):
+        self.columns = {name:array(code) for name,code in columns.items()}
+        self.sort_key = sort_key
+        self._groups = {}
+
+
+    def __len__(self):
+        return len(self.columns[self.sort_key])
+
+
+    def append(self,*row):
+        for column, value in zip(self.columns.values(),row):
+            column.append(value)
+        if self._groups:
+            self._groups = {}
+
+
+    def column(self,name):
+        """Produce a numpy copy of a column"""
+        return np.frombuffer(self.columns[name],dtype=self.columns[name].typecode).copy()
+
+
+    def set(self,name,row,value):
+        """Overwrite one value of a column"""
+        self.columns[name][row] = value
+        if self._groups:
+            self._groups = {}
+
+
+    def group(self,name,n_groups):
+        """Sort rows by a column of group ids, then by the sort key
+
+        Returns
+        -------
+        order: numpy.ndarray
+            Row numbers sorted by group id, then sort key, then insertion order
+        starts: numpy.ndarray
+            The rows of group ``g`` are ``order[starts[g]:starts[g+1]]``
+
+        """
+        if name not in self._groups or len(self._groups[name][1]) <= n_groups:
+            keys = self.column(name)
+            order = np.lexsort((self.column(self.sort_key),keys))
+            starts = np.zeros(n_groups+1,dtype=np.int64)
+            np.cumsum(np.bincount(keys,minlength=n_groups),out=starts[1:])
+            self._groups[name] = (order,starts,{})
+        return self._groups[name][:2]
+
+
+    def select(self,name,group_id,n_groups,*columns):
+        """Produce the values of some columns over the rows of one group, in group order
+
+        Columns are permuted into group order once and cached with the grouping.
+        """
+        order, starts = self.group(name,n_groups)
+        grouped = self._groups[name][2]
+        for column in columns:
+            if column not in grouped:
+                grouped[column] = self.column(column)[order]
+        return [grouped[column][starts[group_id]:starts[group_id+1]] for column in columns]
+
+
+    def keep(self,mask):
+        """Drop every row where a boolean mask is False"""
+        for name, column in self.columns.items():
+            kept = array(column.typecode)
+            kept.frombytes(np.frombuffer(column,dtype=column.typecode)[mask].tobytes())
+            self.columns[name] = kept
+        self._groups = {}
+
+
+class CompactAccounts(Mapping):
+    """Read-only mapping view of the accounts of a :class:`CompactXYMStateMap`
+
+    Each lookup assembles a fresh account dict from the map's event logs.
+    """
+
+    def __init__(self,state_map):
+        self.state_map = state_map
+
+
+    def __getitem__(self,address):
+        return self.state_map._account(address)
+
+
+    def __iter__(self):
+        addresses = self.state_map.addresses
+        return (addresses[i] for i in np.flatnonzero(np.frombuffer(bytes(self.state_map.owners),dtype=np.uint8)))
+
+
+    def __len__(self):
+        return self.state_map.owners.count(1)
+
+
+    def __contains__(self,address):
+        account_id = self.state_map.account_ids.get(address)
+        return account_id is not None and self.state_map.owners[account_id] == 1
+
+
+class CompactXYMStateMap(XYMStateMap):
+    """Array backed :class:`XYMStateMap` for networks with very many accounts
+
+    Rather than seven dicts per account, every change is appended as a row of
+    an :class:`EventLog` that refers to accounts by integer id, so an account
+    costs a few bytes per recorded change. Account dicts are assembled on
+    demand with heights in ascending order and otherwise match those of
+    :class:`XYMStateMap`; they are copies, so the map only changes through the
+    insert methods. Rolling back filters the logs, so any height can be
+    restored.
+
+    Parameters
+    ----------
+    state_map: dict, optional
+        Pre-existing state map to initialize internal state
+    raw_keys: bool, optional
+        Expect transactions, blocks and receipts decoded with ``raw_keys=True``
+    rollback_depth: int, optional
+        Unused, kept for compatibility with :class:`XYMStateMap`
+
+    Attributes
+    ----------
+    state_map: CompactAccounts
+        Mapping view of the accounts holding recorded quantities
+    addresses: list
+        Addresses by account id
+    account_ids: dict
+        Dict mapping addresses to account ids
+    owners: bytearray
+        Flags marking the account ids with recorded quantities; the others
+        only appear as recipients or linked keys
+    balances: EventLog
+        XYM balance changes, by height and account
+    harvests: EventLog
+        Harvested blocks by height, beneficiary and harvester; a block counts
+        as delegated when the harvester is not the beneficiary
+    delegation_requests: EventLog
+        Delegation requests by height, account and recipient
+    key_links: EventLog
+        Key link intervals by account, link type, linked account, start and
+        end height; the end is infinite while the link is open
+
+    """
+
+    LINK_FIELDS = ('vrf_key_link','node_key_link','account_key_link')
+
+    def __init__(self,state_map={},raw_keys=False,rollback_depth=XYMStateMap.MAX_ROLLBACK_BLOCKS):
+        super().__init__(raw_keys=raw_keys,rollback_depth=rollback_depth)
+        self.addresses = []
+        self.account_ids = {}
+        self.owners = bytearray()
+        self.balances = EventLog({'height':'Q','account':'I','amount':'q'})
+        self.harvests = EventLog({'height':'Q','beneficiary':'I','harvester':'I'})
+        self.delegation_requests = EventLog({'height':'Q','account':'I','recipient':'I'})
+        self.key_links = EventLog({'account':'I','link':'B','linked':'I','start':'Q','end':'d'},sort_key='start')
+        self.open_links = {} # (account, link, linked) to the row of the latest interval
+        self.pending_closes = defaultdict(dict) # account to {(link, linked): end} for links opened below a partial map
+        self.state_map = CompactAccounts(self)
+
+        if raw_keys: # serialized maps hold base32 addresses
+            state_map = {decode_address(k):self._convert_account(v,decode_address) for k,v in state_map.items()}
+
+        for address, account in state_map.items():
+            self._insert_account(address,account)
+
+
+    @classmethod
+    def _from_state_file(cls,state_file,raw_keys):
+        return cls(state_map=state_file,raw_keys=raw_keys)
+
+
+    def _account_id(self,address,owner=False):
+        account_id = self.account_ids.get(address)
+        if account_id is None:
+            account_id = self.account_ids[address] = len(self.addresses)
+            self.addresses.append(address)
+            self.owners.append(0)
+        if owner:
+            self.owners[account_id] = 1
+        return account_id
+
+
+    def _account(self,address):
+        """Assemble the account dict of an address from the event logs"""
+        account = {field:{} for field in ACCOUNT_FIELDS}
+        account_id = self.account_ids.get(address)
+        if account_id is None:
+            return account
+        n_ids = len(self.addresses)
+        addresses = self.addresses
+
+        balance = account['xym_balance']
+        heights, amounts = self.balances.select('account',account_id,n_ids,'height','amount')
+        for height, amount in zip(heights.tolist(),amounts.tolist()):
+            balance[height] = balance.get(height,0) + amount
+
+        requests = account['delegation_requests']
+        heights, recipients = self.delegation_requests.select('account',account_id,n_ids,'height','recipient')
+        for height, recipient in zip(heights.tolist(),recipients.tolist()):
+            requests.setdefault(addresses[recipient],[]).append(height)
+
+        heights, harvesters = self.harvests.select('beneficiary',account_id,n_ids,'height','harvester')
+        account['harvested'] = {height:addresses[harvester] for height, harvester in zip(heights.tolist(),harvesters.tolist())}
+        heights, beneficiaries = self.harvests.select('harvester',account_id,n_ids,'height','beneficiary')
+        account['delegated'] = {height:addresses[beneficiary] for height, beneficiary in zip(heights.tolist(),beneficiaries.tolist()) if beneficiary != account_id}
+
+        for (link, linked_id), end in self.pending_closes.get(account_id,{}).items():
+            account[self.LINK_FIELDS[link]][addresses[linked_id]] = [[None,end]]
+        links, linked, starts, ends = self.key_links.select('account',account_id,n_ids,'link','linked','start','end')
+        for link, linked_id, start, end in zip(links.tolist(),linked.tolist(),starts.tolist(),ends.tolist()):
+            account[self.LINK_FIELDS[link]].setdefault(addresses[linked_id],[]).append([start,np.inf if end == np.inf else int(end)])
+
+        return account
+
+
+    def _add_balance(self,address,height,amount):
+        self.balances.append(height,self._account_id(address,owner=True),amount)
+        self._balance_index = None
+
+
+    def _build_harvest_index(self):
+        return HarvestIndex(self.addresses,*(self.harvests.column(c).astype(np.int64) for c in ('height','beneficiary','harvester')))
+
+
+    def _build_balance_index(self):
+        # accounts without recorded quantities have no balance rows, so
+        # dropping them leaves the rows of the others contiguous
+        order, starts = self.balances.group('account',len(self.addresses))
+        account_ids = np.flatnonzero(np.frombuffer(bytes(self.owners),dtype=np.uint8))
+        starts = np.append(starts[account_ids],starts[-1])
+        return BalanceIndex([self.addresses[i] for i in account_ids.tolist()],starts,self.balances.column('height')[order].astype(np.int64),self.balances.column('amount')[order])
+
+
+    def _add_delegation_request(self,address,recipient_address,height):
+        self.delegation_requests.append(height,self._account_id(address,owner=True),self._account_id(recipient_address))
+
+
+    def _add_harvest(self,beneficiary,harvester,height):
+        self.harvests.append(height,self._account_id(beneficiary,owner=True),self._account_id(harvester,owner=harvester != beneficiary))
+        self._harvest_index = None
+        if height > self.max_height:
+            self.max_height = height
+
+
+    def _open_key_link(self,address,link_key,linked_address,height):
+        key = (self._account_id(address,owner=True),self.LINK_FIELDS.index(link_key),self._account_id(linked_address))
+        self.open_links[key] = len(self.key_links)
+        self.key_links.append(*key,height,np.inf)
+
+
+    def _close_key_link(self,address,link_key,linked_address,height):
+        key = (self._account_id(address,owner=True),self.LINK_FIELDS.index(link_key),self._account_id(linked_address))
+        if key in self.open_links:
+            self.key_links.set('end',self.open_links[key],height)
+        else: # opened below the heights of a partial map, see merge
+            self.pending_closes[key[0]][key[1:]] = height
+
+
+    def rollback_to(self,height):
+        """Undo every change recorded above a height, e.g. after a chain rollback
+
+        Rows above `height` are filtered out of the event logs and key links
+        closed above it are reopened. Accounts left empty are dropped.
+
+        Parameters
+        ----------
+        height: int
+            Last height to keep
+
+        """
+        for log in (self.balances,self.harvests,self.delegation_requests):
+            log.keep(log.column('height') <= height)
+        self.key_links.keep(self.key_links.column('start') <= height)
+        for row in np.flatnonzero(self.key_links.column('end') > height).tolist():
+            self.key_links.set('end',row,np.inf)
+
+        accounts, links, linked = (self.key_links.column(c).tolist() for c in ('account','link','linked'))
+        self.open_links = {key:row for row, key in enumerate(zip(accounts,links,linked))}
+        pending_closes = defaultdict(dict)
+        for account_id, closes in self.pending_closes.items():
+            kept = {key:end for key, end in closes.items() if end <= height}
+            if len(kept):
+                pending_closes[account_id] = kept
+        self.pending_closes = pending_closes
+
+        owners = np.zeros(len(self.addresses),dtype=np.uint8)
+        owners[self.balances.column('account')] = 1
+        owners[self.delegation_requests.column('account')] = 1
+        owners[self.key_links.column('account')] = 1
+        owners[list(self.pending_closes)] = 1
+        beneficiaries, harvesters = self.harvests.column('beneficiary'), self.harvests.column('harvester')
+        owners[beneficiaries] = 1
+        owners[harvesters[harvesters != beneficiaries]] = 1
+        self.owners = bytearray(owners.tobytes())
+        self.max_height = min(self.max_height, height)
+        self._balance_index = None
+        self._harvest_index = None
+
 
 if __name__ == "__main__":
     pass
\ No newline at end of file
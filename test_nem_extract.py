@@ -1,9 +1,15 @@
+import msgpack
+import pandas as pd
 import pytest
 import subprocess
 import pathlib
+import pickle
+import shutil
 import shlex
+import struct
 import nem_extract
 import state
+import util
 
 
 @pytest.fixture(scope="session", autouse=True)
@@ -17,6 +23,29 @@ def fetch_text_data_dir():
         )
 
 
+@pytest.fixture(scope="session")
+def blocks():
+    block_paths = nem_extract.get_block_paths("./symbol_test_data/data_main", ".dat")
+    return list(nem_extract.deserialize_blocks(block_paths))
+
+
+@pytest.fixture(scope="session")
+def statements():
+    statement_paths = nem_extract.get_statement_paths(block_dir="./symbol_test_data/data_main")
+    return list(nem_extract.deserialize_statements(statement_paths))
+
+
+def build_state_map(blocks, statements=(), state_map=None):
+    state_map = state.XYMStateMap() if state_map is None else state_map
+    for block in blocks:
+        state_map.insert_block(block)
+    for height, stmts, _ in statements:
+        for stmt in stmts["transaction_statements"]:
+            for rx in stmt["receipts"]:
+                state_map.insert_rx(rx, height)
+    return state_map
+
+
 def test_state_map(tmp_path):
     state_map_path = str(tmp_path / "./state_map.msgpack")
     nem_extract.main(
@@ -30,3 +59,575 @@ def test_state_map(tmp_path):
     )
     state_map = state.XYMStateMap.read_msgpack(state_map_path)
     assert isinstance(state_map, state.XYMStateMap)
+
+
+def test_compiled_formats():
+    formats = [
+        nem_extract.HEADER_FORMAT,
+        nem_extract.TX_H_FORMAT,
+        nem_extract.RECEIPT_FORMAT,
+        *nem_extract.TX_PAYLOAD_FORMATS.values(),
+        *nem_extract.RECEIPT_PAYLOAD_FORMATS.values(),
+    ]
+    for struct_format in formats:
+        # the dict decoder compiled schemas replaced
+        struct_string = "<" + "".join(struct_format.values())
+        data = bytes(i % 251 for i in range(struct.calcsize(struct_string) + 3))
+        expected = dict(zip(struct_format.keys(), struct.unpack(struct_string, data[3:])))
+
+        compiled = nem_extract.CompiledFormat(struct_format)
+        assert compiled.unpack(data[3:]) == expected
+        assert compiled.unpack_from(memoryview(data), 3) == expected
+        assert nem_extract.fmt_unpack(data[3:], struct_format) == expected
+
+
+def test_parallel_blocks():
+    block_paths = nem_extract.get_block_paths("./symbol_test_data/data_main", ".dat")
+    serial = list(nem_extract.deserialize_blocks(block_paths))
+    block_paths = nem_extract.get_block_paths("./symbol_test_data/data_main", ".dat")
+    parallel = list(nem_extract.deserialize_blocks(block_paths, workers=2))
+    assert serial == parallel
+
+
+def test_parallel_statements():
+    statement_paths = nem_extract.get_statement_paths(block_dir="./symbol_test_data/data_main")
+    serial = list(nem_extract.deserialize_statements(statement_paths))
+    parallel = list(nem_extract.deserialize_statements(statement_paths, workers=2))
+    assert serial == parallel
+
+    # file start heights inferred from the store layout match the block headers
+    for path in statement_paths:
+        blk_data = nem_extract.map_store_file(path[: -len(".stmt")] + ".dat")
+        assert nem_extract.statement_file_start_height(path) == nem_extract.block_entry_height(
+            blk_data, nem_extract.DB_OFFSET_BYTES
+        )
+
+
+def test_headers_only(tmp_path):
+    header_paths = []
+    for flags in [[], ["--headers_only"]]:
+        header_path = str(tmp_path / f"header_{len(flags)}.pkl")
+        nem_extract.main(
+            nem_extract.parse_args(
+                [
+                    "--block_dir=./symbol_test_data/data_main",
+                    f"--block_save_path={tmp_path / 'block_data.msgpack'}",
+                    f"--statement_save_path={tmp_path / 'stmt_data.msgpack'}",
+                    f"--state_save_path={tmp_path / 'state_map.msgpack'}",
+                    f"--header_save_path={header_path}",
+                    "--quiet",
+                ]
+                + flags
+            )
+        )
+        header_paths.append(header_path)
+    full, headers_only = (pd.read_pickle(p) for p in header_paths)
+    pd.testing.assert_frame_equal(full, headers_only)
+
+
+def test_raw_keys():
+    block_paths = nem_extract.get_block_paths("./symbol_test_data/data_main", ".dat")
+    encoded = list(nem_extract.deserialize_blocks(block_paths))
+    block_paths = nem_extract.get_block_paths("./symbol_test_data/data_main", ".dat")
+    raw = list(nem_extract.deserialize_blocks(block_paths, raw_keys=True))
+    assert [nem_extract.encode_block(block) for block in raw] == encoded
+
+
+def test_address_caches():
+    block_paths = nem_extract.get_block_paths("./symbol_test_data/data_main", ".dat")
+    header = next(iter(nem_extract.deserialize_blocks(block_paths)))["header"]
+    util.clear_address_caches()
+    for _ in range(3):
+        address = util.public_key_to_address(header["signer_public_key"])
+        util.decode_address(address)
+    info = util.address_cache_info()
+    assert (info["public_key_to_address"].hits, info["public_key_to_address"].misses) == (2, 1)
+    assert (info["decode_address"].hits, info["decode_address"].misses) == (2, 1)
+    assert info["interned_addresses"] == 1
+
+    util.clear_address_caches()
+    info = util.address_cache_info()
+    assert all(info[name].currsize == info[name].hits == 0 for name in ["public_key_to_address", "decode_address"])
+    assert info["interned_addresses"] == 0
+
+
+def test_address_table_size(monkeypatch):
+    monkeypatch.setattr(util, "ADDRESS_TABLE_SIZE", 2)
+    util.clear_address_caches()
+    for address in ["A", "B", "A", "C", "D"]:
+        util.intern_address(address)
+        assert len(util.ADDRESS_TABLE) <= 2
+    assert util.ADDRESS_TABLE == {"C": "C", "D": "D"}
+    util.clear_address_caches()
+
+
+def test_lazy_blocks():
+    block_paths = nem_extract.get_block_paths("./symbol_test_data/data_main", ".dat")
+    eager = list(nem_extract.deserialize_blocks(block_paths))
+    block_paths = nem_extract.get_block_paths("./symbol_test_data/data_main", ".dat")
+    lazy = list(nem_extract.deserialize_blocks(block_paths, lazy=True))
+    assert lazy == eager
+    assert [msgpack.packb(b, use_bin_type=True, default=nem_extract.pack_default) for b in lazy] == [
+        msgpack.packb(b, use_bin_type=True) for b in eager
+    ]
+
+
+def test_tx_types():
+    state_maps, block_stats = [], []
+    for tx_types in [None, frozenset([b"4154", b"414c", b"424c", b"4243"])]:
+        block_paths = nem_extract.get_block_paths("./symbol_test_data/data_main", ".dat")
+        state_map = state.XYMStateMap()
+        stats = []
+        for block in nem_extract.deserialize_blocks(block_paths, tx_types=tx_types):
+            state_map.insert_block(block)
+            stats.append(nem_extract.get_block_stats(block))
+        state_maps.append(state_map.to_dict())
+        block_stats.append(stats)
+    assert state_maps[0] == state_maps[1]
+    assert block_stats[0] == block_stats[1]
+
+
+def test_statement_filters():
+    statement_paths = nem_extract.get_statement_paths(block_dir="./symbol_test_data/data_main")
+    state_maps = []
+    for kwargs in [{}, {"skip_resolutions": True, "receipt_types": frozenset(state.XYMStateMap.RX_HANDLERS)}]:
+        state_map = state.XYMStateMap()
+        for height, stmts, _ in nem_extract.deserialize_statements(statement_paths, **kwargs):
+            for stmt in stmts["transaction_statements"]:
+                for rx in stmt["receipts"]:
+                    state_map.insert_rx(rx, height)
+        state_maps.append(state_map.to_dict())
+    assert stmts["address_resolution_statements"] is None
+    assert state_maps[0] == state_maps[1]
+
+
+def test_balance_change_receipt_signs():
+    # lock created receipts debit the target, the other balance change receipts credit it
+    signs = {0x2143: 1, 0x2248: 1, 0x2348: 1, 0x2252: 1, 0x2352: 1, 0x3148: -1, 0x3152: -1}
+    statement_paths = nem_extract.get_statement_paths(block_dir="./symbol_test_data/data_main")
+    seen = set()
+    for height, stmts, _ in nem_extract.deserialize_statements(statement_paths):
+        for stmt in stmts["transaction_statements"]:
+            for rx in stmt["receipts"]:
+                if rx["type"] not in signs:
+                    continue
+                for state_map in [state.XYMStateMap(), state.CompactXYMStateMap()]:
+                    state_map.insert_rx(rx, height)
+                    target = rx["payload"]["target_address"]
+                    assert state_map[target]["xym_balance"][height] == signs[rx["type"]] * rx["payload"]["amount"]
+                seen.add(rx["type"])
+    assert {0x3148, 0x3152} <= seen
+
+
+def test_height_index(tmp_path):
+    block_paths = nem_extract.get_block_paths("./symbol_test_data/data_main", ".dat")
+    blocks = list(nem_extract.deserialize_blocks(block_paths))
+    nem_extract.build_block_index(block_paths.iterable).to_npz(str(tmp_path / "block_index.npz"))
+    block_index = nem_extract.HeightIndex.read_npz(str(tmp_path / "block_index.npz"))
+    assert nem_extract.read_block(blocks[-1]["header"]["height"], block_index) == blocks[-1]
+    assert list(nem_extract.read_blocks(2, 12, block_index)) == blocks[1:11]
+
+    statement_paths = nem_extract.get_statement_paths(block_dir="./symbol_test_data/data_main")
+    statement_index = nem_extract.build_statement_index(statement_paths)
+    for height, stmts, _ in nem_extract.deserialize_statements(statement_paths):
+        assert nem_extract.read_statements(height, statement_index) == stmts
+
+
+def test_height_index_mapped_files(monkeypatch):
+    monkeypatch.setattr(nem_extract, "INDEX_MAPPED_FILES", 2)
+    block_paths = nem_extract.get_block_paths("./symbol_test_data/data_main", ".dat")
+    block_index = nem_extract.build_block_index(block_paths.iterable)
+    for height in block_index.entries["height"].tolist():
+        nem_extract.read_block(height, block_index)
+        assert len(block_index._maps) <= 2
+    assert list(block_index._maps) == block_index.paths[-2:]
+
+
+def run_extract(block_dir, out_dir, flags):
+    nem_extract.main(
+        nem_extract.parse_args(
+            [
+                f"--block_dir={block_dir}",
+                f"--block_save_path={out_dir / 'block_data.msgpack'}",
+                f"--statement_save_path={out_dir / 'stmt_data.msgpack'}",
+                f"--state_save_path={out_dir / 'state_map.msgpack'}",
+                f"--header_save_path={out_dir / 'block_header_df.pkl'}",
+                f"--checkpoint_path={out_dir / 'checkpoint.msgpack'}",
+                "--quiet",
+            ]
+            + flags
+        )
+    )
+
+
+def assert_same_output(expected_dir, out_dir):
+    for name in ["block_data.msgpack", "stmt_data.msgpack"]:
+        assert (expected_dir / name).read_bytes() == (out_dir / name).read_bytes()
+    pd.testing.assert_frame_equal(
+        pd.read_pickle(expected_dir / "block_header_df.pkl"), pd.read_pickle(out_dir / "block_header_df.pkl")
+    )
+    assert (
+        state.XYMStateMap.read_msgpack(str(expected_dir / "state_map.msgpack")).to_dict()
+        == state.XYMStateMap.read_msgpack(str(out_dir / "state_map.msgpack")).to_dict()
+    )
+
+
+def test_incremental(tmp_path):
+    full_dir, incremental_dir, store = tmp_path / "full", tmp_path / "incremental", tmp_path / "store"
+    full_dir.mkdir()
+    incremental_dir.mkdir()
+    run_extract("./symbol_test_data/data_main", full_dir, [])
+
+    # first run sees a store cut in the middle of its second file
+    shutil.copytree("./symbol_test_data/data_main", store)
+    for path in sorted(store.glob("*/*"))[4:]:
+        path.unlink()
+    for path in store.glob("*/00001.*"):
+        data = path.read_bytes()
+        path.write_bytes(data[: len(data) // 2])
+    run_extract(store, incremental_dir, ["--incremental"])
+
+    shutil.rmtree(store)
+    shutil.copytree("./symbol_test_data/data_main", store)
+    run_extract(store, incremental_dir, ["--incremental"])
+
+    assert_same_output(full_dir, incremental_dir)
+
+    # output cut short behind the checkpoint's back is not resumed
+    stmt_path = incremental_dir / "stmt_data.msgpack"
+    stmt_path.write_bytes(stmt_path.read_bytes()[:100])
+    with pytest.raises(ValueError):
+        run_extract(store, incremental_dir, ["--incremental"])
+    stmt_path.unlink()
+    with pytest.raises(ValueError):
+        run_extract(store, incremental_dir, ["--incremental"])
+
+
+@pytest.mark.parametrize("fail", ["write_checkpoint", "replace_state"])
+def test_incremental_crash_between_writes(tmp_path, monkeypatch, fail):
+    full_dir, incremental_dir, store = tmp_path / "full", tmp_path / "incremental", tmp_path / "store"
+    full_dir.mkdir()
+    incremental_dir.mkdir()
+    run_extract("./symbol_test_data/data_main", full_dir, [])
+
+    shutil.copytree("./symbol_test_data/data_main", store)
+    for path in sorted(store.glob("*/*"))[4:]:
+        path.unlink()
+    run_extract(store, incremental_dir, ["--incremental"])
+
+    # the second run stops either before or after writing its checkpoint,
+    # with the new state map written but not yet moved onto its path
+    shutil.rmtree(store)
+    shutil.copytree("./symbol_test_data/data_main", store)
+    write_checkpoint, replace = nem_extract.write_checkpoint, nem_extract.os.replace
+
+    def failing_write_checkpoint(*args):
+        raise OSError("no space left")
+
+    def failing_replace(src, dst):
+        if dst == str(incremental_dir / "state_map.msgpack"):
+            raise OSError("no space left")
+        replace(src, dst)
+
+    with monkeypatch.context() as m:
+        if fail == "write_checkpoint":
+            m.setattr(nem_extract, "write_checkpoint", failing_write_checkpoint)
+        else:
+            m.setattr(nem_extract.os, "replace", failing_replace)
+        with pytest.raises(OSError):
+            run_extract(store, incremental_dir, ["--incremental"])
+    run_extract(store, incremental_dir, ["--incremental"])
+
+    assert_same_output(full_dir, incremental_dir)
+
+
+@pytest.mark.parametrize("flags", [[], ["--workers=2"]])
+def test_follow(tmp_path, monkeypatch, flags):
+    full_dir, follow_dir, store = tmp_path / "full", tmp_path / "follow", tmp_path / "store"
+    full_dir.mkdir()
+    follow_dir.mkdir()
+    run_extract("./symbol_test_data/data_main", full_dir, [])
+
+    # the store starts with its first file and grows while polls sleep,
+    # once by half a file so that a poll sees an incomplete last entry
+    source_paths = sorted(pathlib.Path("./symbol_test_data/data_main").glob("*/*"))
+    growth = [(path, 0.5) for path in source_paths[2:4]] + [(path, 1) for path in source_paths[2:]]
+    (store / "00000").mkdir(parents=True)
+    for path in source_paths[:2]:
+        shutil.copy(path, store / "00000")
+
+    polling = []
+
+    def grow(seconds):
+        polling.append(seconds)
+        for _ in range(2):
+            if len(growth):
+                path, fraction = growth.pop(0)
+                data = path.read_bytes()
+                (store / "00000" / path.name).write_bytes(data[: int(len(data) * fraction)])
+
+    ordered_pool_map = nem_extract.ordered_pool_map
+
+    def pool_map(*args, **kwargs):
+        # only the initial extraction may decode through a process pool
+        assert not polling
+        return ordered_pool_map(*args, **kwargs)
+
+    monkeypatch.setattr(nem_extract.time, "sleep", grow)
+    monkeypatch.setattr(nem_extract, "ordered_pool_map", pool_map)
+    n_polls = len(growth) // 2 + 1
+    run_extract(
+        store, follow_dir, ["--follow", f"--max_polls={n_polls}", "--poll_interval=0", "--save_interval=0"] + flags
+    )
+
+    assert not len(growth)
+    assert_same_output(full_dir, follow_dir)
+
+
+def test_follow_interrupted_poll(tmp_path, monkeypatch):
+    full_dir, follow_dir, store = tmp_path / "full", tmp_path / "follow", tmp_path / "store"
+    full_dir.mkdir()
+    follow_dir.mkdir()
+    run_extract("./symbol_test_data/data_main", full_dir, [])
+
+    source_paths = sorted(pathlib.Path("./symbol_test_data/data_main").glob("*/*"))
+    (store / "00000").mkdir(parents=True)
+    for path in source_paths[:2]:
+        shutil.copy(path, store / "00000")
+
+    def grow(seconds):
+        for path in source_paths[2:]:
+            shutil.copy(path, store / "00000")
+
+    # the first poll is interrupted after its blocks reached the state map
+    # and the block stream, but before its statements were decoded
+    extract_statements = nem_extract.extract_statements
+    calls = []
+
+    def interrupted_extract_statements(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 2:
+            raise KeyboardInterrupt
+        return extract_statements(*args, **kwargs)
+
+    monkeypatch.setattr(nem_extract.time, "sleep", grow)
+    monkeypatch.setattr(nem_extract, "extract_statements", interrupted_extract_statements)
+    run_extract(store, follow_dir, ["--follow", "--max_polls=3", "--poll_interval=0", "--save_interval=0"])
+    assert len(calls) == 2
+
+    monkeypatch.setattr(nem_extract, "extract_statements", extract_statements)
+    run_extract(store, follow_dir, ["--incremental"])
+    assert_same_output(full_dir, follow_dir)
+
+
+def test_rollback(blocks):
+    state_map = build_state_map(blocks)
+    state_map.rollback_to(len(blocks) - 20)
+    assert state_map.to_dict() == build_state_map(blocks[: len(blocks) - 20]).to_dict()
+
+
+def test_chained_rollback(blocks):
+    state_map = build_state_map(blocks, state_map=state.XYMStateMap(rollback_depth=10))
+    floor = state_map.journal_floor
+    assert floor >= len(blocks) - 20
+
+    # roll back, insert replacement blocks, then roll back deeper
+    state_map.rollback_to(len(blocks) - 3)
+    assert state_map.to_dict() == build_state_map(blocks[: len(blocks) - 3]).to_dict()
+    for block in blocks[len(blocks) - 3 : len(blocks) - 1]:
+        state_map.insert_block(block)
+    state_map.rollback_to(floor)
+    assert state_map.to_dict() == build_state_map(blocks[:floor]).to_dict()
+    with pytest.raises(ValueError):
+        state_map.rollback_to(floor - 1)
+
+    # rolling back above the tip changes nothing, including the tip
+    for state_map in [state.XYMStateMap(), state.CompactXYMStateMap()]:
+        state_map = build_state_map(blocks, state_map=state_map)
+        max_height = state_map.max_height
+        state_map.rollback_to(max_height + 100)
+        assert state_map.max_height == max_height
+
+
+def test_compact_state_map(blocks):
+    state_map = build_state_map(blocks)
+    compact_state_map = build_state_map(blocks, state_map=state.CompactXYMStateMap())
+
+    assert compact_state_map.to_dict() == state_map.to_dict()
+    assert pickle.loads(pickle.dumps(compact_state_map)).to_dict() == state_map.to_dict()
+    assert state.CompactXYMStateMap(state_map.to_dict()).to_dict() == state_map.to_dict()
+
+
+def test_balance_index(blocks):
+    for state_map in [build_state_map(blocks), build_state_map(blocks, state_map=state.CompactXYMStateMap())]:
+        for height in [1, len(blocks) // 2, len(blocks)]:
+            expected = {
+                address: sum(amount for h, amount in account["xym_balance"].items() if h <= height)
+                for address, account in state_map.to_dict().items()
+            }
+            assert state_map.balances_at(height) == expected
+            for address in list(expected)[:5]:
+                assert state_map.balance(address, height) == expected[address]
+
+
+def test_harvester_graph_window(blocks):
+    state_map = build_state_map(blocks)
+
+    min_height, max_height = 50, 250
+    graph = state_map.get_harvester_graph(min_height, max_height)
+    for address, account in state_map.to_dict().items():
+        harvested = [h for h in account["harvested"] if min_height <= h <= max_height]
+        delegated = [h for h in account["delegated"] if min_height <= h <= max_height]
+        if harvested:
+            assert graph.nodes[address]["size"] == len(harvested)
+        elif delegated:
+            assert graph.nodes[address]["size"] == len(delegated)
+        else:
+            assert address not in graph
+    for node, delegate, weight in graph.edges(data="weight"):
+        assert weight == sum(
+            1
+            for b in blocks[min_height - 1 : max_height]
+            if (b["header"]["beneficiary_address"], b["header"]["harvester"]) == (node, delegate)
+        )
+    bubbles = state_map.get_harvester_bubbles(min_height, max_height)
+    assert set(bubbles.nodes) == set(graph.nodes)
+
+
+def test_harvester_windows(blocks):
+    state_map = build_state_map(blocks)
+
+    graphs = state_map.iter_harvester_windows(50, step=7, graphs=True)
+    for summary, graph in zip(state_map.iter_harvester_windows(50, step=7), graphs):
+        expected = state_map.get_harvester_graph(summary["min_height"], summary["max_height"])
+        assert sorted(graph.nodes(data=True)) == sorted(expected.nodes(data=True))
+        assert sorted(graph.edges(data=True)) == sorted(expected.edges(data=True))
+        assert summary["nodes"] == sum(1 for _, kind in graph.nodes(data="color") if kind == state_map.node_color)
+
+
+def test_indexed_state_file(tmp_path, blocks):
+    state_map = build_state_map(blocks)
+    state_map.to_msgpack(str(tmp_path / "state.msgpack"), indexed=True)
+
+    loaded = state.XYMStateMap.read_msgpack(str(tmp_path / "state.msgpack"))
+    assert set(loaded.keys()) == set(state_map.keys())
+    assert not loaded.state_map.loaded
+    address = next(iter(state_map.keys()))
+    assert loaded[address] == state_map[address]
+    assert list(loaded.state_map.loaded) == [address]
+    assert loaded.to_dict() == state_map.to_dict()
+
+    # saving, snapshots and indexes read the other accounts without keeping them
+    for raw_keys in [False, True]:
+        loaded = state.XYMStateMap.read_msgpack(str(tmp_path / "state.msgpack"), raw_keys=raw_keys)
+        if not raw_keys:  # the blocks hold encoded addresses
+            loaded.insert_block(blocks[-1])
+        touched = set(loaded.state_map.loaded)
+        loaded.to_msgpack(str(tmp_path / "resaved.msgpack"), indexed=True)
+        loaded.to_msgpack(str(tmp_path / "resaved_chunked.msgpack"), chunk_size=7)
+        loaded.write_snapshot(str(tmp_path / "snapshot.msgpack"), len(blocks) // 2)
+        loaded.balance_index, loaded.harvest_index
+        assert set(loaded.state_map.loaded) == touched < set(loaded.keys())
+        for name in ["resaved.msgpack", "resaved_chunked.msgpack"]:
+            assert state.XYMStateMap.read_msgpack(str(tmp_path / name)).to_dict() == loaded.to_dict()
+        if not raw_keys:
+            assert loaded.to_dict() == build_state_map(blocks + blocks[-1:]).to_dict()
+
+
+def test_indexed_incremental(tmp_path):
+    full_dir, incremental_dir, store = tmp_path / "full", tmp_path / "incremental", tmp_path / "store"
+    full_dir.mkdir()
+    incremental_dir.mkdir()
+    run_extract("./symbol_test_data/data_main", full_dir, [])
+
+    # the second run only adds a few blocks, so most accounts are still
+    # unloaded, i.e. read from the state file it replaces, when it saves
+    shutil.copytree("./symbol_test_data/data_main", store)
+    for path in sorted(store.glob("*/*"))[-2:]:
+        data = path.read_bytes()
+        path.write_bytes(data[: len(data) * 19 // 20])
+    run_extract(store, incremental_dir, ["--incremental", "--indexed_state"])
+    shutil.rmtree(store)
+    shutil.copytree("./symbol_test_data/data_main", store)
+    run_extract(store, incremental_dir, ["--incremental", "--indexed_state"])
+
+    assert state.StateFile.is_state_file(str(incremental_dir / "state_map.msgpack"))
+    assert_same_output(full_dir, incremental_dir)
+
+
+def test_chunked_state_file(tmp_path, blocks):
+    state_map = build_state_map(blocks)
+    state_map.to_msgpack(str(tmp_path / "state.msgpack"))
+    state_map.to_msgpack(str(tmp_path / "chunked.msgpack"), chunk_size=7)
+
+    assert (tmp_path / "state.msgpack").read_bytes() == msgpack.packb(state_map.to_dict())
+    with open(tmp_path / "chunked.msgpack", "rb") as f:
+        chunks = msgpack.unpack(f, raw=False)
+    assert all(len(chunk) <= 7 for chunk in chunks)
+    assert state.XYMStateMap.read_msgpack(str(tmp_path / "chunked.msgpack")).to_dict() == state_map.to_dict()
+    for i, chunk in enumerate(chunks):
+        assert state.XYMStateMap.read_msgpack(str(tmp_path / "chunked.msgpack"), chunk=i).to_dict() == chunk
+    with pytest.raises(IndexError):
+        state.XYMStateMap.read_msgpack(str(tmp_path / "chunked.msgpack"), chunk=len(chunks))
+    with pytest.raises(ValueError):
+        state_map.to_msgpack(str(tmp_path / "chunked.msgpack"), chunk_size=0)
+    with pytest.raises(SystemExit):
+        nem_extract.parse_args(["--state_chunk_size=0"])
+
+
+def test_snapshots(tmp_path, blocks, statements):
+    block_paths = nem_extract.get_block_paths("./symbol_test_data/data_main", ".dat")
+    statement_paths = nem_extract.get_statement_paths(block_dir="./symbol_test_data/data_main")
+
+    def build(max_height):
+        return build_state_map(blocks[:max_height], statements[:max_height])
+
+    heights = nem_extract.write_snapshots(build(len(blocks)), str(tmp_path), 100, 0, len(blocks))
+    assert heights == list(range(100, len(blocks) + 1, 100))
+    assert nem_extract.find_snapshot(str(tmp_path), 250) == (200, nem_extract.snapshot_path(str(tmp_path), 200))
+
+    block_index = nem_extract.build_block_index(block_paths.iterable)
+    statement_index = nem_extract.build_statement_index(statement_paths)
+    for height in [50, 200, 250]:
+        state_map = nem_extract.load_state_at(height, str(tmp_path), block_index, statement_index)
+        assert state_map.to_dict() == build(height).to_dict()
+
+
+def test_merge_partial_state_maps(blocks, statements):
+    def build(start, stop):
+        return build_state_map(blocks[start:stop], statements[start:stop])
+
+    expected = build(0, len(blocks)).to_dict()
+    cuts = [0, 37, 150, 151, 260, len(blocks)]
+    left = build(0, cuts[1])
+    for start, stop in zip(cuts[1:], cuts[2:]):
+        left.merge(build(start, stop))
+    assert left.to_dict() == expected
+    right = build(cuts[-2], cuts[-1])
+    for start, stop in reversed(list(zip(cuts[:-2], cuts[1:-1]))):
+        right = build(start, stop).merge(right)
+    assert right.to_dict() == expected
+
+    block_paths = nem_extract.get_block_paths("./symbol_test_data/data_main", ".dat")
+    statement_paths = nem_extract.get_statement_paths(block_dir="./symbol_test_data/data_main")
+    assert nem_extract.build_state(block_paths, statement_paths, workers=2).to_dict() == expected
+
+
+def test_parallel_state(tmp_path):
+    full_dir, parallel_dir, incremental_dir, store = (tmp_path / name for name in ["full", "parallel", "incremental", "store"])
+    for out_dir in [full_dir, parallel_dir, incremental_dir]:
+        out_dir.mkdir()
+    run_extract("./symbol_test_data/data_main", full_dir, [])
+    run_extract("./symbol_test_data/data_main", parallel_dir, ["--workers=2", "--parallel_state"])
+    assert_same_output(full_dir, parallel_dir)
+    assert (full_dir / "state_map.msgpack").read_bytes() == (parallel_dir / "state_map.msgpack").read_bytes()
+
+    # partial maps merged into a map resumed from a checkpoint
+    shutil.copytree("./symbol_test_data/data_main", store)
+    for path in sorted(store.glob("*/*"))[4:]:
+        path.unlink()
+    run_extract(store, incremental_dir, ["--incremental", "--workers=2", "--parallel_state"])
+    shutil.rmtree(store)
+    shutil.copytree("./symbol_test_data/data_main", store)
+    run_extract(store, incremental_dir, ["--incremental", "--workers=2", "--parallel_state"])
+    assert_same_output(full_dir, incremental_dir)
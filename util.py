@@ -1,10 +1,62 @@
 import base64
+import functools
 import hashlib
+import numpy as np
+
+# upper bound on the number of entries kept by each address cache
+ADDRESS_CACHE_SIZE = 2**16
+
+# upper bound on the number of addresses held by the interning table
+ADDRESS_TABLE_SIZE = 2**20
+
+# canonical instances of the address strings produced since the table was last emptied
+ADDRESS_TABLE = {}
+
+
+def intern_address(address):
+    """Return the canonical instance of an address string
+
+    Repeated addresses then share a single string object wherever they are
+    stored, e.g. as harvester values across the state map. The table is
+    emptied once it holds ADDRESS_TABLE_SIZE addresses, so it stays bounded
+    in long-running processes at the cost of some duplicate strings.
+    """
+    if len(ADDRESS_TABLE) >= ADDRESS_TABLE_SIZE and address not in ADDRESS_TABLE:
+        ADDRESS_TABLE.clear()
+    return ADDRESS_TABLE.setdefault(address,address)
 
 
 def encode_address(address):
     """Encode address bytes into base32 with appropriate offset and pad"""
-    return base64.b32encode(address + bytes(0)).decode('utf8')[0:-1]
+    return _encode_address(bytes(address))
+
+
+@functools.lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def _encode_address(address):
+    return intern_address(base64.b32encode(address + bytes(0)).decode('utf8')[0:-1])
+
+
+def decode_address(address):
+    """Decode a base32 address string back into its 24 address bytes"""
+    return _decode_address(address)
+
+
+@functools.lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def _decode_address(address):
+    return base64.b32decode(address + '=')
+
+
+def encode_address_rows(addresses):
+    """Encode every row of a 2d uint8 array of address bytes with a single base32 pass
+
+    Each 24 byte address is padded with a zero byte to 25 bytes (a whole number
+    of base32 groups), so the first 39 characters of each 40 character group are
+    exactly :func:`encode_address` of that row.
+    """
+    padded = np.zeros((len(addresses),25),dtype=np.uint8)
+    padded[:,:24] = addresses
+    encoded = np.frombuffer(base64.b32encode(padded.tobytes()),dtype='S1').reshape(-1,40)[:,:39]
+    return [intern_address(a) for a in np.ascontiguousarray(encoded).view('S39').ravel().astype(str).tolist()]
 
 
 def public_key_to_address(public_key,network=104):
@@ -19,9 +71,44 @@ def public_key_to_address(public_key,network=104):
 
     Returns
     -------
-    address: bytes
+    address: str
         Address associated with input public_key
+
+    Notes
+    -----
+    Results are memoized in a bounded LRU cache since a small set of keys
+    (harvesters, frequent signers) accounts for most calls; see
+    :func:`address_cache_info`.
+    """
+    return _public_key_to_address(bytes(public_key),network)
+
+
+@functools.lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def _public_key_to_address(public_key,network):
+    return encode_address(_public_key_to_raw_address(public_key,network))
+
+
+def public_key_to_raw_address(public_key,network=104):
+    """Convert a public key to the 24 raw address bytes
+    
+    Parameters
+    ----------
+    public_key : bytes
+        Byte array containing public key
+    network: int, default=104
+        Network identifier
+
+    Returns
+    -------
+    address: bytes
+        Unencoded address associated with input public_key, such that
+        ``encode_address(public_key_to_raw_address(k)) == public_key_to_address(k)``
     """
+    return _public_key_to_raw_address(bytes(public_key),network)
+
+
+@functools.lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def _public_key_to_raw_address(public_key,network):
     part_one_hash_builder = hashlib.sha3_256()
     part_one_hash_builder.update(public_key)
     part_one_hash = part_one_hash_builder.digest()
@@ -36,6 +123,27 @@ def public_key_to_address(public_key,network=104):
     part_three_hash_builder.update(base)
     checksum = part_three_hash_builder.digest()[0:3]
     
-    address = base + checksum
-    
-    return encode_address(address)
+    return base + checksum
+
+
+def address_cache_info():
+    """Report hit/miss statistics of the address caches and the size of the interning table"""
+    return {
+        'public_key_to_address': _public_key_to_address.cache_info(),
+        'public_key_to_raw_address': _public_key_to_raw_address.cache_info(),
+        'encode_address': _encode_address.cache_info(),
+        'decode_address': _decode_address.cache_info(),
+        'interned_addresses': len(ADDRESS_TABLE)}
+
+
+def clear_address_caches():
+    """Empty the address caches and the interning table
+
+    Interned addresses already stored elsewhere, e.g. in a state map, are
+    unaffected; only their sharing with addresses produced afterwards is lost.
+    """
+    _public_key_to_address.cache_clear()
+    _public_key_to_raw_address.cache_clear()
+    _encode_address.cache_clear()
+    _decode_address.cache_clear()
+    ADDRESS_TABLE.clear()